@@ -156,7 +156,9 @@ def chat_message_stream(request, session_id):
                         code_chunks = rag_pipeline._retrieve_code_context(
                             query_embedding=query_embedding,
                             user_id=request.user.id,
-                            top_k=3  # Less chunks for image context
+                            question=question,
+                            top_k=3,  # Less chunks for image context
+                            use_reranking=False
                         )
                         code_context = "\n\n".join([c['source']['content'][:500] for c in code_chunks[:3]])
                     except:
@@ -196,13 +198,16 @@ def chat_message_stream(request, session_id):
                             code_chunks = rag_pipeline._retrieve_code_context(
                                 query_embedding=query_embedding,
                                 user_id=request.user.id,
-                                top_k=intent['top_k']
+                                question=question,
+                                top_k=intent['top_k'],
+                                use_reranking=False
                             )
 
                         past_summaries = rag_pipeline._retrieve_past_summaries(
                             query_embedding=query_embedding,
                             user_id=request.user.id,
-                            top_k=3
+                            top_k=3,
+                            question=question
                         )
 
                         print(f"✅ Retrieved {len(code_chunks)} code chunks, {len(past_summaries)} summaries")
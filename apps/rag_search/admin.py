@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import EmbeddingCacheEntry
 
-# Register your models here.
+
+@admin.register(EmbeddingCacheEntry)
+class EmbeddingCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['key', 'model_name', 'task_type', 'dims', 'created_at', 'last_used_at']
+    list_filter = ['model_name', 'task_type']
+    readonly_fields = ['key', 'vector', 'created_at']
@@ -0,0 +1,286 @@
+"""
+Persistent, content-addressed embedding cache
+
+Vectors are stored in the database as packed float32 blobs keyed by
+sha256(model_name, task_type, text), so byte-identical text is only ever
+embedded once per model and task type.
+
+Query embeddings additionally go through QueryEmbeddingCache: an in-process
+LRU + TTL cache (optionally backed by the shared Django cache) keyed by
+normalized query text, so repeated questions and suggested-prompt clicks
+skip the database and the API entirely.
+"""
+from .models import EmbeddingCacheEntry
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from cachetools import TTLCache
+from array import array
+from datetime import timedelta
+from typing import List, Dict, Optional
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+
+
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+EMBEDDING_CACHE_MAX_MB = int(os.getenv('EMBEDDING_CACHE_MAX_MB', '1024'))
+
+# Only bump last_used_at when it is older than this (avoids a write per hit)
+TOUCH_INTERVAL = timedelta(hours=1)
+
+# Check the size limit every N inserted entries
+EVICTION_CHECK_EVERY = 1000
+
+ROW_OVERHEAD_BYTES = 200  # Key, metadata and index entries per row (approx.)
+
+# Query embedding cache: in-process L1, shared L2 ('auto' = when the Django
+# cache is shared between processes, e.g. Redis)
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '2048'))
+QUERY_CACHE_TTL = int(os.getenv('QUERY_EMBEDDING_CACHE_TTL', '3600'))  # seconds
+QUERY_CACHE_SHARED = os.getenv('QUERY_EMBEDDING_CACHE_SHARED', 'auto').lower()
+
+_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class EmbeddingCache:
+    """Database-backed embedding cache with LRU eviction and hit/miss counters"""
+
+    # Counters are shared by every instance in the process
+    _lock = threading.Lock()
+    _hits = 0
+    _misses = 0
+    _inserts_since_check = 0
+
+    def __init__(self, enabled: bool = EMBEDDING_CACHE_ENABLED, max_mb: int = EMBEDDING_CACHE_MAX_MB):
+        self.enabled = enabled
+        self.max_bytes = max_mb * 1024 * 1024
+
+    @staticmethod
+    def make_key(model_name: str, task_type: str, text: str) -> str:
+        """Content hash of (model_name, task_type, text)"""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(task_type.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8', errors='ignore'))
+        return digest.hexdigest()
+
+    def get_many(self, model_name: str, task_type: str, texts: List[str]) -> Dict[int, List[float]]:
+        """
+        Look up cached vectors
+
+        Returns:
+            {index in texts: embedding} for every hit
+        """
+        if not self.enabled or not texts:
+            return {}
+
+        keys = [self.make_key(model_name, task_type, text) for text in texts]
+
+        try:
+            rows = dict(
+                EmbeddingCacheEntry.objects
+                .filter(key__in=set(keys))
+                .values_list('key', 'vector')
+            )
+
+            if rows:
+                EmbeddingCacheEntry.objects.filter(
+                    key__in=list(rows),
+                    last_used_at__lt=timezone.now() - TOUCH_INTERVAL
+                ).update(last_used_at=timezone.now())
+        except Exception as e:
+            print(f"⚠️ Embedding cache lookup failed: {e}")
+            rows = {}
+
+        found = {
+            index: self._unpack(rows[key])
+            for index, key in enumerate(keys)
+            if key in rows
+        }
+
+        with EmbeddingCache._lock:
+            EmbeddingCache._hits += len(found)
+            EmbeddingCache._misses += len(texts) - len(found)
+
+        return found
+
+    def set_many(self, model_name: str, task_type: str, texts: List[str], vectors: List[List[float]]):
+        """Store freshly computed vectors"""
+        if not self.enabled or not texts:
+            return
+
+        entries = {}
+        for text, vector in zip(texts, vectors):
+            key = self.make_key(model_name, task_type, text)
+            entries[key] = EmbeddingCacheEntry(
+                key=key,
+                model_name=model_name,
+                task_type=task_type,
+                dims=len(vector),
+                vector=self._pack(vector)
+            )
+
+        try:
+            EmbeddingCacheEntry.objects.bulk_create(
+                list(entries.values()),
+                batch_size=500,
+                ignore_conflicts=True
+            )
+        except Exception as e:
+            print(f"⚠️ Embedding cache write failed: {e}")
+            return
+
+        with EmbeddingCache._lock:
+            EmbeddingCache._inserts_since_check += len(entries)
+            check = EmbeddingCache._inserts_since_check >= EVICTION_CHECK_EVERY
+            if check:
+                EmbeddingCache._inserts_since_check = 0
+
+        if check:
+            self.evict(dims=len(vectors[0]))
+
+    def evict(self, dims: int = 768) -> int:
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        max_entries = self.max_bytes // (dims * 4 + ROW_OVERHEAD_BYTES)
+
+        try:
+            excess = EmbeddingCacheEntry.objects.count() - max_entries
+            if excess <= 0:
+                return 0
+
+            stale_keys = list(
+                EmbeddingCacheEntry.objects
+                .order_by('last_used_at')
+                .values_list('key', flat=True)[:excess]
+            )
+
+            for i in range(0, len(stale_keys), 500):
+                EmbeddingCacheEntry.objects.filter(key__in=stale_keys[i:i + 500]).delete()
+
+            print(f"🧹 Evicted {len(stale_keys)} embedding cache entries")
+            return len(stale_keys)
+        except Exception as e:
+            print(f"⚠️ Embedding cache eviction failed: {e}")
+            return 0
+
+    @classmethod
+    def get_stats(cls) -> Dict:
+        """Hit/miss counters for this process"""
+        with cls._lock:
+            lookups = cls._hits + cls._misses
+            return {
+                'hits': cls._hits,
+                'misses': cls._misses,
+                'hit_rate': (cls._hits / lookups) if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _pack(vector: List[float]) -> bytes:
+        return array('f', vector).tobytes()
+
+    @staticmethod
+    def _unpack(blob) -> List[float]:
+        vector = array('f')
+        vector.frombytes(bytes(blob))
+        return vector.tolist()
+
+
+class QueryEmbeddingCache:
+    """
+    Two-level cache for query embeddings
+
+    L1 is a bounded in-process TTLCache (least recently used entries go first
+    when full); L2 is the shared Django cache. Keys are (model, normalized
+    query text), so case and whitespace differences still hit.
+    """
+
+    # One L1 and one set of counters per process
+    _lock = threading.Lock()
+    _local = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+    _hits = 0
+    _shared_hits = 0
+    _misses = 0
+
+    def __init__(self, shared: Optional[bool] = None):
+        if shared is None:
+            if QUERY_CACHE_SHARED == 'auto':
+                shared = settings.CACHES['default']['BACKEND'] not in _LOCAL_CACHE_BACKENDS
+            else:
+                shared = QUERY_CACHE_SHARED == 'true'
+        self.shared = shared
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Unicode-normalize, case-fold and collapse whitespace"""
+        return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', query)).strip().casefold()
+
+    @staticmethod
+    def make_key(model_name: str, query: str) -> str:
+        digest = hashlib.sha256(f"{model_name}\0{QueryEmbeddingCache.normalize(query)}".encode('utf-8'))
+        return f"query_embedding:{digest.hexdigest()}"
+
+    def get(self, model_name: str, query: str) -> Optional[List[float]]:
+        """Cached embedding for query, or None"""
+        key = self.make_key(model_name, query)
+
+        with QueryEmbeddingCache._lock:
+            packed = QueryEmbeddingCache._local.get(key)
+            if packed is not None:
+                QueryEmbeddingCache._hits += 1
+                return packed.tolist()
+
+        if self.shared:
+            try:
+                blob = cache.get(key)
+            except Exception as e:
+                print(f"⚠️ Shared query cache lookup failed: {e}")
+                blob = None
+
+            if blob is not None:
+                packed = array('f')
+                packed.frombytes(blob)
+                with QueryEmbeddingCache._lock:
+                    QueryEmbeddingCache._local[key] = packed
+                    QueryEmbeddingCache._shared_hits += 1
+                return packed.tolist()
+
+        with QueryEmbeddingCache._lock:
+            QueryEmbeddingCache._misses += 1
+        return None
+
+    def set(self, model_name: str, query: str, vector: List[float]):
+        """Store a query embedding in both levels"""
+        key = self.make_key(model_name, query)
+        packed = array('f', vector)  # ~4x smaller than a list of floats
+
+        with QueryEmbeddingCache._lock:
+            QueryEmbeddingCache._local[key] = packed
+
+        if self.shared:
+            try:
+                cache.set(key, packed.tobytes(), QUERY_CACHE_TTL)
+            except Exception as e:
+                print(f"⚠️ Shared query cache write failed: {e}")
+
+    @classmethod
+    def get_stats(cls) -> Dict:
+        """Hit/miss counters for this process (hits include shared-cache hits)"""
+        with cls._lock:
+            hits = cls._hits + cls._shared_hits
+            lookups = hits + cls._misses
+            return {
+                'hits': hits,
+                'local_hits': cls._hits,
+                'shared_hits': cls._shared_hits,
+                'misses': cls._misses,
+                'hit_rate': (hits / lookups) if lookups else 0.0,
+                'size': len(cls._local),
+            }
@@ -2,6 +2,7 @@ import google.generativeai as genai
 import os
 from typing import List
 import time
+from .embedding_cache import EmbeddingCache, QueryEmbeddingCache
 
 # Initialize Gemini
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
@@ -20,6 +21,8 @@ class EmbeddingService:
         """
         self.model_name = model_name
         self.embedding_dim = 768  # text-embedding-004 outputs 768 dimensions
+        self.cache = EmbeddingCache()
+        self.query_cache = QueryEmbeddingCache()
     
     def embed_text(self, text: str, task_type: str = "RETRIEVAL_DOCUMENT") -> List[float]:
         """
@@ -36,17 +39,70 @@ class EmbeddingService:
             List of floats (768 dimensions)
         """
         try:
-            result = genai.embed_content(
-                model=f"models/{self.model_name}",
-                content=text,
-                task_type=task_type
-            )
-            return result['embedding']
+            return self.embed_texts([text], task_type=task_type)[0]
         except Exception as e:
             print(f"❌ Embedding error: {str(e)}")
             # Return zero vector as fallback
             return [0.0] * self.embedding_dim
     
+    def embed_texts(
+        self,
+        texts: List[str],
+        task_type: str = "RETRIEVAL_DOCUMENT",
+        use_cache: bool = True
+    ) -> List[List[float]]:
+        """
+        Embed several texts in ONE API request
+        
+        Unlike embed_text/embed_batch this does not swallow errors, so callers
+        can split and retry a failed request themselves. Texts found in the
+        embedding cache are not sent to the API.
+        
+        Args:
+            texts: Texts to embed (at most 100 per request)
+            task_type: Task type for embedding
+            use_cache: Read and write the embedding cache. Pass False from
+                worker threads, so they never open DB connections; the caller
+                then uses self.cache from its own thread.
+        
+        Returns:
+            One embedding per text, in order
+        """
+        if not use_cache:
+            return self._request_embeddings(texts, task_type)
+        
+        cached = self.cache.get_many(self.model_name, task_type, texts)
+        if len(cached) == len(texts):
+            return [cached[i] for i in range(len(texts))]
+        
+        missing = [i for i in range(len(texts)) if i not in cached]
+        missing_texts = [texts[i] for i in missing]
+        fresh = self._request_embeddings(missing_texts, task_type)
+        self.cache.set_many(self.model_name, task_type, missing_texts, fresh)
+        
+        embeddings = [cached.get(i) for i in range(len(texts))]
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+        
+        return embeddings
+    
+    def _request_embeddings(self, texts: List[str], task_type: str) -> List[List[float]]:
+        """Single embed_content API call for texts (raises on error)"""
+        result = genai.embed_content(
+            model=f"models/{self.model_name}",
+            content=texts if len(texts) > 1 else texts[0],
+            task_type=task_type
+        )
+        
+        embeddings = result['embedding']
+        if embeddings and not isinstance(embeddings[0], list):
+            embeddings = [embeddings]
+        
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        
+        return embeddings
+    
     def embed_batch(
         self, 
         texts: List[str], 
@@ -73,17 +129,7 @@ class EmbeddingService:
             
             try:
                 # Gemini API supports batch embedding
-                result = genai.embed_content(
-                    model=f"models/{self.model_name}",
-                    content=batch,
-                    task_type=task_type
-                )
-                
-                # Extract embeddings from batch result
-                if isinstance(result['embedding'][0], list):
-                    embeddings.extend(result['embedding'])
-                else:
-                    embeddings.append(result['embedding'])
+                embeddings.extend(self.embed_texts(batch, task_type=task_type))
                 
                 # Rate limiting: Free tier = 1500 requests/day
                 time.sleep(delay)
@@ -115,11 +161,24 @@ class EmbeddingService:
         """
         Generate embedding for a search query
         
+        Repeated queries (after normalization) are served from the query
+        embedding cache without touching the database or the API.
+        
         Args:
             query: Search query text
         
         Returns:
             Embedding vector
         """
-        return self.embed_text(query, task_type="RETRIEVAL_QUERY")
+        embedding = self.query_cache.get(self.model_name, query)
+        if embedding is not None:
+            return embedding
+        
+        embedding = self.embed_text(query, task_type="RETRIEVAL_QUERY")
+        
+        # Never cache the zero-vector error fallback
+        if any(embedding):
+            self.query_cache.set(self.model_name, query, embedding)
+        
+        return embedding
  
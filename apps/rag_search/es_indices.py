@@ -1,15 +1,35 @@
 # Index mappings for Elasticsearch
+import os
 
 REPO_CHUNKS_INDEX = "jarvis_repo_chunks"
 CHAT_MEMORY_INDEX = "jarvis_chat_memory"
 EXTERNAL_SOURCES_INDEX = "jarvis_external_sources"
 
-def get_repo_chunks_mapping(embedding_dim=768):
+# Quantized HNSW for code chunk vectors: '' (Elasticsearch default), 'none',
+# 'int8', 'int4' or 'binary' (BBQ). Changing it requires recreating the index.
+ES_VECTOR_QUANTIZATION = os.getenv('ES_VECTOR_QUANTIZATION', '')
+VECTOR_INDEX_TYPES = {
+    "none": "hnsw",
+    "int8": "int8_hnsw",
+    "int4": "int4_hnsw",
+    "binary": "bbq_hnsw",
+}
+
+
+def get_vector_index_options(quantization=None):
+    """dense_vector index_options for a quantization mode (None = ES default)"""
+    quantization = ES_VECTOR_QUANTIZATION if quantization is None else quantization
+    if quantization not in VECTOR_INDEX_TYPES:
+        return None
+    return {"type": VECTOR_INDEX_TYPES[quantization]}
+
+
+def get_repo_chunks_mapping(embedding_dim=768, quantization=None):
     """
     Mapping for code repository chunks
     Stores: code chunks, embeddings, metadata
     """
-    return {
+    mapping = {
         "settings": {
             "number_of_shards": 1,
             "number_of_replicas": 0,  # No replicas for development
@@ -31,6 +51,7 @@ def get_repo_chunks_mapping(embedding_dim=768):
                 "repo_name": {"type": "text"},
                 "file_path": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
                 "chunk_id": {"type": "integer"},
+                "content_hash": {"type": "keyword"},  # sha256 of chunk code
                 "content": {
                     "type": "text",
                     "analyzer": "code_analyzer",
@@ -52,6 +73,12 @@ def get_repo_chunks_mapping(embedding_dim=768):
             }
         }
     }
+    
+    index_options = get_vector_index_options(quantization)
+    if index_options:
+        mapping["mappings"]["properties"]["embedding"]["index_options"] = index_options
+    
+    return mapping
 
 def get_chat_memory_mapping(embedding_dim=768):
     """
@@ -3,12 +3,36 @@ from .es_indices import (
     REPO_CHUNKS_INDEX,
     CHAT_MEMORY_INDEX,
     EXTERNAL_SOURCES_INDEX,
+    ES_VECTOR_QUANTIZATION,
     get_repo_chunks_mapping,
     get_chat_memory_mapping,
     get_external_sources_mapping
 )
 from elasticsearch.helpers import bulk
 from datetime import datetime
+import os
+
+
+# Vector search: 'knn' uses the HNSW graph, 'exact' brute-forces the filtered set
+ES_SEARCH_MODE = os.getenv('ES_SEARCH_MODE', 'knn')
+ES_KNN_CANDIDATE_FACTOR = int(os.getenv('ES_KNN_CANDIDATE_FACTOR', '10'))
+ES_KNN_MIN_CANDIDATES = int(os.getenv('ES_KNN_MIN_CANDIDATES', '100'))
+ES_KNN_MAX_CANDIDATES = 10000  # Elasticsearch limit
+
+# Quantized code chunk vectors: kNN candidates are rescored with the stored
+# full-precision vectors (oversample x k of them; 0 disables, needs ES 8.18+)
+ES_RESCORE_OVERSAMPLE = float(os.getenv(
+    'ES_RESCORE_OVERSAMPLE',
+    '3' if ES_VECTOR_QUANTIZATION in ('int8', 'int4', 'binary') else '0'
+))
+
+# Hybrid search: BM25 fields per index, and the reciprocal rank fusion constant
+SEARCH_TEXT_FIELDS = {
+    REPO_CHUNKS_INDEX: ["content^2", "file_path", "keywords"],
+    CHAT_MEMORY_INDEX: ["summary"],
+    EXTERNAL_SOURCES_INDEX: ["title^2", "snippet", "keywords"],
+}
+RRF_RANK_CONSTANT = int(os.getenv('RRF_RANK_CONSTANT', '60'))
 
 class ElasticsearchManager:
     def __init__(self):
@@ -63,62 +87,237 @@ class ElasticsearchManager:
             return success, failed
         except Exception as e:
             print(f"❌ Bulk indexing error: {str(e)}")
-            return 0, len(documents)
+            # Same shape as bulk()'s error items, so callers can tell which ids failed
+            return 0, [{"index": {"_id": doc.get("id"), "error": str(e)}} for doc in documents]
+    
+    def existing_ids(self, index_name, ids):
+        """Return the subset of ids that already exist (no _source fetched)"""
+        if not ids:
+            return set()
+        
+        try:
+            response = self.client.mget(
+                index=index_name,
+                docs=[{"_id": doc_id, "_source": False} for doc_id in ids]
+            )
+            return {doc["_id"] for doc in response["docs"] if doc.get("found")}
+        except Exception as e:
+            print(f"⚠️ Existing id lookup failed: {str(e)}")
+            return set()
     
-    def hybrid_search(self, index_name, query_text, query_vector, user_id=None, top_k=5):
+    def hybrid_search(
+        self,
+        index_name,
+        query_text,
+        query_vector,
+        user_id=None,
+        top_k=5,
+        repo_id=None,
+        mode=None,
+        num_candidates=None,
+        lexical_k=None,
+        knn_k=None
+    ):
         """
-        Hybrid search: combine vector similarity + keyword (BM25)
+        Hybrid search: BM25 and vector retrievers fused with reciprocal rank fusion
+        
+        Both retrievers run in one msearch round trip. Each returns its own
+        ranked list and a document scores sum(1 / (RRF_RANK_CONSTANT + rank))
+        over the lists it appears in, so exact identifier matches rank well
+        without oversampling vector candidates. Without query_text only the
+        vector retriever runs.
+        
+        Args:
+            mode: 'knn' (approximate, HNSW) or 'exact' (script_score over the
+                filtered documents only); default ES_SEARCH_MODE
+            num_candidates: Per-shard kNN candidates (default: knn_k *
+                ES_KNN_CANDIDATE_FACTOR, at least ES_KNN_MIN_CANDIDATES)
+            lexical_k: Results taken from the BM25 retriever (default top_k)
+            knn_k: Results taken from the vector retriever (default top_k)
+        
+        Returns:
+            [{"score": float, "source": dict}], best first, at most top_k
         """
-        must_clauses = []
+        mode = mode or ES_SEARCH_MODE
+        filters = self._search_filters(user_id, repo_id)
+        knn_k = knn_k or top_k
         
-        # Add user filter if provided
-        if user_id is not None:
-            must_clauses.append({"term": {"user_id": user_id}})
+        bodies = [self._vector_query(index_name, query_vector, filters, knn_k, mode, num_candidates)]
+        if query_text and index_name in SEARCH_TEXT_FIELDS:
+            bodies.append(self._lexical_query(index_name, query_text, filters, lexical_k or top_k))
         
-        search_body = {
-            "size": top_k,
+        try:
+            if len(bodies) == 1:
+                hit_lists = [self.client.search(index=index_name, body=bodies[0])["hits"]["hits"]]
+            else:
+                searches = []
+                for body in bodies:
+                    searches.extend([{"index": index_name}, body])
+                
+                hit_lists = []
+                for response in self.client.msearch(searches=searches)["responses"]:
+                    if "error" in response:
+                        print(f"⚠️ Search branch failed: {response['error']}")
+                        hit_lists.append([])
+                    else:
+                        hit_lists.append(response["hits"]["hits"])
+        except Exception as e:
+            print(f"❌ Search error: {str(e)}")
+            return []
+        
+        if len(hit_lists) == 1:
+            return [
+                {"score": hit["_score"], "source": hit["_source"]}
+                for hit in hit_lists[0][:top_k]
+            ]
+        
+        return self._rrf_fuse(hit_lists, top_k)
+    
+    def _vector_query(self, index_name, query_vector, filters, k, mode, num_candidates=None):
+        """Vector retriever: filtered kNN, or exact cosine over the filtered set"""
+        if mode == "knn":
+            # Filters run inside the kNN search, so only this tenant's
+            # vectors are candidates
+            knn = {
+                "field": "embedding",
+                "query_vector": query_vector,
+                "k": k,
+                "num_candidates": self._num_candidates(k, num_candidates),
+                "filter": filters
+            }
+            if index_name == REPO_CHUNKS_INDEX and ES_RESCORE_OVERSAMPLE > 0:
+                knn["rescore_vector"] = {"oversample": ES_RESCORE_OVERSAMPLE}
+            
+            return {"size": k, "knn": knn, "_source": True}
+        
+        return {
+            "size": k,
+            "query": {
+                "script_score": {
+                    "query": {"bool": {"filter": filters}},
+                    "script": {
+                        "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+                        "params": {"query_vector": query_vector}
+                    }
+                }
+            },
+            "_source": True
+        }
+    
+    @staticmethod
+    def _lexical_query(index_name, query_text, filters, k):
+        """BM25 retriever over the index's text fields"""
+        return {
+            "size": k,
             "query": {
                 "bool": {
-                    "must": must_clauses,
-                    "should": [
-                        # Vector similarity search
-                        {
-                            "script_score": {
-                                "query": {"match_all": {}},
-                                "script": {
-                                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                                    "params": {"query_vector": query_vector}
-                                }
-                            }
-                        },
-                        # BM25 keyword search
-                        {
-                            "multi_match": {
-                                "query": query_text,
-                                "fields": ["content^2", "file_path", "keywords"],
-                                "type": "best_fields",
-                                "fuzziness": "AUTO"
-                            }
+                    "filter": filters,
+                    "must": [{
+                        "multi_match": {
+                            "query": query_text,
+                            "fields": SEARCH_TEXT_FIELDS[index_name],
+                            "type": "best_fields",
+                            "fuzziness": "AUTO"
                         }
-                    ],
-                    "minimum_should_match": 1
+                    }]
                 }
             },
             "_source": True
         }
+    
+    @staticmethod
+    def _rrf_fuse(hit_lists, top_k):
+        """Reciprocal rank fusion of several ranked hit lists"""
+        scores = {}
+        sources = {}
+        
+        for hits in hit_lists:
+            for rank, hit in enumerate(hits, 1):
+                scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + 1.0 / (RRF_RANK_CONSTANT + rank)
+                sources.setdefault(hit["_id"], hit["_source"])
         
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return [{"score": scores[doc_id], "source": sources[doc_id]} for doc_id in ranked]
+    
+    @staticmethod
+    def _num_candidates(k, num_candidates=None):
+        """kNN candidate count: at least k, at most Elasticsearch's limit"""
+        if num_candidates is None:
+            num_candidates = max(k * ES_KNN_CANDIDATE_FACTOR, ES_KNN_MIN_CANDIDATES)
+        return min(max(num_candidates, k), ES_KNN_MAX_CANDIDATES)
+    
+    @staticmethod
+    def _search_filters(user_id=None, repo_id=None):
+        """Tenant filters shared by every search branch"""
+        filters = []
+        if user_id is not None:
+            filters.append({"term": {"user_id": user_id}})
+        if repo_id is not None:
+            filters.append({"term": {"repo_id": str(repo_id)}})
+        return filters
+    
+    def refresh_index(self, index_name):
+        """Make every write so far visible to search"""
         try:
-            response = self.client.search(index=index_name, body=search_body)
-            return [
-                {
-                    "score": hit["_score"],
-                    "source": hit["_source"]
-                }
-                for hit in response["hits"]["hits"]
-            ]
+            self.client.indices.refresh(index=index_name)
         except Exception as e:
-            print(f"❌ Search error: {str(e)}")
-            return []
+            print(f"⚠️ Refresh of {index_name} failed: {str(e)}")
+    
+    def delete_file_chunks(self, index_name, user_id, repo_id, file_paths, keep_ids=None):
+        """
+        Delete the chunks of several files with ONE delete_by_query
+        
+        Args:
+            file_paths: Repository-relative paths (matched on file_path.keyword)
+            keep_ids: Document ids to leave in place
+        """
+        if not file_paths:
+            return 0
+        
+        query = {
+            "bool": {
+                "filter": [
+                    {"term": {"user_id": user_id}},
+                    {"term": {"repo_id": str(repo_id)}},
+                    {"terms": {"file_path.keyword": list(file_paths)}}
+                ]
+            }
+        }
+        
+        if keep_ids:
+            query["bool"]["must_not"] = [{"ids": {"values": list(keep_ids)}}]
+        
+        try:
+            response = self.client.delete_by_query(
+                index=index_name,
+                body={"query": query},
+                conflicts="proceed"
+            )
+            return response.get("deleted", 0)
+        except Exception as e:
+            print(f"❌ Error deleting file chunks: {str(e)}")
+            return 0
+    
+    def delete_repository_data(self, index_name, user_id, repo_id):
+        """Delete every document of one repository"""
+        try:
+            self.client.delete_by_query(
+                index=index_name,
+                body={
+                    "query": {
+                        "bool": {
+                            "filter": [
+                                {"term": {"user_id": user_id}},
+                                {"term": {"repo_id": str(repo_id)}}
+                            ]
+                        }
+                    }
+                },
+                conflicts="proceed"
+            )
+            print(f"✅ Deleted repository {repo_id} data from {index_name}")
+        except Exception as e:
+            print(f"❌ Error deleting repository data from {index_name}: {str(e)}")
     
     def delete_user_data(self, user_id):
         """Delete all data for a specific user"""
@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.rag_search.vector_store import LocalVectorIndex, VECTOR_RESCORE_OVERSAMPLE, bytes_per_vector
+import numpy as np
+import shutil
+import tempfile
+import time
+
+
+class Command(BaseCommand):
+    help = 'Measure recall@k and scan size of quantized local vector indexes against exact search'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repo',
+            help='Repository id whose local vector index is used as the corpus',
+        )
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            default=10000,
+            help='Clustered random vectors to use when no --repo is given (default: 10000)',
+        )
+        parser.add_argument('--dim', type=int, default=768, help='Synthetic vector dimensions (default: 768)')
+        parser.add_argument('--queries', type=int, default=100, help='Number of queries (default: 100)')
+        parser.add_argument('--k', type=int, default=10, help='Results per query (default: 10)')
+        parser.add_argument(
+            '--oversample',
+            type=float,
+            default=VECTOR_RESCORE_OVERSAMPLE,
+            help='Rescoring oversample factor to evaluate (0 is always reported too)',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        corpus = self._load_corpus(options, rng)
+        k = options['k']
+
+        if len(corpus) <= k:
+            raise CommandError(f"Need more than {k} vectors, got {len(corpus)}")
+
+        # Queries: corpus vectors with noise, so neighbours are non-trivial
+        picks = rng.integers(0, len(corpus), options['queries'])
+        queries = corpus[picks] + rng.normal(scale=corpus.std() * 0.5, size=(len(picks), corpus.shape[1]))
+        queries = queries.astype(np.float32)
+
+        self.stdout.write(f"Corpus: {len(corpus)} x {corpus.shape[1]}, {len(queries)} queries, k={k}")
+
+        workdir = tempfile.mkdtemp(prefix='vector_recall_')
+        try:
+            exact = None
+            rows = []
+
+            for quantization in ('none', 'int8', 'binary'):
+                index = LocalVectorIndex('bench', directory=f"{workdir}/{quantization}", quantization=quantization)
+                index.add([
+                    {'id': str(i), 'embedding': vector}
+                    for i, vector in enumerate(corpus.tolist())
+                ])
+
+                settings = [None] if quantization == 'none' else [0, options['oversample']]
+                for oversample in settings:
+                    start = time.perf_counter()
+                    results = [
+                        [hit['source']['id'] for hit in index.search(query, k, oversample=oversample)]
+                        for query in queries.tolist()
+                    ]
+                    latency = (time.perf_counter() - start) * 1000 / len(queries)
+
+                    if exact is None:
+                        exact = results
+
+                    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(exact, results)])
+                    rows.append((quantization, oversample, recall, latency))
+
+            float_bytes = bytes_per_vector(corpus.shape[1], 'none')
+            self.stdout.write(f"{'mode':<8} {'rescore':>8} {'recall@' + str(k):>10} {'ms/query':>9} {'bytes/vec':>10} {'RAM':>6}")
+            for quantization, oversample, recall, latency in rows:
+                size = bytes_per_vector(corpus.shape[1], quantization)
+                rescore = '-' if oversample is None else (f"{oversample:g}x" if oversample else 'off')
+                self.stdout.write(
+                    f"{quantization:<8} {rescore:>8} {recall:>10.3f} {latency:>9.2f} {size:>10} {float_bytes / size:>5.1f}x"
+                )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _load_corpus(self, options, rng):
+        if options['repo']:
+            corpus = LocalVectorIndex(options['repo']).matrix()
+            if corpus.size == 0:
+                raise CommandError(f"No local vector index for repository {options['repo']}")
+            return corpus
+
+        centers = rng.normal(size=(max(options['synthetic'] // 100, 1), options['dim']))
+        assignments = rng.integers(0, len(centers), options['synthetic'])
+        corpus = centers[assignments] + 0.6 * rng.normal(size=(options['synthetic'], options['dim']))
+        return corpus.astype(np.float32)
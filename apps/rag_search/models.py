@@ -1,3 +1,20 @@
+# apps/rag_search/models.py
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class EmbeddingCacheEntry(models.Model):
+    """Embedding vector cached by hash of (model_name, task_type, text)"""
+    
+    key = models.CharField(max_length=64, primary_key=True)  # sha256 hex
+    model_name = models.CharField(max_length=100)
+    task_type = models.CharField(max_length=50)
+    dims = models.IntegerField()
+    vector = models.BinaryField()  # Packed float32
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)  # For LRU eviction
+    
+    def __str__(self):
+        return f"{self.model_name}/{self.task_type} {self.key[:12]}"
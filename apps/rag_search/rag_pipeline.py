@@ -3,9 +3,12 @@ import json
 import google.generativeai as genai
 import os
 from .embeddings import EmbeddingService
+from .embedding_cache import QueryEmbeddingCache
 from .generation import GenerationService
 from .es_ops import ElasticsearchManager
+from .vector_store import search_repositories, uses_local_index
 from apps.chat.models import ChatMessage
+from apps.repo_ingest.models import Repository
 
 
 # Initialize Gemini for intent detection
@@ -55,7 +58,9 @@ class RAGPipeline:
         # Step 2: Embed the question
         print(f"🔍 Embedding question: {question[:50]}...")
         query_embedding = self.embed_service.embed_query(question)
-        print(f"✅ Generated {len(query_embedding)}-dim embedding")
+        query_cache = QueryEmbeddingCache.get_stats()
+        print(f"✅ Generated {len(query_embedding)}-dim embedding "
+              f"(query cache hit rate {query_cache['hit_rate']:.0%} over {query_cache['hits'] + query_cache['misses']} lookups)")
         
         # Step 3: Smart code retrieval based on intent
         print(f"📚 Searching for relevant code...")
@@ -81,7 +86,8 @@ class RAGPipeline:
         past_summaries = self._retrieve_past_summaries(
             query_embedding=query_embedding,
             user_id=user_id,
-            top_k=max_summaries
+            top_k=max_summaries,
+            question=question
         )
         print(f"✅ Found {len(past_summaries)} past summaries")
         
@@ -291,6 +297,26 @@ Return at most {top_k} indices."""
             print(f"⚠️ Reranking failed: {str(e)}, using original order")
             return chunks[:top_k]
     
+    def _search_code(
+        self,
+        query_embedding: List[float],
+        question: str,
+        user_id: int,
+        top_k: int
+    ) -> List[Dict]:
+        """Code chunk search on the configured backend (RETRIEVAL_BACKEND)"""
+        if uses_local_index():
+            repo_ids = Repository.objects.filter(user_id=user_id).values_list('id', flat=True)
+            return search_repositories(repo_ids, query_embedding, top_k)
+        
+        return self.es_manager.hybrid_search(
+            index_name="jarvis_repo_chunks",
+            query_vector=query_embedding,
+            query_text=question,
+            user_id=user_id,
+            top_k=top_k
+        )
+    
     def _retrieve_code_aggregation(
         self,
         query_embedding: List[float],
@@ -300,13 +326,7 @@ Return at most {top_k} indices."""
     ) -> List[Dict]:
         """Retrieve code for aggregation queries (no reranking needed)"""
         try:
-            results = self.es_manager.hybrid_search(
-                index_name="jarvis_repo_chunks",
-                query_vector=query_embedding,
-                query_text="",
-                user_id=user_id,
-                top_k=top_k
-            )
+            results = self._search_code(query_embedding, question, user_id, top_k)
             
             if len(results) > 30:
                 print(f"⚠️ Large result set ({len(results)}), may need summarization")
@@ -341,13 +361,7 @@ Return at most {top_k} indices."""
             # Retrieve more chunks if reranking (to give Gemini more options)
             retrieve_k = top_k * 4 if use_reranking else top_k
             
-            results = self.es_manager.hybrid_search(
-                index_name="jarvis_repo_chunks",
-                query_vector=query_embedding,
-                query_text="",
-                user_id=user_id,
-                top_k=retrieve_k
-            )
+            results = self._search_code(query_embedding, question, user_id, retrieve_k)
             
             # ✅ Rerank with Gemini if enabled
             if use_reranking and question and len(results) > top_k:
@@ -365,14 +379,15 @@ Return at most {top_k} indices."""
         self,
         query_embedding: List[float],
         user_id: int,
-        top_k: int = 3
+        top_k: int = 3,
+        question: str = ""
     ) -> List[Dict]:
         """Retrieve relevant past conversation summaries"""
         try:
             results = self.es_manager.hybrid_search(
                 index_name="jarvis_chat_memory",
                 query_vector=query_embedding,
-                query_text="",
+                query_text=question,
                 user_id=user_id,
                 top_k=top_k
             )
@@ -0,0 +1,601 @@
+# apps/rag_search/vector_store.py
+"""
+Local memory-mapped vector index - per-repository retrieval without Elasticsearch
+
+Each repository gets a directory holding:
+    vectors-<generation>.npy  float32 matrix (capacity x dim), L2-normalized rows
+    codes-/scales-<gen>.npy   quantized copy of the matrix (VECTOR_QUANTIZATION)
+    meta.jsonl                header line, then one line per added row
+                              ({"row", "id", "source"}) or deleted row ({"delete"})
+
+Rows are appended in place into the preallocated matrix and the metadata log,
+so ingestion batches never rewrite the index. When the matrix is full or
+mostly deleted, live rows are compacted into a new generation and meta.jsonl
+is atomically replaced; readers that still map the old file keep working.
+
+Writers in any process are serialized by an flock on <repo_id>.lock next to
+the index directory. Readers only parse the bytes appended to meta.jsonl
+since their last read, and reload everything only after a compaction.
+
+Search is one vectorized dot product over the memory-mapped matrix and
+argpartition for the top k. With VECTOR_QUANTIZATION=int8 (1 byte per
+dimension plus a per-row scale) or binary (1 bit per dimension), a quantized
+copy is scanned instead and the top k * VECTOR_RESCORE_OVERSAMPLE candidates
+are rescored against the full-precision rows, so only the quantized matrix
+has to stay in RAM.
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+
+# 'es' (Elasticsearch, default) or 'local' (this module) for code chunk retrieval
+RETRIEVAL_BACKEND = os.getenv('RETRIEVAL_BACKEND', 'es')
+VECTOR_STORE_DIR = os.getenv('VECTOR_STORE_DIR', os.path.join(tempfile.gettempdir(), 'jarvis_vectors'))
+VECTOR_INDEX_MIN_CAPACITY = 1024  # Rows preallocated for a new index
+
+# Quantized scan: 'none', 'int8' or 'binary' (applied when an index is (re)built)
+VECTOR_QUANTIZATION = os.getenv('VECTOR_QUANTIZATION', 'none')
+VECTOR_RESCORE_OVERSAMPLE = float(os.getenv('VECTOR_RESCORE_OVERSAMPLE', '4'))
+VECTOR_SCAN_BLOCK_ROWS = 16384  # Rows dequantized per step (bounds temporary memory)
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def uses_local_index() -> bool:
+    """Whether code chunks are indexed and searched with LocalVectorIndex"""
+    return RETRIEVAL_BACKEND == 'local'
+
+
+def quantize_int8(vectors: np.ndarray):
+    """
+    Symmetric per-row int8 quantization
+
+    Returns:
+        (int8 codes, float32 scales) with vectors ~= codes * scales[:, None]
+    """
+    scales = (np.abs(vectors).max(axis=1) / 127.0).astype(np.float32)
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """Sign bits, packed 8 dimensions per byte"""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def bytes_per_vector(dim: int, quantization: str) -> int:
+    """Bytes scanned per row in a search"""
+    if quantization == 'int8':
+        return dim + 4
+    if quantization == 'binary':
+        return (dim + 7) // 8
+    return dim * 4
+
+
+class _IndexState:
+    """One loaded generation of an index (read-only snapshot)"""
+
+    def __init__(self, generation: int, dim: int, capacity: int, quantization: str = 'none'):
+        self.generation = generation
+        self.dim = dim
+        self.capacity = capacity
+        self.quantization = quantization
+        self.count = 0  # Rows written (live or deleted)
+        self.ids: List[Optional[str]] = []  # Per row, None once deleted
+        self.sources: List[Optional[Dict]] = []
+        self.row_of: Dict[str, int] = {}  # Live id -> row
+        self.dead_rows: Set[int] = set()
+        self.vectors = None  # np.memmap (capacity x dim)
+        self.codes = None  # Quantized np.memmap (int8 or packed bits), if any
+        self.scales = None  # Per-row int8 scales
+        self.signature = None  # (inode, size, mtime_ns) of meta.jsonl when last read
+        self.offset = 0  # Bytes of meta.jsonl applied so far
+        self.lock = threading.Lock()  # Guards applying new entries against readers
+        self._dead_array = None
+
+    @property
+    def live_count(self) -> int:
+        return len(self.row_of)
+
+    def apply(self, entry: Dict):
+        """Apply one meta.jsonl entry"""
+        if 'delete' in entry:
+            row = entry['delete']
+            self.row_of.pop(self.ids[row], None)
+            self.ids[row] = None
+            self.sources[row] = None
+            self.dead_rows.add(row)
+            self._dead_array = None
+        else:
+            self.ids.append(entry['id'])
+            self.sources.append(entry['source'])
+            self.row_of[entry['id']] = entry['row']
+            self.count = len(self.ids)
+
+    def dead_array(self) -> np.ndarray:
+        """Deleted row numbers, for masking scores"""
+        if self._dead_array is None:
+            self._dead_array = np.fromiter(self.dead_rows, dtype=np.int64, count=len(self.dead_rows))
+        return self._dead_array
+
+
+# Loaded indexes shared by every LocalVectorIndex in the process
+_states: Dict[str, _IndexState] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def _lock_for(path: str) -> threading.Lock:
+    with _registry_lock:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _signature(stat: os.stat_result):
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class LocalVectorIndex:
+    """Memory-mapped exact vector index for one repository"""
+
+    def __init__(self, repo_id, directory: Optional[str] = None, quantization: Optional[str] = None):
+        self.repo_id = str(repo_id)
+        self.quantization = quantization or VECTOR_QUANTIZATION  # Used when (re)building
+        self.path = os.path.join(directory or VECTOR_STORE_DIR, self.repo_id)
+        self.meta_path = os.path.join(self.path, 'meta.jsonl')
+        # Beside the directory, so drop() can remove the index while holding it
+        self.lock_path = self.path + '.lock'
+
+    # ------------------------------------------------------------------ reads
+
+    def exists(self) -> bool:
+        return os.path.exists(self.meta_path)
+
+    def existing_ids(self, ids: Iterable[str]) -> Set[str]:
+        """Subset of ids that are live in the index"""
+        state = self._state()
+        if state is None:
+            return set()
+        return {doc_id for doc_id in ids if doc_id in state.row_of}
+
+    def stats(self) -> Dict:
+        """Row counts and scanned size of the index"""
+        state = self._state()
+        if state is None:
+            return {'rows': 0, 'dim': 0, 'quantization': self.quantization, 'scan_bytes': 0}
+
+        return {
+            'rows': state.live_count,
+            'dim': state.dim,
+            'quantization': state.quantization,
+            'scan_bytes': state.count * bytes_per_vector(state.dim, state.quantization),
+        }
+
+    def search(self, query_vector: List[float], top_k: int = 5, oversample: Optional[float] = None) -> List[Dict]:
+        """
+        Cosine top-k (exact, or quantized scan + full-precision rescoring)
+
+        Args:
+            oversample: Candidates rescored per result on a quantized index
+                (default VECTOR_RESCORE_OVERSAMPLE; 0 returns the quantized
+                ranking as is)
+
+        Returns:
+            [{"score": float, "source": dict}], best first; scores use the
+            Elasticsearch cosine scale (1 + cos) / 2
+        """
+        state = self._state()
+        if state is None or state.live_count == 0 or top_k <= 0:
+            return []
+
+        query = self._normalize(np.asarray(query_vector, dtype=np.float32))
+        if query.shape[0] != state.dim:
+            print(f"⚠️ Query has {query.shape[0]} dims, index {self.repo_id} has {state.dim}")
+            return []
+
+        # Rows appended after this snapshot are ignored by this search
+        with state.lock:
+            count, dead, live = state.count, state.dead_array(), state.live_count
+
+        if state.quantization == 'none':
+            scores = state.vectors[:count] @ query
+        else:
+            scores = self._approximate_scores(state, query, count)
+        scores[dead] = -np.inf
+
+        k = min(top_k, live)
+        oversample = VECTOR_RESCORE_OVERSAMPLE if oversample is None else oversample
+
+        if state.quantization != 'none' and oversample > 0:
+            # Rescore the best quantized candidates with full-precision rows
+            candidates = min(live, max(k, math.ceil(k * oversample)))
+            rows = np.sort(np.argpartition(-scores, candidates - 1)[:candidates])
+            exact = state.vectors[rows] @ query
+            order = np.argsort(-exact)[:k]
+            top, top_scores = rows[order], exact[order]
+        else:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            top_scores = scores[top]
+
+        results = []
+        for row, score in zip(top, top_scores):
+            source = state.sources[row]
+            if source is not None and np.isfinite(score):  # Deleted since the snapshot
+                results.append({"score": (float(score) + 1.0) / 2.0, "source": source})
+        return results
+
+    @staticmethod
+    def _approximate_scores(state: _IndexState, query: np.ndarray, count: int) -> np.ndarray:
+        """Approximate cosine of rows [0, count) from the quantized matrix, block by block"""
+        scores = np.empty(count, dtype=np.float32)
+        query_bits = np.packbits(query > 0) if state.quantization == 'binary' else None
+
+        for start in range(0, count, VECTOR_SCAN_BLOCK_ROWS):
+            end = min(start + VECTOR_SCAN_BLOCK_ROWS, count)
+
+            if state.quantization == 'int8':
+                scores[start:end] = (state.codes[start:end].astype(np.float32) @ query) * state.scales[start:end]
+            else:
+                distance = _POPCOUNT[np.bitwise_xor(state.codes[start:end], query_bits)].sum(axis=1, dtype=np.int32)
+                scores[start:end] = 1.0 - 2.0 * distance / state.dim
+
+        return scores
+
+    # ----------------------------------------------------------------- writes
+
+    def add(self, documents: List[Dict]) -> int:
+        """
+        Append documents (Elasticsearch-shaped, with 'id' and 'embedding')
+
+        Ids already in the index are skipped - ids are content-derived, so
+        the same id means the same vector.
+
+        Returns:
+            Number of rows added
+        """
+        documents = [doc for doc in documents if doc.get('embedding')]
+        if not documents:
+            return 0
+
+        with self._write_lock():
+            state = self._state()
+
+            new_docs = []
+            if state is not None:
+                with state.lock:
+                    seen = set(state.row_of)
+            else:
+                seen = set()
+            for doc in documents:
+                if doc['id'] not in seen:
+                    seen.add(doc['id'])
+                    new_docs.append(doc)
+
+            if not new_docs:
+                return 0
+
+            if state is None or state.count + len(new_docs) > state.capacity:
+                self._compact(state, new_docs)
+                return len(new_docs)
+
+            vectors = np.load(self._vectors_path(state.generation), mmap_mode='r+')
+            lines = []
+            for offset, doc in enumerate(new_docs):
+                row = state.count + offset
+                vectors[row] = self._normalize(np.asarray(doc['embedding'], dtype=np.float32))
+                lines.append({"row": row, "id": doc['id'], "source": self._source(doc)})
+            self._write_codes(state.generation, state.quantization, vectors, state.count, state.count + len(new_docs))
+            vectors.flush()
+            del vectors
+
+            # Rows become visible once their metadata lines are written
+            self._append_lines(state, lines)
+            return len(new_docs)
+
+    def delete_ids(self, ids: Iterable[str]) -> int:
+        """Delete documents by id; returns the number deleted"""
+        ids = set(ids)
+        return self._delete(lambda doc_id: doc_id in ids)
+
+    def retain(self, ids: Iterable[str]) -> int:
+        """Delete every document whose id is not in ids; returns the number deleted"""
+        ids = set(ids)
+        return self._delete(lambda doc_id: doc_id not in ids)
+
+    def matrix(self) -> np.ndarray:
+        """Full-precision vectors of the live rows (a copy)"""
+        state = self._state()
+        if state is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        with state.lock:
+            rows = sorted(state.row_of.values())
+        return np.asarray(state.vectors[rows])
+
+    def drop(self):
+        """Remove the whole index from disk"""
+        with self._write_lock():
+            shutil.rmtree(self.path, ignore_errors=True)
+            with _registry_lock:
+                _states.pop(self.path, None)
+
+    # -------------------------------------------------------------- internals
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        Exclusive write access to this index across threads and processes
+
+        Ingestion and sync run in worker processes, so the in-process lock
+        alone would let two writers append the same rows.
+        """
+        with _lock_for(self.path):
+            if fcntl is None:
+                yield
+                return
+
+            os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _delete(self, should_delete) -> int:
+        with self._write_lock():
+            state = self._state()
+            if state is None:
+                return 0
+
+            with state.lock:
+                live = list(state.row_of.items())
+            rows = [row for doc_id, row in live if should_delete(doc_id)]
+            if not rows:
+                return 0
+
+            dead = len(state.dead_rows) + len(rows)
+            if dead > state.live_count - len(rows):
+                # Mostly deleted - rewrite the live rows instead of logging tombstones
+                keep = set(state.row_of.values()) - set(rows)
+                self._compact(state, [], keep_rows=keep)
+            else:
+                self._append_lines(state, [{"delete": row} for row in rows])
+
+            return len(rows)
+
+    def _compact(self, state: Optional[_IndexState], new_docs: List[Dict], keep_rows: Optional[Set[int]] = None):
+        """Write live rows plus new_docs into a new generation"""
+        if state is not None:
+            rows = sorted(keep_rows if keep_rows is not None else state.row_of.values())
+            dim = state.dim
+            generation = state.generation + 1
+        else:
+            rows = []
+            dim = len(new_docs[0]['embedding'])
+            generation = 1
+
+        count = len(rows) + len(new_docs)
+        capacity = max(VECTOR_INDEX_MIN_CAPACITY, count * 2)
+        quantization = self.quantization if self.quantization in ('int8', 'binary') else 'none'
+        os.makedirs(self.path, exist_ok=True)
+
+        vectors = np.lib.format.open_memmap(
+            self._vectors_path(generation), mode='w+', dtype=np.float32, shape=(capacity, dim)
+        )
+        if quantization == 'int8':
+            np.lib.format.open_memmap(self._codes_path(generation), mode='w+', dtype=np.int8, shape=(capacity, dim))
+            np.lib.format.open_memmap(self._scales_path(generation), mode='w+', dtype=np.float32, shape=(capacity,))
+        elif quantization == 'binary':
+            np.lib.format.open_memmap(
+                self._codes_path(generation), mode='w+', dtype=np.uint8, shape=(capacity, (dim + 7) // 8)
+            )
+        lines = [{"generation": generation, "dim": dim, "capacity": capacity, "quantization": quantization}]
+
+        for new_row, row in enumerate(rows):
+            vectors[new_row] = state.vectors[row]
+            lines.append({"row": new_row, "id": state.ids[row], "source": state.sources[row]})
+
+        for offset, doc in enumerate(new_docs, len(rows)):
+            vectors[offset] = self._normalize(np.asarray(doc['embedding'], dtype=np.float32))
+            lines.append({"row": offset, "id": doc['id'], "source": self._source(doc)})
+
+        self._write_codes(generation, quantization, vectors, 0, count)
+        vectors.flush()
+        del vectors
+
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+        if state is not None:
+            # Open mappings of the old files stay valid after unlinking
+            for path in self._generation_paths(state.generation):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        print(f"🧮 Vector index {self.repo_id}: generation {generation}, {count} rows ({quantization})")
+
+    def _write_codes(self, generation: int, quantization: str, vectors: np.ndarray, start: int, end: int):
+        """Quantize rows [start, end) of vectors into the generation's code files"""
+        if quantization == 'none' or end <= start:
+            return
+
+        codes = np.load(self._codes_path(generation), mmap_mode='r+')
+        if quantization == 'int8':
+            scales = np.load(self._scales_path(generation), mmap_mode='r+')
+            codes[start:end], scales[start:end] = quantize_int8(np.asarray(vectors[start:end]))
+            scales.flush()
+        else:
+            codes[start:end] = quantize_binary(np.asarray(vectors[start:end]))
+        codes.flush()
+
+    def _append_lines(self, state: _IndexState, lines: List[Dict]):
+        """Append log entries and apply them to the cached state (no reload)"""
+        with open(self.meta_path, 'a', encoding='utf-8') as f:
+            for line in lines:
+                f.write(json.dumps(line) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            stat = os.fstat(f.fileno())
+
+        # The write lock is held and state was current, so nothing else was appended
+        with state.lock:
+            for line in lines:
+                state.apply(line)
+            state.offset = stat.st_size
+            state.signature = _signature(stat)
+
+    def _state(self) -> Optional[_IndexState]:
+        """
+        Current index state
+
+        Entries appended to meta.jsonl since the last read are applied to the
+        cached state; the log is only parsed from the start again when a
+        compaction replaced it (new inode) or on first use.
+        """
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+
+        signature = _signature(stat)
+        with _registry_lock:
+            state = _states.get(self.path)
+
+        if state is not None and state.signature == signature:
+            return state
+
+        if state is not None and state.signature[0] == stat.st_ino and self._read_appended(state):
+            return state
+
+        state = self._load()
+        if state is not None:
+            with _registry_lock:
+                _states[self.path] = state
+        return state
+
+    def _read_appended(self, state: _IndexState) -> bool:
+        """
+        Apply only the complete lines appended since state.offset
+
+        Returns:
+            False if the log was replaced or truncated (a full load is needed)
+        """
+        try:
+            with state.lock, open(self.meta_path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != state.signature[0] or stat.st_size < state.offset:
+                    return False
+
+                f.seek(state.offset)
+                data = f.read(stat.st_size - state.offset)
+                end = data.rfind(b'\n') + 1  # A trailing partial line is still being written
+
+                for line in data[:end].splitlines():
+                    state.apply(json.loads(line))
+                state.offset += end
+                state.signature = _signature(stat)
+                return True
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Could not read new entries of vector index {self.repo_id}: {e}")
+            return False
+
+    def _load(self) -> Optional[_IndexState]:
+        for _ in range(2):
+            try:
+                with open(self.meta_path, 'rb') as f:
+                    stat = os.fstat(f.fileno())
+                    header_line = f.readline()
+                    header = json.loads(header_line)
+                    state = _IndexState(
+                        header['generation'],
+                        header['dim'],
+                        header['capacity'],
+                        header.get('quantization', 'none')
+                    )
+                    state.offset = len(header_line)
+
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            break  # Line still being written
+                        state.apply(json.loads(line))
+                        state.offset += len(line)
+
+                    # Only what was read counts, even if the file grew meanwhile
+                    state.signature = (stat.st_ino, state.offset, None)
+
+                state.vectors = np.load(self._vectors_path(state.generation), mmap_mode='r')
+                if state.quantization != 'none':
+                    state.codes = np.load(self._codes_path(state.generation), mmap_mode='r')
+                if state.quantization == 'int8':
+                    state.scales = np.load(self._scales_path(state.generation), mmap_mode='r')
+                return state
+            except FileNotFoundError:
+                # A compaction replaced the generation between reads - retry once
+                continue
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ Could not load vector index {self.repo_id}: {e}")
+                return None
+
+        return None
+
+    def _vectors_path(self, generation: int) -> str:
+        return os.path.join(self.path, f'vectors-{generation}.npy')
+
+    def _codes_path(self, generation: int) -> str:
+        return os.path.join(self.path, f'codes-{generation}.npy')
+
+    def _scales_path(self, generation: int) -> str:
+        return os.path.join(self.path, f'scales-{generation}.npy')
+
+    def _generation_paths(self, generation: int) -> List[str]:
+        return [
+            self._vectors_path(generation),
+            self._codes_path(generation),
+            self._scales_path(generation),
+        ]
+
+    @staticmethod
+    def _source(doc: Dict) -> Dict:
+        """Stored document fields (everything but the vector)"""
+        return {key: value for key, value in doc.items() if key != 'embedding'}
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+def search_repositories(repo_ids: Iterable, query_vector: List[float], top_k: int = 5) -> List[Dict]:
+    """
+    Search several repositories' local indexes and merge the results
+
+    Returns:
+        [{"score": float, "source": dict}], best first, at most top_k
+    """
+    results = []
+    for repo_id in repo_ids:
+        results.extend(LocalVectorIndex(repo_id).search(query_vector, top_k))
+
+    results.sort(key=lambda result: result['score'], reverse=True)
+    return results[:top_k]
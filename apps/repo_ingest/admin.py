@@ -1,6 +1,6 @@
 # Register your models here.
 from django.contrib import admin
-from .models import Repository, CodeChunk
+from .models import Repository, CodeChunk, ChunkSummaryCache, RepositoryFile, IngestionJob, IngestionCheckpoint
 
 
 @admin.register(Repository)
@@ -17,3 +17,33 @@ class CodeChunkAdmin(admin.ModelAdmin):
     list_filter = ['language', 'chunk_type']
     search_fields = ['chunk_name', 'file_name', 'code']
     readonly_fields = ['id', 'created_at']
+
+
+@admin.register(ChunkSummaryCache)
+class ChunkSummaryCacheAdmin(admin.ModelAdmin):
+    list_display = ['key', 'model_name', 'created_at', 'last_used_at']
+    list_filter = ['model_name']
+    search_fields = ['summary']
+    readonly_fields = ['key', 'created_at']
+
+
+@admin.register(RepositoryFile)
+class RepositoryFileAdmin(admin.ModelAdmin):
+    list_display = ['file_path', 'repository', 'chunk_count', 'updated_at']
+    search_fields = ['file_path', 'file_hash']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ['job_type', 'repository', 'status', 'attempts', 'locked_by', 'heartbeat_at', 'created_at']
+    list_filter = ['status', 'job_type']
+    search_fields = ['repository__name', 'locked_by', 'last_error']
+    readonly_fields = ['id', 'created_at', 'started_at', 'finished_at', 'heartbeat_at']
+
+
+@admin.register(IngestionCheckpoint)
+class IngestionCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['repository', 'batch_index', 'stage', 'start_index', 'updated_at']
+    list_filter = ['stage']
+    readonly_fields = ['updated_at']
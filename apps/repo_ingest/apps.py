@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+import os
 
 
 class RepoIngestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.repo_ingest'
+
+    def ready(self):
+        # Grammars load lazily; set TREE_SITTER_WARMUP=true to pay that cost at startup instead
+        if os.getenv('TREE_SITTER_WARMUP', 'false').lower() == 'true':
+            from .tree_sitter_parser import warm_up_parsers
+            warm_up_parsers()
@@ -4,24 +4,45 @@ Generate embeddings and index to Elasticsearch
 """
 from apps.rag_search.embeddings import EmbeddingService
 from apps.rag_search.es_ops import ElasticsearchManager
-from typing import List, Dict
+from apps.rag_search.vector_store import LocalVectorIndex, uses_local_index
+from .exceptions import check_cancelled
+from .rate_limiter import estimate_tokens
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
-import uuid
+import hashlib
+import os
+
+
+# Batched embedding limits
+EMBED_BATCH_MAX_ITEMS = int(os.getenv('EMBED_BATCH_MAX_ITEMS', '100'))  # Gemini API limit per request
+EMBED_BATCH_MAX_TOKENS = int(os.getenv('EMBED_BATCH_MAX_TOKENS', '20000'))
+EMBED_CONCURRENCY = int(os.getenv('EMBED_CONCURRENCY', '4'))
 
 
 class ChunkEmbedder:
     """Generate embeddings and index chunks to Elasticsearch"""
     
-    def __init__(self):
+    def __init__(self, cancel_event=None):
         self.embed_service = EmbeddingService()
         self.es_manager = ElasticsearchManager()
+        self.skipped_count = 0  # Chunks already indexed with identical content
+        self.cancel_event = cancel_event  # threading.Event set when the job is cancelled
+        self._executor: Optional[ThreadPoolExecutor] = None  # Shared by every embed_texts() call
+    
+    def close(self):
+        """Stop the embedding request threads (the embedder can still be used afterwards)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
     
     def embed_and_index_chunks(
         self,
         chunks: List[Dict],
         repository_id: str,
         repository_name: str,
-        user_id: int
+        user_id: int,
+        start_index: int = 1
     ) -> tuple:
         """
         Generate embeddings and index all chunks to Elasticsearch
@@ -31,63 +52,275 @@ class ChunkEmbedder:
             repository_id: UUID of repository
             repository_name: Name of repository
             user_id: User ID
+            start_index: chunk_id of the first chunk (for batched callers)
         
         Returns:
-            (success_count, failed_count)
+            (success_count, failed_count) - unchanged chunks count as success
         """
-        print(f"🔢 Generating embeddings for {len(chunks)} chunks...")
+        skipped_before = self.skipped_count
+        documents = self.build_documents(
+            chunks, repository_id, repository_name, user_id, start_index
+        )
+        success, failed_ids = self.index_documents(documents)
+        
+        # Failed chunks are saved without an id, so they are never taken as indexed
+        for chunk in chunks:
+            if chunk.get('es_doc_id') in failed_ids:
+                chunk['es_doc_id'] = ''
+        
+        return success + (self.skipped_count - skipped_before), len(failed_ids)
+    
+    def build_documents(
+        self,
+        chunks: List[Dict],
+        repository_id: str,
+        repository_name: str,
+        user_id: int,
+        start_index: int = 1
+    ) -> List[Dict]:
+        """
+        Generate embeddings and build Elasticsearch documents
+        
+        Document ids are derived from (repository, file, chunk name, content
+        hash), so indexing is an idempotent upsert. Chunks whose id already
+        exists in Elasticsearch are not embedded again.
+        
+        Sets 'es_doc_id' and 'content_hash' on every chunk that is (or already
+        was) indexed.
+        
+        Returns:
+            List of documents ready for index_documents()
+        """
+        return self.build_documents_for_batches(
+            [(chunks, start_index)], repository_id, repository_name, user_id
+        )[0]
+    
+    def build_documents_for_batches(
+        self,
+        batches: List[Tuple[List[Dict], int]],
+        repository_id: str,
+        repository_name: str,
+        user_id: int
+    ) -> List[List[Dict]]:
+        """
+        build_documents() for several (chunks, start_index) batches at once
+        
+        The texts of every batch are packed into shared embedding requests,
+        so small batches still fill EMBED_BATCH_MAX_ITEMS and keep
+        EMBED_CONCURRENCY requests in flight.
+        
+        Returns:
+            One list of documents per batch
+        """
+        all_chunks = [chunk for chunks, _ in batches for chunk in chunks]
+        for chunk in all_chunks:
+            chunk['content_hash'] = self.content_hash(chunk.get('code', ''))
+        
+        doc_ids = [self.make_doc_id(repository_id, chunk) for chunk in all_chunks]
+        if uses_local_index():
+            existing = LocalVectorIndex(repository_id).existing_ids(set(doc_ids))
+        else:
+            existing = self.es_manager.existing_ids("jarvis_repo_chunks", list(set(doc_ids)))
+        
+        # Only embed new content (and each id once): (batch number, chunk_id, chunk, doc_id)
+        pending = []
+        seen = set(existing)
+        ids = iter(doc_ids)
+        for batch_number, (chunks, start_index) in enumerate(batches):
+            for i, chunk in enumerate(chunks, start_index):
+                doc_id = next(ids)
+                if doc_id in existing:
+                    chunk['es_doc_id'] = doc_id
+                    self.skipped_count += 1
+                elif doc_id not in seen:
+                    seen.add(doc_id)
+                    pending.append((batch_number, i, chunk, doc_id))
+        
+        print(f"🔢 Generating embeddings for {len(pending)} chunks ({len(all_chunks) - len(pending)} unchanged)...")
+        
+        texts = [self._prepare_embedding_text(chunk) for _, _, chunk, _ in pending]
+        embeddings = self.embed_texts(texts)
         
         # Prepare documents for indexing
-        documents = []
+        documents: List[List[Dict]] = [[] for _ in batches]
+        embedded_ids = set()
         
-        for i, chunk in enumerate(chunks, 1):
-            try:
-                # Generate embedding
-                embedding_text = self._prepare_embedding_text(chunk)
-                embedding = self.embed_service.embed_text(
-                    embedding_text, 
-                    task_type="RETRIEVAL_DOCUMENT"
-                )
-                
-                # Create Elasticsearch document
-                doc_id = f"{repository_id}_{uuid.uuid4().hex[:8]}"
-                
-                doc = {
-                    "id": doc_id,
-                    "user_id": user_id,
-                    "repo_id": str(repository_id),
-                    "repo_name": repository_name,
-                    "file_path": chunk.get('file_path', ''),
-                    "chunk_id": i,
-                    "content": chunk.get('code', ''),
-                    "language": chunk.get('language', 'text'),
-                    "node_type": chunk.get('chunk_type', 'function'),
-                    "start_line": chunk.get('start_line', 0),
-                    "end_line": chunk.get('end_line', 0),
-                    "embedding": embedding,
-                    "keywords": [chunk.get('chunk_name', ''), chunk.get('file_name', '')],
-                    "created_at": datetime.now().isoformat(),
-                    "updated_at": datetime.now().isoformat()
-                }
-                
-                # Add optional fields
-                if 'class_name' in chunk:
-                    doc['class_name'] = chunk['class_name']
-                
-                if 'summary' in chunk:
-                    doc['summary'] = chunk['summary']
-                
-                documents.append(doc)
-                
-                # Progress indicator
-                if i % 50 == 0 or i == len(chunks):
-                    print(f"   Embedded: {i}/{len(chunks)} chunks ({i*100//len(chunks)}%)")
+        for (batch_number, i, chunk, doc_id), embedding in zip(pending, embeddings):
+            if embedding is None:
+                print(f"⚠️ Failed to embed chunk {i}: {chunk.get('chunk_name', 'unknown')}")
+                continue
+            
+            doc = {
+                "id": doc_id,
+                "user_id": user_id,
+                "repo_id": str(repository_id),
+                "repo_name": repository_name,
+                "file_path": chunk.get('file_path', ''),
+                "chunk_id": i,
+                "content_hash": chunk['content_hash'],
+                "content": chunk.get('code', ''),
+                "language": chunk.get('language', 'text'),
+                "node_type": chunk.get('chunk_type', 'function'),
+                "start_line": chunk.get('start_line', 0),
+                "end_line": chunk.get('end_line', 0),
+                "embedding": embedding,
+                "keywords": [chunk.get('chunk_name', ''), chunk.get('file_name', '')],
+                "created_at": datetime.now().isoformat(),
+                "updated_at": datetime.now().isoformat()
+            }
+            
+            # Add optional fields
+            if 'class_name' in chunk:
+                doc['class_name'] = chunk['class_name']
+            
+            if 'summary' in chunk:
+                doc['summary'] = chunk['summary']
+            
+            documents[batch_number].append(doc)
+            embedded_ids.add(doc_id)
+        
+        # Duplicates of an embedded chunk share its id
+        for chunk, doc_id in zip(all_chunks, doc_ids):
+            if doc_id in embedded_ids:
+                chunk['es_doc_id'] = doc_id
+        
+        print(f"   Embedded: {len(embedded_ids)}/{len(pending)} new chunks")
+        return documents
+    
+    @staticmethod
+    def content_hash(code: str) -> str:
+        """sha256 of chunk code"""
+        return hashlib.sha256(code.encode('utf-8', errors='ignore')).hexdigest()
+    
+    @staticmethod
+    def make_doc_id(repository_id: str, chunk: Dict) -> str:
+        """Deterministic ES id from (repo_id, file_path, chunk_name, content hash)"""
+        code_hash = chunk.get('content_hash') or ChunkEmbedder.content_hash(chunk.get('code', ''))
+        key = "\0".join([
+            chunk.get('file_path', ''),
+            chunk.get('chunk_name', ''),
+            code_hash
+        ])
+        return f"{repository_id}_{hashlib.sha1(key.encode('utf-8', errors='ignore')).hexdigest()}"
+    
+    def embed_texts(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed texts with packed batch requests and bounded concurrency
+        
+        A batch that fails is split and retried one text at a time, so a
+        single bad input only loses itself. The embedding cache is read and
+        written here, in the calling thread: the API workers never touch the
+        database, so they never open (and leak) connections of their own.
+        
+        Returns:
+            One embedding per text, or None where embedding failed
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        service = self.embed_service
+        
+        cached = service.cache.get_many(service.model_name, "RETRIEVAL_DOCUMENT", texts)
+        for index, embedding in cached.items():
+            embeddings[index] = embedding
+        
+        missing = [index for index in range(len(texts)) if index not in cached]
+        batches = [
+            [missing[i] for i in batch]
+            for batch in self._pack_batches([texts[index] for index in missing])
+        ]
+        
+        if not batches:
+            return embeddings
+        
+        def run(batch: List[int]):
+            # Batches still waiting in the executor end at once after a cancel
+            check_cancelled(self.cancel_event)
+            for index, embedding in zip(batch, self._embed_batch(batch, texts)):
+                embeddings[index] = embedding
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, EMBED_CONCURRENCY), thread_name_prefix='embed')
+        
+        # list() re-raises anything unexpected from the workers
+        list(self._executor.map(run, batches))
+        
+        fresh = [index for index in missing if embeddings[index] is not None]
+        service.cache.set_many(
+            service.model_name,
+            "RETRIEVAL_DOCUMENT",
+            [texts[index] for index in fresh],
+            [embeddings[index] for index in fresh]
+        )
+        
+        print(f"   Embedding requests: {len(batches)} batches for {len(missing)} texts ({len(cached)} cached)")
+        return embeddings
+    
+    def _pack_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indexes into batches bounded by item count and ~token size"""
+        batches = []
+        current = []
+        current_tokens = 0
+        
+        for index, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            
+            if current and (
+                len(current) >= EMBED_BATCH_MAX_ITEMS
+                or current_tokens + tokens > EMBED_BATCH_MAX_TOKENS
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
             
+            current.append(index)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        
+        return batches
+    
+    def _embed_batch(self, batch: List[int], texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed one packed batch, falling back to per-item requests on failure"""
+        try:
+            return self.embed_service.embed_texts(
+                [texts[index] for index in batch],
+                task_type="RETRIEVAL_DOCUMENT",
+                use_cache=False
+            )
+        except Exception as e:
+            if len(batch) > 1:
+                print(f"⚠️ Embedding batch of {len(batch)} failed ({e}), retrying per item")
+        
+        results = []
+        for index in batch:
+            try:
+                results.append(self.embed_service.embed_texts(
+                    [texts[index]],
+                    task_type="RETRIEVAL_DOCUMENT",
+                    use_cache=False
+                )[0])
             except Exception as e:
-                print(f"⚠️ Failed to embed chunk {i}: {e}")
-                continue
+                print(f"⚠️ Embedding failed for text {index}: {e}")
+                results.append(None)
+        
+        return results
+    
+    def index_documents(self, documents: List[Dict]) -> tuple:
+        """
+        Bulk index prepared documents to Elasticsearch (or the local vector
+        index when RETRIEVAL_BACKEND=local)
+        
+        Returns:
+            (success_count, set of document ids that failed)
+        """
+        if uses_local_index():
+            if not documents:
+                return 0, set()
+            
+            added = LocalVectorIndex(documents[0]['repo_id']).add(documents)
+            print(f"✅ Added {added} chunks to the local vector index")
+            return len(documents), set()
         
-        # Bulk index to Elasticsearch
         print(f"📊 Indexing {len(documents)} documents to Elasticsearch...")
         
         try:
@@ -96,12 +329,18 @@ class ChunkEmbedder:
                 documents=documents
             )
             
-            print(f"✅ Indexed {success} chunks, {len(failed)} failed")
-            return success, len(failed)
+            failed_ids = {
+                item.get('_id')
+                for error in failed
+                for item in error.values()
+                if isinstance(item, dict)
+            }
+            print(f"✅ Indexed {success} chunks, {len(failed_ids)} failed")
+            return success, failed_ids
             
         except Exception as e:
             print(f"❌ Elasticsearch indexing failed: {e}")
-            return 0, len(documents)
+            return 0, {doc['id'] for doc in documents}
     
     def _prepare_embedding_text(self, chunk: Dict) -> str:
         """Prepare text for embedding (code + filename + summary)"""
@@ -3,21 +3,52 @@
 Summarize code chunks using Gemini API
 """
 import google.generativeai as genai
+import hashlib
+import json
 import os
-from typing import List, Dict
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional
+from django.utils import timezone
+from .models import ChunkSummaryCache
+from .rate_limiter import get_gemini_limiter, estimate_tokens
+from .exceptions import check_cancelled
 
 
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 
+SUMMARY_CACHE_ENABLED = os.getenv('SUMMARY_CACHE_ENABLED', 'true').lower() == 'true'
+
+# Batched prompts: up to N chunks (and ~M characters of code) per Gemini request
+SUMMARY_CHUNKS_PER_PROMPT = int(os.getenv('SUMMARY_CHUNKS_PER_PROMPT', '15'))
+SUMMARY_PROMPT_MAX_CHARS = int(os.getenv('SUMMARY_PROMPT_MAX_CHARS', '24000'))
+
+# Parallel Gemini requests; the shared token bucket keeps us inside the quota
+SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '8'))
+SUMMARY_OUTPUT_TOKENS = 40  # Expected response tokens per summary
+
 
 class ChunkSummarizer:
     """Generate summaries for code chunks using Gemini"""
     
-    def __init__(self, model_name="gemini-2.0-flash-exp"):
+    def __init__(
+        self,
+        model_name="gemini-2.0-flash-exp",
+        use_cache: bool = SUMMARY_CACHE_ENABLED,
+        chunks_per_prompt: int = SUMMARY_CHUNKS_PER_PROMPT,
+        concurrency: int = SUMMARY_CONCURRENCY,
+        cancel_event=None
+    ):
+        self.model_name = model_name
         self.model = genai.GenerativeModel(model_name)
         self.request_count = 0
-        self.rate_limit_delay = 0.1  # 100ms between requests
+        self.cache_hits = 0
+        self.use_cache = use_cache
+        self.chunks_per_prompt = max(1, chunks_per_prompt)
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = get_gemini_limiter()
+        self.cancel_event = cancel_event  # threading.Event set when the job is cancelled
+        self._count_lock = threading.Lock()
     
     def summarize_chunk(self, chunk: Dict, project_context: str = "") -> str:
         """
@@ -30,27 +61,17 @@ class ChunkSummarizer:
         Returns:
             Summary string (max 20 words)
         """
-        prompt = self._build_summary_prompt(chunk, project_context)
+        cached = self.get_cached_summaries([chunk], project_context)
+        if 0 in cached:
+            return cached[0]
         
-        try:
-            # Rate limiting
-            time.sleep(self.rate_limit_delay)
-            
-            response = self.model.generate_content(prompt)
-            summary = response.text.strip()
-            
-            self.request_count += 1
-            
-            # Keep summary concise
-            if len(summary) > 150:
-                summary = summary[:147] + "..."
-            
-            return summary
-            
-        except Exception as e:
-            print(f"⚠️ Summary failed for {chunk.get('chunk_name', 'unknown')}: {e}")
-            # Fallback to simple description
-            return f"{chunk.get('chunk_name', 'Code')} in {chunk.get('file_name', 'file')}"
+        summary = self._generate_summary(chunk, project_context)
+        
+        if summary is None:
+            return self._fallback_summary(chunk)
+        
+        self.cache_summaries([chunk], [summary], project_context)
+        return summary
     
     def summarize_chunks_batch(
         self, 
@@ -72,17 +93,220 @@ class ChunkSummarizer:
         total = len(chunks)
         print(f"📝 Summarizing {total} chunks...")
         
-        for i, chunk in enumerate(chunks, 1):
-            summary = self.summarize_chunk(chunk, project_context)
-            chunk['summary'] = summary
-            
-            # Progress indicator
-            if i % batch_size == 0 or i == total:
-                print(f"   Progress: {i}/{total} chunks summarized ({i*100//total}%)")
+        cached = self.get_cached_summaries(chunks, project_context)
+        generated_chunks = []
+        generated_summaries = []
+        
+        for i, summary in cached.items():
+            chunks[i]['summary'] = summary
+        
+        missing = [chunk for i, chunk in enumerate(chunks) if i not in cached]
+        groups = self._pack_prompt_groups(missing)
+        results: List[Optional[List[Optional[str]]]] = [None] * len(groups)
+        done = len(cached)
         
-        print(f"✅ Summarization complete! ({self.request_count} API calls)")
+        if groups:
+            workers = min(self.concurrency, len(groups))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(self._generate_summaries, group, project_context): index
+                    for index, group in enumerate(groups)
+                }
+                
+                for future in as_completed(futures):
+                    index = futures[future]
+                    results[index] = future.result()
+                    
+                    # Progress indicator (counted in completion order)
+                    previous, done = done, done + len(groups[index])
+                    if done // batch_size > previous // batch_size or done == total:
+                        print(f"   Progress: {done}/{total} chunks summarized ({done*100//total}%)")
+        
+        # Apply results in input order
+        for group, summaries in zip(groups, results):
+            for chunk, summary in zip(group, summaries):
+                if summary is None:
+                    chunk['summary'] = self._fallback_summary(chunk)
+                else:
+                    chunk['summary'] = summary
+                    generated_chunks.append(chunk)
+                    generated_summaries.append(summary)
+        
+        self.cache_summaries(generated_chunks, generated_summaries, project_context)
+        
+        print(f"✅ Summarization complete! ({self.request_count} API calls, {self.cache_hits} cache hits)")
         return chunks
     
+    def _pack_prompt_groups(self, chunks: List[Dict]) -> List[List[Dict]]:
+        """Split chunks into prompt-sized groups (by count and code length)"""
+        groups = []
+        current = []
+        current_chars = 0
+        
+        for chunk in chunks:
+            size = len(chunk.get('code', ''))
+            
+            if current and (
+                len(current) >= self.chunks_per_prompt
+                or current_chars + size > SUMMARY_PROMPT_MAX_CHARS
+            ):
+                groups.append(current)
+                current = []
+                current_chars = 0
+            
+            current.append(chunk)
+            current_chars += size
+        
+        if current:
+            groups.append(current)
+        
+        return groups
+    
+    def _generate_summaries(self, chunks: List[Dict], project_context: str) -> List[Optional[str]]:
+        """
+        Summarize a group of chunks with one multi-chunk prompt
+        
+        Chunks missing from (or malformed in) the JSON response fall back to
+        single-chunk requests.
+        
+        Returns:
+            One summary per chunk, in order (None where Gemini failed)
+        """
+        # Groups still waiting in the executor end at once after a cancel
+        check_cancelled(self.cancel_event)
+        
+        if len(chunks) == 1:
+            return [self._generate_summary(chunks[0], project_context)]
+        
+        prompt = self._build_multi_summary_prompt(chunks, project_context)
+        summaries: List[Optional[str]] = [None] * len(chunks)
+        
+        try:
+            response = self._request(prompt, expected_summaries=len(chunks))
+            
+            for item in self._parse_multi_summary_response(response.text):
+                chunk_id = item.get('id')
+                summary = item.get('summary')
+                
+                if isinstance(chunk_id, int) and 0 <= chunk_id < len(chunks) \
+                        and isinstance(summary, str) and summary.strip():
+                    summaries[chunk_id] = self._trim_summary(summary)
+        
+        except Exception as e:
+            print(f"⚠️ Batched summary failed for {len(chunks)} chunks: {e}, falling back to single requests")
+        
+        for i, chunk in enumerate(chunks):
+            if summaries[i] is None:
+                summaries[i] = self._generate_summary(chunk, project_context)
+        
+        return summaries
+    
+    def _parse_multi_summary_response(self, response_text: str) -> List[Dict]:
+        """Parse the JSON array returned for a multi-chunk prompt"""
+        response_text = response_text.strip()
+        
+        if response_text.startswith("```"):
+            response_text = response_text.split("```")[1]
+            if response_text.startswith("json"):
+                response_text = response_text[4:]
+            response_text = response_text.strip()
+        
+        items = json.loads(response_text)
+        
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of summaries")
+        
+        return [item for item in items if isinstance(item, dict)]
+    
+    def _generate_summary(self, chunk: Dict, project_context: str) -> Optional[str]:
+        """Call Gemini for one chunk, returns None if the request failed"""
+        prompt = self._build_summary_prompt(chunk, project_context)
+        
+        try:
+            response = self._request(prompt, expected_summaries=1)
+            return self._trim_summary(response.text)
+            
+        except Exception as e:
+            print(f"⚠️ Summary failed for {chunk.get('chunk_name', 'unknown')}: {e}")
+            return None
+    
+    def _request(self, prompt: str, expected_summaries: int):
+        """Rate-limited Gemini call"""
+        self.rate_limiter.acquire(
+            estimate_tokens(prompt) + expected_summaries * SUMMARY_OUTPUT_TOKENS
+        )
+        
+        response = self.model.generate_content(prompt)
+        
+        with self._count_lock:
+            self.request_count += 1
+        
+        return response
+    
+    def _trim_summary(self, summary: str) -> str:
+        """Keep summary concise"""
+        summary = summary.strip()
+        if len(summary) > 150:
+            summary = summary[:147] + "..."
+        return summary
+    
+    def _fallback_summary(self, chunk: Dict) -> str:
+        """Simple description used when Gemini fails (never cached)"""
+        return f"{chunk.get('chunk_name', 'Code')} in {chunk.get('file_name', 'file')}"
+    
+    def _cache_key(self, chunk: Dict, project_context: str) -> str:
+        """sha256 of (model, hash of code, hash of project_context)"""
+        code_hash = hashlib.sha256(chunk.get('code', '').encode('utf-8', errors='ignore')).hexdigest()
+        context_hash = hashlib.sha256(project_context.encode('utf-8', errors='ignore')).hexdigest()
+        return hashlib.sha256(f"{self.model_name}:{code_hash}:{context_hash}".encode('utf-8')).hexdigest()
+    
+    def get_cached_summaries(self, chunks: List[Dict], project_context: str = "") -> Dict[int, str]:
+        """
+        Look up cached summaries
+        
+        Returns:
+            {index in chunks: summary} for every hit
+        """
+        if not self.use_cache or not chunks:
+            return {}
+        
+        keys = [self._cache_key(chunk, project_context) for chunk in chunks]
+        
+        try:
+            rows = dict(
+                ChunkSummaryCache.objects
+                .filter(key__in=set(keys))
+                .values_list('key', 'summary')
+            )
+            if rows:
+                ChunkSummaryCache.objects.filter(key__in=list(rows)).update(last_used_at=timezone.now())
+        except Exception as e:
+            print(f"⚠️ Summary cache lookup failed: {e}")
+            return {}
+        
+        found = {i: rows[key] for i, key in enumerate(keys) if key in rows}
+        self.cache_hits += len(found)
+        return found
+    
+    def cache_summaries(self, chunks: List[Dict], summaries: List[str], project_context: str = ""):
+        """Store generated summaries for chunks"""
+        if not self.use_cache or not chunks:
+            return
+        
+        entries = {}
+        for chunk, summary in zip(chunks, summaries):
+            key = self._cache_key(chunk, project_context)
+            entries[key] = ChunkSummaryCache(key=key, model_name=self.model_name, summary=summary)
+        
+        try:
+            ChunkSummaryCache.objects.bulk_create(
+                list(entries.values()),
+                batch_size=500,
+                ignore_conflicts=True
+            )
+        except Exception as e:
+            print(f"⚠️ Summary cache write failed: {e}")
+    
     def _build_summary_prompt(self, chunk: Dict, project_context: str) -> str:
         """Build prompt for Gemini summarization"""
         code = chunk.get('code', '')
@@ -106,6 +330,35 @@ Summarize in 15-20 words what this code does, mentioning the function/class name
 Summary:"""
         
         return prompt
+    
+    def _build_multi_summary_prompt(self, chunks: List[Dict], project_context: str) -> str:
+        """Build one prompt that asks for a JSON array of summaries"""
+        chunk_blocks = []
+        
+        for i, chunk in enumerate(chunks):
+            chunk_blocks.append(f"""### CHUNK {i}
+File: {chunk.get('file_name', '')}
+Function/Class: {chunk.get('chunk_name', 'Code')}
+
+{chunk.get('code', '')}""")
+        
+        chunks_text = "\n\n".join(chunk_blocks)
+        
+        prompt = f"""You are analyzing a codebase.
+
+PROJECT CONTEXT:
+{project_context if project_context else "No project description available."}
+
+CODE CHUNKS:
+{chunks_text}
+
+TASK:
+For EACH chunk above, summarize in 15-20 words what the code does, mentioning the function/class name and its purpose in the project context.
+
+Respond with ONLY a valid JSON array (no markdown, no extra text), one object per chunk, using the chunk numbers as ids:
+[{{"id": 0, "summary": "..."}}, {{"id": 1, "summary": "..."}}]"""
+        
+        return prompt
 
 
 def add_summaries_to_chunks(
@@ -0,0 +1,15 @@
+# apps/repo_ingest/exceptions.py
+"""
+Exceptions shared by the ingestion stages (kept free of imports so the
+summarizer and embedder can raise them without importing the pipeline)
+"""
+
+
+class IngestionCancelled(Exception):
+    """Raised when the job running an ingestion has been cancelled"""
+
+
+def check_cancelled(cancel_event, message: str = "Ingestion cancelled"):
+    """Raise IngestionCancelled once cancel_event (a threading.Event or None) is set"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise IngestionCancelled(message)
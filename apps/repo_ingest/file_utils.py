@@ -1,7 +1,13 @@
 # apps/repo_ingest/file_utils.py
+import hashlib
 import os
 import shutil
-from typing import List, Dict, Set
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Set, Tuple
+
+from .ignore_rules import IgnoreRules, IGNORE_RULE_FILES
 
 # Supported file extensions (from your desktop code)
 SUPPORTED_EXTENSIONS = {
@@ -43,6 +49,39 @@ IGNORE_FOLDERS = {
 }
 
 MAX_DEPTH = 2  # Maximum directory depth
+SCAN_WORKERS = int(os.getenv('INGEST_SCAN_WORKERS', '8'))  # Threads for top-level directories
+
+# Extraction limits for uploaded / downloaded archives
+MAX_FILE_SIZE = int(os.getenv('INGEST_MAX_FILE_SIZE', str(1024 * 1024)))  # 1 MB per file
+MAX_EXTRACT_SIZE = int(os.getenv('INGEST_MAX_EXTRACT_SIZE', str(200 * 1024 * 1024)))  # 200 MB total
+
+README_FILES = ['README.md', 'readme.md', 'README.MD', 'ReadMe.md']
+
+# Pre-parse filter: data-like formats get a tighter size cap than code
+MAX_DATA_FILE_SIZE = int(os.getenv('INGEST_MAX_DATA_FILE_SIZE', str(256 * 1024)))
+EXTENSION_MAX_SIZE = {
+    '.json': MAX_DATA_FILE_SIZE,
+    '.xml': MAX_DATA_FILE_SIZE,
+    '.html': 512 * 1024,
+    '.css': 256 * 1024,
+    '.scss': 256 * 1024,
+}
+SNIFF_BYTES = 4096  # Bytes sampled from the start of each file
+# Skipped after their content was looked at: still recorded with their blob SHA
+# (and no chunks), so ingestion and sync store the same RepositoryFile rows
+HASHED_SKIP_REASONS = ('binary', 'minified', 'generated')
+MAX_LINE_LENGTH = int(os.getenv('INGEST_MAX_LINE_LENGTH', '1000'))  # Longer lines = minified
+MINIFIED_SUFFIXES = ('.min.js', '.min.css', '.bundle.js', '.chunk.js')
+GENERATED_MARKERS = (
+    b'@generated',
+    b'do not edit',
+    b'code generated by',
+    b'auto-generated',
+    b'autogenerated by',
+    b'this file is generated',
+    b'this file was generated',
+    b'this file was automatically generated',
+)
 
 
 def is_supported_file(file_path: str) -> bool:
@@ -67,12 +106,98 @@ def get_depth(root: str, path: str) -> int:
     return os.path.relpath(path, root).count(os.sep)
 
 
-def scan_repository(repo_path: str) -> List[Dict]:
+def get_parts_depth(dir_parts: List[str]) -> int:
+    """Same depth as get_depth() for a directory given as path components"""
+    return max(len(dir_parts) - 1, 0)
+
+
+def is_ingestible_path(rel_path: str) -> bool:
     """
-    Scan repository and return list of supported code files
+    Whether scan_repository() would keep a repository-relative path ('/'-separated)
     
+    Applies the extension, ignored-folder and MAX_DEPTH rules without touching disk.
+    """
+    parts = rel_path.split('/')
+    return is_supported_file(parts[-1]) and _is_scanned_dir(parts[:-1])
+
+
+def is_ignore_rule_path(rel_path: str) -> bool:
+    """Whether rel_path is a .gitignore / .gitattributes that scan_repository() reads"""
+    parts = rel_path.split('/')
+    return parts[-1] in IGNORE_RULE_FILES and _is_scanned_dir(parts[:-1])
+
+
+def _is_scanned_dir(dir_parts: List[str]) -> bool:
+    """Whether scan_repository() descends into a directory given as path components"""
+    if any(should_ignore_folder(d) for d in dir_parts):
+        return False
+    return get_parts_depth(dir_parts) <= MAX_DEPTH
+
+
+def _scan_directory(dir_path: str, rel_dir: str, rules: IgnoreRules) -> List[Dict]:
+    """
+    Recursively scan one directory with os.scandir
+
+    Prunes ignored, too deep and .gitignore'd directories before descending,
+    skips linguist-generated files and takes sizes from the directory entries.
+
+    Args:
+        dir_path: Absolute directory path
+        rel_dir: Path relative to the repository root ('' for the root, '/'-separated)
+        rules: Ignore rules inherited from parent directories
+    """
+    try:
+        with os.scandir(dir_path) as it:
+            entries = list(it)
+    except OSError as e:
+        print(f"⚠️ Cannot scan {dir_path}: {e}")
+        return []
+
+    rules = rules.child(dir_path, rel_dir, {entry.name for entry in entries})
+    code_files = []
+
+    for entry in entries:
+        rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if (should_ignore_folder(entry.name)
+                        or get_parts_depth(rel_path.split('/')) > MAX_DEPTH
+                        or rules.is_ignored(rel_path, is_dir=True)):
+                    continue
+                code_files.extend(_scan_directory(entry.path, rel_path, rules))
+
+            elif entry.is_file() and is_supported_file(entry.name):
+                if rules.is_ignored(rel_path) or rules.is_generated(rel_path):
+                    continue
+
+                code_files.append({
+                    'absolute_path': entry.path,
+                    'relative_path': rel_path.replace('/', os.sep),
+                    'file_name': entry.name,
+                    'extension': os.path.splitext(entry.name)[1],
+                    'language': get_language(entry.name),
+                    'size': entry.stat().st_size
+                })
+        except OSError as e:
+            print(f"⚠️ Cannot stat {entry.path}: {e}")
+
+    return code_files
+
+
+def scan_repository(repo_path: str, workers: int = SCAN_WORKERS) -> List[Dict]:
+    """
+    Scan repository and return list of supported code files
+
+    Honours .gitignore and .gitattributes (linguist-generated) rules, and
+    scans top-level directories in parallel.
+
+    Args:
+        repo_path: Repository root
+        workers: Threads used for top-level directories (1 = sequential)
+
     Returns:
-        List of dicts with file info: {
+        List of dicts sorted by relative path, with file info: {
             'absolute_path': str,
             'relative_path': str,
             'extension': str,
@@ -80,32 +205,140 @@ def scan_repository(repo_path: str) -> List[Dict]:
             'size': int
         }
     """
+    try:
+        with os.scandir(repo_path) as it:
+            entries = list(it)
+    except OSError as e:
+        print(f"⚠️ Cannot scan {repo_path}: {e}")
+        return []
+
+    rules = IgnoreRules().child(repo_path, '', {entry.name for entry in entries})
     code_files = []
+    top_dirs = []
+
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if not should_ignore_folder(entry.name) and not rules.is_ignored(entry.name, is_dir=True):
+                    top_dirs.append(entry)
+            elif entry.is_file() and is_supported_file(entry.name):
+                if rules.is_ignored(entry.name) or rules.is_generated(entry.name):
+                    continue
+                code_files.append({
+                    'absolute_path': entry.path,
+                    'relative_path': entry.name,
+                    'file_name': entry.name,
+                    'extension': os.path.splitext(entry.name)[1],
+                    'language': get_language(entry.name),
+                    'size': entry.stat().st_size
+                })
+        except OSError as e:
+            print(f"⚠️ Cannot stat {entry.path}: {e}")
+
+    if workers > 1 and len(top_dirs) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(top_dirs))) as executor:
+            for files in executor.map(lambda d: _scan_directory(d.path, d.name, rules), top_dirs):
+                code_files.extend(files)
+    else:
+        for entry in top_dirs:
+            code_files.extend(_scan_directory(entry.path, entry.name, rules))
+
+    # Deterministic order keeps pipeline batches (and their checkpoints) stable
+    code_files.sort(key=lambda f: f['relative_path'])
+    return code_files
+
+
+def get_max_file_size(file_path: str) -> int:
+    """Size cap for a file, by extension"""
+    ext = os.path.splitext(file_path)[1].lower()
+    return min(EXTENSION_MAX_SIZE.get(ext, MAX_FILE_SIZE), MAX_FILE_SIZE)
+
+
+def get_skip_reason(file_path: str, size: int, sample: bytes) -> Optional[str]:
+    """
+    Cheap check for files that are not worth parsing
     
-    for subdir, dirs, files in os.walk(repo_path):
-        # Check depth limit
-        if get_depth(repo_path, subdir) > MAX_DEPTH:
-            continue
+    Args:
+        file_path: File name or path (for the extension)
+        size: Full file size in bytes
+        sample: The first SNIFF_BYTES of the file
+    
+    Returns:
+        'too_large', 'binary', 'minified' or 'generated', or None to keep the file
+    """
+    if size > get_max_file_size(file_path):
+        return 'too_large'
+    
+    if b'\0' in sample:
+        return 'binary'
+    
+    if file_path.lower().endswith(MINIFIED_SUFFIXES):
+        return 'minified'
+    
+    # A sample that is cut off mid-line only proves a long line if it is already too long
+    lines = sample.split(b'\n')
+    if any(len(line) > MAX_LINE_LENGTH for line in lines):
+        return 'minified'
+    
+    head = sample[:1024].lower()
+    if any(marker in head for marker in GENERATED_MARKERS):
+        return 'generated'
+    
+    return None
+
+
+def filter_code_files(code_files: List[Dict]) -> Tuple[List[Dict], Dict[str, str]]:
+    """
+    Drop binary, minified, generated and oversized files before parsing
+    
+    Only the first SNIFF_BYTES of each file are read.
+    
+    Returns:
+        (kept file dicts, {relative path ('/'-separated): skip reason})
+    """
+    kept = []
+    skipped = {}
+    
+    for file_info in code_files:
+        rel_path = file_info['relative_path'].replace(os.sep, '/')
+        sample = b''
         
-        # Filter out ignored directories (in-place modification)
-        dirs[:] = [d for d in dirs if not should_ignore_folder(d)]
+        if file_info['size'] <= get_max_file_size(rel_path):
+            try:
+                with open(file_info['absolute_path'], 'rb') as f:
+                    sample = f.read(SNIFF_BYTES)
+            except OSError as e:
+                print(f"⚠️ Could not read {rel_path}: {e}")
+                skipped[rel_path] = 'unreadable'
+                continue
         
-        # Process files
-        for file_name in files:
-            file_path = os.path.join(subdir, file_name)
-            
-            if is_supported_file(file_path):
-                rel_path = os.path.relpath(file_path, repo_path)
-                ext = os.path.splitext(file_name)[1]
-                
-                code_files.append({
-                    'absolute_path': file_path,
-                    'relative_path': rel_path,
-                    'file_name': file_name,
-                    'extension': ext,
-                    'language': get_language(file_path),
-                    'size': os.path.getsize(file_path)
-                })
+        reason = get_skip_reason(rel_path, file_info['size'], sample)
+        if reason:
+            skipped[rel_path] = reason
+        else:
+            kept.append(file_info)
+    
+    if skipped:
+        print(f"⏭️ Skipped {len(skipped)} files: {dict(Counter(skipped.values()))}")
+    
+    return kept, skipped
+
+
+def compute_blob_sha(data: bytes) -> str:
+    """Git blob SHA-1 of file content (same value GitHub reports for the file)"""
+    header = f"blob {len(data)}\0".encode('ascii')
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def add_file_hashes(code_files: List[Dict]) -> List[Dict]:
+    """Add 'file_hash' (git blob SHA-1) to every file dict from scan_repository()"""
+    for file_info in code_files:
+        try:
+            with open(file_info['absolute_path'], 'rb') as f:
+                file_info['file_hash'] = compute_blob_sha(f.read())
+        except OSError as e:
+            print(f"⚠️ Could not hash {file_info['relative_path']}: {e}")
+            file_info['file_hash'] = ''
     
     return code_files
 
@@ -151,11 +384,14 @@ def read_file_content(file_path: str) -> str:
     return ""
 
 
+def decode_file_content(data: bytes) -> str:
+    """Decode raw file bytes the same way read_file_content() reads files"""
+    return data.decode('utf-8', errors='ignore')
+
+
 def extract_project_context(repo_path: str) -> str:
     """Extract project context from README.md"""
-    readme_files = ['README.md', 'readme.md', 'README.MD', 'ReadMe.md']
-    
-    for readme_name in readme_files:
+    for readme_name in README_FILES:
         readme_path = os.path.join(repo_path, readme_name)
         if os.path.exists(readme_path):
             try:
@@ -169,3 +405,85 @@ def extract_project_context(repo_path: str) -> str:
     
     return "No project description available."
 
+
+
+def _get_archive_root(names: List[str]) -> str:
+    """Common top-level folder of an archive ('repo-main/'), or '' if none"""
+    first_parts = {name.split('/', 1)[0] for name in names}
+    if len(first_parts) == 1 and all('/' in name for name in names):
+        return first_parts.pop() + '/'
+    return ''
+
+
+def extract_zip_selective(zip_path: str, target_dir: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Extract only the archive members that scan_repository() would keep
+    
+    Members are streamed one by one. Ignored folders, unsupported files,
+    anything beyond MAX_DEPTH, files over MAX_FILE_SIZE and everything past
+    MAX_EXTRACT_SIZE in total are never written to disk. README files at
+    the root are kept for extract_project_context(), and .gitignore /
+    .gitattributes files wherever the scanner reads them.
+    
+    Args:
+        zip_path: Path to ZIP archive
+        target_dir: Directory to extract into
+    
+    Returns:
+        (path to the extracted repository root, {relative path: 'too_large'}
+        for ingestible files left out for their size, as GitHub sync
+        reports them)
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = [info for info in zip_ref.infolist() if not info.is_dir()]
+        root = _get_archive_root([info.filename for info in members])
+        extracted_path = os.path.join(target_dir, root.rstrip('/')) if root else target_dir
+        
+        kept = 0
+        total_size = 0
+        too_large = []
+        rule_files = {}
+        
+        for info in members:
+            rel_path = info.filename[len(root):]
+            parts = rel_path.split('/')
+            
+            # Never write outside target_dir (zip slip)
+            if not rel_path or rel_path.startswith('/') or '..' in parts:
+                continue
+            
+            is_readme = len(parts) == 1 and parts[0] in README_FILES
+            
+            if not (is_readme or is_ignore_rule_path(rel_path) or is_ingestible_path(rel_path)):
+                continue
+            
+            if info.file_size > MAX_FILE_SIZE:
+                print(f"⚠️ Skipping large file {rel_path} ({info.file_size / 1024:.0f} KB)")
+                if is_ingestible_path(rel_path):
+                    too_large.append(rel_path)
+                continue
+            
+            if total_size + info.file_size > MAX_EXTRACT_SIZE:
+                print(f"⚠️ Extraction limit reached ({MAX_EXTRACT_SIZE / 1024 / 1024:.0f} MB), skipping remaining files")
+                break
+            
+            dest_path = os.path.join(extracted_path, *parts)
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            
+            with zip_ref.open(info) as src, open(dest_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 64 * 1024)
+            
+            if is_ignore_rule_path(rel_path):
+                with open(dest_path, 'rb') as f:
+                    rule_files[rel_path] = decode_file_content(f.read())
+            
+            kept += 1
+            total_size += info.file_size
+    
+    os.makedirs(extracted_path, exist_ok=True)
+    print(f"✅ Extracted {kept}/{len(members)} files ({total_size / 1024 / 1024:.2f} MB)")
+    
+    # .gitignore'd / generated files are not reported, like the scanner drops them
+    rules = IgnoreRules.from_files(rule_files)
+    skipped = {path: 'too_large' for path in too_large if not rules.is_excluded(path)}
+    return extracted_path, skipped
@@ -4,20 +4,62 @@ GitHub repository operations - clone, sync, change detection
 """
 import requests
 import os
-import zipfile
 import tempfile
 import shutil
-from typing import Dict, List, Optional
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, quote
+from .file_utils import extract_zip_selective
+
+
+# Endpoints (overridable so the handler can be pointed at a local stand-in)
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', 'https://api.github.com').rstrip('/')
+GITHUB_RAW_URL = os.getenv('GITHUB_RAW_URL', 'https://raw.githubusercontent.com').rstrip('/')
+GITHUB_WEB_URL = os.getenv('GITHUB_WEB_URL', 'https://github.com').rstrip('/')
+
+# Concurrent raw file downloads per sync (also the connection pool size)
+GITHUB_FETCH_WORKERS = int(os.getenv('GITHUB_FETCH_WORKERS', '16'))
+
+
+def build_session(pool_size: int = GITHUB_FETCH_WORKERS) -> requests.Session:
+    """HTTP session with a keep-alive connection pool and retries on transient errors"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET',)
+        )
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
 class GitHubHandler:
     """Handle GitHub repository operations"""
     
-    def __init__(self, github_url: str, branch: str = "main"):
+    def __init__(
+        self,
+        github_url: str,
+        branch: str = "main",
+        session: Optional[requests.Session] = None,
+        api_url: str = GITHUB_API_URL,
+        raw_url: str = GITHUB_RAW_URL,
+        web_url: str = GITHUB_WEB_URL
+    ):
         self.github_url = github_url
         self.branch = branch
         self.owner, self.repo = self._parse_github_url(github_url)
+        self.session = session or build_session()
+        self.api_url = api_url.rstrip('/')
+        self.raw_url = raw_url.rstrip('/')
+        self.web_url = web_url.rstrip('/')
     
     def _parse_github_url(self, url: str) -> tuple:
         """
@@ -38,10 +80,10 @@ class GitHubHandler:
     
     def get_default_branch(self) -> str:
         """Get default branch name from GitHub API"""
-        api_url = f"https://api.github.com/repos/{self.owner}/{self.repo}"
+        api_url = f"{self.api_url}/repos/{self.owner}/{self.repo}"
         
         try:
-            response = requests.get(api_url, timeout=10)
+            response = self.session.get(api_url, timeout=10)
             response.raise_for_status()
             data = response.json()
             return data.get('default_branch', 'main')
@@ -52,10 +94,10 @@ class GitHubHandler:
     def get_latest_commit_sha(self, branch: Optional[str] = None) -> Optional[str]:
         """Get latest commit SHA for a branch"""
         branch = branch or self.branch
-        api_url = f"https://api.github.com/repos/{self.owner}/{self.repo}/commits/{branch}"
+        api_url = f"{self.api_url}/repos/{self.owner}/{self.repo}/commits/{branch}"
         
         try:
-            response = requests.get(api_url, timeout=10)
+            response = self.session.get(api_url, timeout=10)
             response.raise_for_status()
             data = response.json()
             return data['sha']
@@ -63,7 +105,91 @@ class GitHubHandler:
             print(f"❌ Failed to get commit SHA: {e}")
             return None
     
-    def download_as_zip(self, target_dir: str) -> str:
+    def check_latest_commit(self, etag: str = "", branch: Optional[str] = None) -> Tuple[bool, Optional[str], str]:
+        """
+        Conditional lookup of the branch head
+        
+        Sends If-None-Match with the stored ETag, so an unchanged branch costs
+        a single 304 (which GitHub does not count against the rate limit).
+        
+        Returns:
+            (modified, commit_sha, etag) - commit_sha is None when not modified
+        """
+        branch = branch or self.branch
+        api_url = f"{self.api_url}/repos/{self.owner}/{self.repo}/commits/{branch}"
+        headers = {'If-None-Match': etag} if etag else {}
+        
+        response = self.session.get(api_url, headers=headers, timeout=10)
+        
+        if response.status_code == 304:
+            return False, None, etag
+        
+        response.raise_for_status()
+        return True, response.json()['sha'], response.headers.get('ETag', '')
+    
+    def get_tree_files(self, ref: str, skip_dir: Optional[Callable[[str], bool]] = None) -> List[Dict]:
+        """
+        List every blob in the repository tree at ref
+        
+        Uses one recursive tree request. GitHub truncates very large recursive
+        listings; in that case the tree is walked level by level instead
+        (each subtree again tried recursively first).
+        
+        Args:
+            ref: Commit SHA (or tree SHA / branch)
+            skip_dir: Called with a directory path ('a/b'); True prunes it
+                from the level-by-level walk
+        
+        Returns:
+            [{'path': str, 'sha': str, 'size': int}] for every file
+        """
+        data = self._get_tree(ref, recursive=True)
+        
+        if not data.get('truncated'):
+            return self._tree_blobs(data, "")
+        
+        print("⚠️ Tree listing truncated, walking subtrees")
+        return self._walk_tree(ref, "", skip_dir)
+    
+    def _get_tree(self, sha: str, recursive: bool) -> Dict:
+        api_url = f"{self.api_url}/repos/{self.owner}/{self.repo}/git/trees/{quote(sha, safe='')}"
+        params = {'recursive': '1'} if recursive else None
+        
+        response = self.session.get(api_url, params=params, timeout=60)
+        response.raise_for_status()
+        return response.json()
+    
+    def _walk_tree(self, sha: str, prefix: str, skip_dir: Optional[Callable[[str], bool]]) -> List[Dict]:
+        """Non-recursive listing of one level, descending into each subtree"""
+        files = []
+        
+        for entry in self._get_tree(sha, recursive=False).get('tree', []):
+            path = prefix + entry['path']
+            
+            if entry['type'] == 'blob':
+                files.append({'path': path, 'sha': entry['sha'], 'size': entry.get('size', 0)})
+            
+            elif entry['type'] == 'tree':
+                if skip_dir and skip_dir(path):
+                    continue
+                
+                subtree = self._get_tree(entry['sha'], recursive=True)
+                if subtree.get('truncated'):
+                    files.extend(self._walk_tree(entry['sha'], path + '/', skip_dir))
+                else:
+                    files.extend(self._tree_blobs(subtree, path + '/'))
+        
+        return files
+    
+    @staticmethod
+    def _tree_blobs(data: Dict, prefix: str) -> List[Dict]:
+        return [
+            {'path': prefix + entry['path'], 'sha': entry['sha'], 'size': entry.get('size', 0)}
+            for entry in data.get('tree', [])
+            if entry['type'] == 'blob'
+        ]
+    
+    def download_as_zip(self, target_dir: str) -> Tuple[str, Dict[str, str]]:
         """
         Download repository as ZIP and extract
         
@@ -71,16 +197,17 @@ class GitHubHandler:
             target_dir: Directory to extract ZIP contents
         
         Returns:
-            Path to extracted directory
+            (path to extracted directory, {relative path: skip reason} of
+            files left out during extraction)
         """
         # GitHub ZIP download URL
-        zip_url = f"https://github.com/{self.owner}/{self.repo}/archive/refs/heads/{self.branch}.zip"
+        zip_url = f"{self.web_url}/{self.owner}/{self.repo}/archive/refs/heads/{self.branch}.zip"
         
         print(f"📥 Downloading {self.owner}/{self.repo} from GitHub...")
         
         try:
             # Download ZIP file
-            response = requests.get(zip_url, timeout=60, stream=True)
+            response = self.session.get(zip_url, timeout=60, stream=True)
             response.raise_for_status()
             
             # Save to temporary file
@@ -91,64 +218,69 @@ class GitHubHandler:
             
             print(f"✅ Downloaded ZIP ({os.path.getsize(tmp_zip_path) / 1024 / 1024:.2f} MB)")
             
-            # Extract ZIP
-            with zipfile.ZipFile(tmp_zip_path, 'r') as zip_ref:
-                zip_ref.extractall(target_dir)
-            
-            os.remove(tmp_zip_path)
-            
-            # GitHub ZIP creates a subdirectory: repo-branch/
-            # Find the extracted directory
-            extracted_items = os.listdir(target_dir)
-            if len(extracted_items) == 1 and os.path.isdir(os.path.join(target_dir, extracted_items[0])):
-                extracted_path = os.path.join(target_dir, extracted_items[0])
-            else:
-                extracted_path = target_dir
+            # Extract only the files we will actually ingest
+            # (GitHub ZIP creates a subdirectory: repo-branch/)
+            try:
+                extracted_path, skipped = extract_zip_selective(tmp_zip_path, target_dir)
+            finally:
+                os.remove(tmp_zip_path)
             
             print(f"✅ Extracted to: {extracted_path}")
-            return extracted_path
+            return extracted_path, skipped
             
         except Exception as e:
             print(f"❌ Failed to download from GitHub: {e}")
             raise
     
-    def get_changed_files(self, base_commit: str, head_commit: str) -> List[Dict]:
+    def fetch_file(self, file_path: str, ref: Optional[str] = None) -> Optional[bytes]:
         """
-        Get list of changed files between two commits
+        Fetch one file's raw bytes (no base64 round trip, no temp file)
         
         Args:
-            base_commit: Base commit SHA
-            head_commit: Head commit SHA
+            file_path: Path within repository
+            ref: Commit SHA or branch (default: self.branch)
         
         Returns:
-            List of changed files with status: [{
-                'filename': str,
-                'status': 'added' | 'modified' | 'removed',
-                'changes': int
-            }]
+            File content, or None if it could not be fetched
         """
-        api_url = f"https://api.github.com/repos/{self.owner}/{self.repo}/compare/{base_commit}...{head_commit}"
+        ref = ref or self.branch
+        raw_url = f"{self.raw_url}/{self.owner}/{self.repo}/{quote(ref, safe='')}/{quote(file_path)}"
         
         try:
-            response = requests.get(api_url, timeout=30)
+            response = self.session.get(raw_url, timeout=30)
             response.raise_for_status()
-            data = response.json()
-            
-            changed_files = []
-            for file_data in data.get('files', []):
-                changed_files.append({
-                    'filename': file_data['filename'],
-                    'status': file_data['status'],
-                    'changes': file_data.get('changes', 0),
-                    'additions': file_data.get('additions', 0),
-                    'deletions': file_data.get('deletions', 0)
-                })
-            
-            return changed_files
-            
+            return response.content
         except Exception as e:
-            print(f"❌ Failed to get changed files: {e}")
-            return []
+            print(f"⚠️ Failed to download {file_path}: {e}")
+            return None
+    
+    def fetch_files(
+        self,
+        file_paths: List[str],
+        ref: Optional[str] = None,
+        workers: int = GITHUB_FETCH_WORKERS
+    ) -> Dict[str, bytes]:
+        """
+        Fetch many files concurrently over the pooled session
+        
+        Args:
+            file_paths: Paths within repository
+            ref: Commit SHA or branch (pin to a commit so every file comes from the same tree)
+            workers: Parallel downloads
+        
+        Returns:
+            {file_path: content} for every file that was fetched
+        """
+        if not file_paths:
+            return {}
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(file_paths)))) as executor:
+            contents = executor.map(lambda path: self.fetch_file(path, ref), file_paths)
+            return {
+                path: content
+                for path, content in zip(file_paths, contents)
+                if content is not None
+            }
     
     def download_single_file(self, file_path: str, target_path: str) -> bool:
         """
@@ -161,27 +293,16 @@ class GitHubHandler:
         Returns:
             True if successful
         """
-        api_url = f"https://api.github.com/repos/{self.owner}/{self.repo}/contents/{file_path}?ref={self.branch}"
+        content = self.fetch_file(file_path)
         
-        try:
-            response = requests.get(api_url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Decode base64 content
-            import base64
-            content = base64.b64decode(data['content'])
-            
-            # Save to file
-            os.makedirs(os.path.dirname(target_path), exist_ok=True)
-            with open(target_path, 'wb') as f:
-                f.write(content)
-            
-            return True
-            
-        except Exception as e:
-            print(f"⚠️ Failed to download {file_path}: {e}")
+        if content is None:
             return False
+        
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(target_path, 'wb') as f:
+            f.write(content)
+        
+        return True
 
 
 def clone_github_repo(github_url: str, target_dir: str, branch: str = "main") -> tuple:
@@ -189,7 +310,8 @@ def clone_github_repo(github_url: str, target_dir: str, branch: str = "main") ->
     Clone GitHub repository to target directory
     
     Returns:
-        (extracted_path, commit_sha)
+        (extracted_path, commit_sha, {relative path: skip reason} of files
+        left out during extraction)
     """
     handler = GitHubHandler(github_url, branch)
     
@@ -197,7 +319,7 @@ def clone_github_repo(github_url: str, target_dir: str, branch: str = "main") ->
     commit_sha = handler.get_latest_commit_sha()
     
     # Download and extract
-    extracted_path = handler.download_as_zip(target_dir)
+    extracted_path, skipped = handler.download_as_zip(target_dir)
     
-    return extracted_path, commit_sha
+    return extracted_path, commit_sha, skipped
 
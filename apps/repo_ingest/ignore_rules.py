@@ -0,0 +1,239 @@
+# apps/repo_ingest/ignore_rules.py
+"""
+Minimal .gitignore / .gitattributes matching for the repository scanner
+
+Supports the subset of gitignore syntax that real repositories use: comments,
+negation (!), directory-only patterns (trailing /), anchored patterns
+(containing /), *, ?, [...] and **. Rules from nested files apply below their
+own directory and later rules win, as in git.
+
+From .gitattributes only `linguist-generated` is read: files marked as
+generated are skipped like ignored ones.
+
+The scanner reads the rule files while walking the disk; GitHub sync builds
+the same rules from tree blobs with IgnoreRules.from_files(), so ingestion
+and sync agree on which files exist.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+GITIGNORE = '.gitignore'
+GITATTRIBUTES = '.gitattributes'
+IGNORE_RULE_FILES = (GITIGNORE, GITATTRIBUTES)
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob (without anchoring) to a regex body"""
+    i, n = 0, len(pattern)
+    out = []
+
+    while i < n:
+        c = pattern[i]
+
+        if c == '*':
+            if pattern[i:i + 3] == '**/':
+                out.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern[i:i + 2] == '**':
+                out.append('.*')
+                i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append(f'[{body}]')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+
+    return ''.join(out)
+
+
+class _Rule:
+    """One compiled pattern, relative to the directory of the file it came from"""
+
+    __slots__ = ('base', 'regex', 'negate', 'dir_only')
+
+    def __init__(self, base: str, pattern: str, negate: bool = False):
+        self.base = base
+        self.negate = negate
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+
+        # A slash anywhere but the end anchors the pattern to base
+        if '/' in pattern:
+            body = _translate(pattern.lstrip('/'))
+        else:
+            body = '(?:.*/)?' + _translate(pattern)
+
+        # Matching a directory also matches everything inside it
+        self.regex = re.compile(f'^{body}(?:/.*)?$' if not self.dir_only else f'^{body}$', re.DOTALL)
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+
+        if self.base:
+            if not rel_path.startswith(self.base + '/'):
+                return False
+            rel_path = rel_path[len(self.base) + 1:]
+
+        return self.regex.match(rel_path) is not None
+
+
+class IgnoreRules:
+    """
+    Immutable chain of ignore / generated rules
+
+    child() returns a new object for a subdirectory, so parallel scans of
+    different subtrees can share their parents' rules safely.
+    """
+
+    def __init__(self, ignore: Tuple[_Rule, ...] = (), generated: Tuple[Tuple[_Rule, bool], ...] = ()):
+        self.ignore = ignore
+        self.generated = generated
+
+    @classmethod
+    def from_files(cls, files: Dict[str, str]) -> 'IgnoreRules':
+        """
+        Build the rules of a whole repository from rule file contents
+
+        Args:
+            files: {repository-relative path of a .gitignore / .gitattributes: content}
+
+        Returns:
+            Flat rules for is_excluded(); parent directories come before
+            their children, so later rules still win
+        """
+        by_dir: Dict[str, Dict[str, str]] = {}
+        for path, content in files.items():
+            rel_dir, _, name = path.rpartition('/')
+            if name in IGNORE_RULE_FILES:
+                by_dir.setdefault(rel_dir, {})[name] = content
+
+        rules = cls()
+        for rel_dir in sorted(by_dir, key=lambda d: (d.count('/') + 1 if d else 0, d)):
+            rules = rules._extend(rel_dir, by_dir[rel_dir])
+        return rules
+
+    def child(self, dir_path: str, rel_dir: str, names) -> 'IgnoreRules':
+        """
+        Add the rules of dir_path's own .gitignore / .gitattributes
+
+        Args:
+            dir_path: Absolute directory path
+            rel_dir: Repository-relative directory ('' for the root, '/'-separated)
+            names: Entry names in the directory (avoids stat calls for missing files)
+        """
+        return self._extend(rel_dir, {
+            name: self._read_text(os.path.join(dir_path, name))
+            for name in IGNORE_RULE_FILES
+            if name in names
+        })
+
+    def _extend(self, rel_dir: str, contents: Dict[str, str]) -> 'IgnoreRules':
+        """Add the rules of one directory ({rule file name: content})"""
+        ignore, generated = self.ignore, self.generated
+
+        if GITIGNORE in contents:
+            ignore = ignore + tuple(self._parse_gitignore(contents[GITIGNORE], rel_dir))
+
+        if GITATTRIBUTES in contents:
+            generated = generated + tuple(self._parse_gitattributes(contents[GITATTRIBUTES], rel_dir))
+
+        if ignore is self.ignore and generated is self.generated:
+            return self
+        return IgnoreRules(ignore, generated)
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        """Whether .gitignore excludes rel_path (last matching rule wins)"""
+        ignored = False
+        for rule in self.ignore:
+            if rule.matches(rel_path, is_dir):
+                ignored = not rule.negate
+        return ignored
+
+    def is_generated(self, rel_path: str) -> bool:
+        """Whether .gitattributes marks rel_path as linguist-generated"""
+        generated = False
+        for rule, value in self.generated:
+            if rule.matches(rel_path, False):
+                generated = value
+        return generated
+
+    def is_excluded(self, rel_path: str) -> bool:
+        """
+        Whether scan_repository() would drop a file, for a flat path listing
+
+        A file below an ignored directory is excluded even if a deeper rule
+        re-includes it, matching the scanner, which never descends there.
+        """
+        parts = rel_path.split('/')
+        for i in range(1, len(parts)):
+            if self.is_ignored('/'.join(parts[:i]), is_dir=True):
+                return True
+        return self.is_ignored(rel_path) or self.is_generated(rel_path)
+
+    @staticmethod
+    def _read_text(path: str) -> str:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    @staticmethod
+    def _parse_gitignore(content: str, base: str) -> List[_Rule]:
+        rules = []
+
+        for line in content.splitlines():
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            elif line.startswith('\\'):
+                line = line[1:]
+
+            if line:
+                rules.append(_Rule(base, line, negate))
+
+        return rules
+
+    @staticmethod
+    def _parse_gitattributes(content: str, base: str) -> List[Tuple[_Rule, bool]]:
+        rules = []
+
+        for line in content.splitlines():
+            parts = line.split()
+            if len(parts) < 2 or parts[0].startswith('#'):
+                continue
+
+            value: Optional[bool] = None
+            for attr in parts[1:]:
+                if attr in ('linguist-generated', 'linguist-generated=true'):
+                    value = True
+                elif attr in ('-linguist-generated', '!linguist-generated', 'linguist-generated=false'):
+                    value = False
+
+            if value is not None:
+                rules.append((_Rule(base, parts[0]), value))
+
+        return rules
@@ -0,0 +1,341 @@
+# apps/repo_ingest/jobs.py
+"""
+Durable ingestion job queue
+
+Web requests only enqueue IngestionJob rows; the run_ingest_worker management
+command claims them (row locking where the database supports it), runs them
+with bounded concurrency, heartbeats while they run and retries failures with
+exponential backoff. Jobs whose worker disappears are re-queued once their
+heartbeat goes stale.
+
+At most one job per repository runs at a time: claims lock the repository
+row, and a partial unique constraint backs this up. Every status write of a
+running job is fenced on its owner (worker and attempt), so a worker whose
+job was re-queued cannot overwrite the next attempt.
+"""
+from .models import Repository, IngestionJob
+from .exceptions import IngestionCancelled
+from django.db import connection, transaction, close_old_connections, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from typing import Optional
+import os
+import shutil
+import tempfile
+import threading
+import traceback
+
+
+JOB_HEARTBEAT_INTERVAL = int(os.getenv('JOB_HEARTBEAT_INTERVAL', '15'))  # seconds
+JOB_HEARTBEAT_TIMEOUT = int(os.getenv('JOB_HEARTBEAT_TIMEOUT', '120'))  # seconds without heartbeat = worker gone
+JOB_RETRY_BASE_DELAY = int(os.getenv('JOB_RETRY_BASE_DELAY', '30'))  # seconds, doubled per attempt
+JOB_RETRY_MAX_DELAY = int(os.getenv('JOB_RETRY_MAX_DELAY', '1800'))
+
+
+def enqueue_job(repository: Repository, job_type: str, payload: Optional[dict] = None) -> IngestionJob:
+    """Queue a job for a repository and show it as queued"""
+    job = IngestionJob.objects.create(
+        repository=repository,
+        job_type=job_type,
+        payload=payload or {}
+    )
+    repository.update_progress('queued', 'Waiting for a worker', 0)
+    return job
+
+
+def has_active_job(repository: Repository) -> bool:
+    """Whether a job for this repository is queued or running"""
+    return repository.jobs.filter(status__in=IngestionJob.ACTIVE_STATUSES).exists()
+
+
+def retry_last_job(repository: Repository) -> Optional[IngestionJob]:
+    """
+    Re-queue the repository's most recent failed or cancelled job
+
+    The new job resumes from the checkpoints the failed attempt left behind.
+    """
+    last_job = repository.jobs.order_by('-created_at').first()
+
+    if last_job is None or last_job.status not in ('failed', 'cancelled'):
+        return None
+
+    if last_job.job_type == 'zip_upload' and not repository.zip_file:
+        return None
+
+    return enqueue_job(
+        repository,
+        last_job.job_type,
+        {**last_job.payload, 'resume': True}
+    )
+
+
+def cancel_jobs(repository: Repository) -> int:
+    """
+    Cancel the repository's active jobs
+
+    Queued jobs are cancelled at once; running jobs are flagged and stop at
+    their worker's next heartbeat.
+
+    Returns:
+        Number of jobs cancelled or flagged
+    """
+    now = timezone.now()
+    cancelled = repository.jobs.filter(status='queued').update(
+        status='cancelled',
+        cancel_requested=True,
+        finished_at=now
+    )
+    flagged = repository.jobs.filter(status='running').update(cancel_requested=True)
+
+    if cancelled and not flagged:
+        repository.mark_as_failed('Cancelled')
+
+    return cancelled + flagged
+
+
+def claim_job(worker_id: str) -> Optional[IngestionJob]:
+    """
+    Claim the next runnable job
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED where the database supports it, so
+    concurrent workers never block on or double-claim a row, and locks the
+    job's Repository row before checking that nothing else runs for it. Two
+    workers claiming different jobs of one repository are serialized there:
+    the second sees the first job running and moves on. Otherwise falls back
+    to an optimistic conditional UPDATE on status, with the
+    one_running_job_per_repository constraint rejecting a second claim.
+    """
+    now = timezone.now()
+    runnable = (
+        IngestionJob.objects
+        .filter(status='queued', run_after__lte=now)
+        .exclude(repository__jobs__status='running')
+        .order_by('run_after', 'created_at')
+    )
+    claim = {
+        'status': 'running',
+        'locked_by': worker_id,
+        'heartbeat_at': now,
+        'started_at': now,
+        'attempts': F('attempts') + 1,
+    }
+
+    job_id = None
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            candidates = runnable.select_for_update(skip_locked=True, of=('self',))[:10]
+
+            for job in candidates:
+                # Blocks while another worker claims a job of this repository
+                list(Repository.objects.select_for_update().filter(id=job.repository_id).values_list('id', flat=True))
+
+                if IngestionJob.objects.filter(repository_id=job.repository_id, status='running').exists():
+                    continue
+
+                IngestionJob.objects.filter(id=job.id).update(**claim)
+                job_id = job.id
+                break
+    else:
+        for candidate_id in runnable.values_list('id', flat=True)[:10]:
+            try:
+                with transaction.atomic():
+                    if IngestionJob.objects.filter(id=candidate_id, status='queued').update(**claim):
+                        job_id = candidate_id
+                        break
+            except IntegrityError:
+                # Another job of this repository started running first
+                continue
+
+    if job_id is None:
+        return None
+    return IngestionJob.objects.select_related('repository').get(id=job_id)
+
+
+def requeue_stale_jobs() -> int:
+    """Put running jobs whose worker stopped heartbeating back in the queue"""
+    cutoff = timezone.now() - timedelta(seconds=JOB_HEARTBEAT_TIMEOUT)
+    stale = IngestionJob.objects.filter(status='running', heartbeat_at__lt=cutoff)
+
+    requeued = 0
+    for job in stale:
+        if job.attempts >= job.max_attempts:
+            updated = IngestionJob.objects.filter(id=job.id, status='running').update(
+                status='failed',
+                last_error='Worker stopped responding',
+                finished_at=timezone.now()
+            )
+            if updated:
+                job.repository.mark_as_failed('Worker stopped responding')
+        else:
+            updated = IngestionJob.objects.filter(id=job.id, status='running').update(
+                status='queued',
+                locked_by='',
+                run_after=timezone.now()
+            )
+        requeued += updated
+
+    if requeued:
+        print(f"♻️ Recovered {requeued} stale jobs")
+    return requeued
+
+
+def retry_delay(attempts: int) -> int:
+    """Exponential backoff in seconds for the given attempt number"""
+    return min(JOB_RETRY_BASE_DELAY * (2 ** max(attempts - 1, 0)), JOB_RETRY_MAX_DELAY)
+
+
+class JobRunner:
+    """Run one claimed job with a heartbeat thread and retry bookkeeping"""
+
+    def __init__(self, job: IngestionJob, worker_id: str):
+        self.job = job
+        self.worker_id = worker_id
+        self.cancel_event = threading.Event()
+        self.lost = threading.Event()  # Set once the job no longer belongs to this run
+        self._stop_heartbeat = threading.Event()
+
+    def _owned(self):
+        """This run's job, as long as it is still running under this worker and attempt"""
+        return IngestionJob.objects.filter(
+            id=self.job.id,
+            status='running',
+            locked_by=self.worker_id,
+            attempts=self.job.attempts
+        )
+
+    def run(self):
+        heartbeat = threading.Thread(
+            target=self._heartbeat,
+            name=f"job-heartbeat-{self.job.id}",
+            daemon=True
+        )
+        heartbeat.start()
+
+        print(f"▶️ Job {self.job.id} ({self.job.job_type}) attempt {self.job.attempts}/{self.job.max_attempts}")
+
+        try:
+            self._execute()
+        except IngestionCancelled:
+            if self._finish('cancelled', 'Cancelled'):
+                self.job.repository.mark_as_failed('Cancelled')
+        except Exception as e:
+            traceback.print_exc()
+            self._fail(e)
+        else:
+            self._finish('succeeded')
+        finally:
+            self._stop_heartbeat.set()
+            heartbeat.join()
+            close_old_connections()
+            connection.close()
+
+    def _execute(self):
+        job = self.job
+        repository = job.repository
+
+        # Retries pick up from the checkpoints of the failed attempt
+        resume = job.attempts > 1 or job.payload.get('resume', False)
+
+        if job.job_type == 'zip_upload':
+            from .processing import RepositoryProcessor
+
+            zip_path = self._download_zip(repository)
+            try:
+                RepositoryProcessor(repository, cancel_event=self.cancel_event).process_zip_upload(
+                    zip_path,
+                    incremental=job.payload.get('incremental', False),
+                    resume=resume
+                )
+            finally:
+                os.remove(zip_path)
+
+            # The archive is only needed until it has been ingested
+            repository.zip_file.delete(save=True)
+
+        elif job.job_type == 'github_clone':
+            from .processing import RepositoryProcessor
+
+            RepositoryProcessor(repository, cancel_event=self.cancel_event).process_github_url(
+                repository.github_url,
+                repository.github_branch,
+                resume=resume
+            )
+
+        elif job.job_type == 'github_sync':
+            from .sync_views import GitHubSyncer
+
+            GitHubSyncer(repository, cancel_event=self.cancel_event).sync()
+
+        else:
+            raise ValueError(f"Unknown job type: {job.job_type}")
+
+    def _download_zip(self, repository: Repository) -> str:
+        """Copy the stored upload to a local temp file"""
+        if not repository.zip_file:
+            raise ValueError("Repository has no stored ZIP file")
+
+        with repository.zip_file.open('rb') as src, \
+                tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+            return dst.name
+
+    def _heartbeat(self):
+        """Refresh heartbeat_at and pick up cancel requests until the job ends"""
+        try:
+            while not self._stop_heartbeat.wait(JOB_HEARTBEAT_INTERVAL):
+                if not self._owned().update(heartbeat_at=timezone.now()):
+                    self._lose()
+                    return
+
+                if self._owned().filter(cancel_requested=True).exists():
+                    print(f"⏹️ Cancel requested for job {self.job.id}")
+                    self.cancel_event.set()
+        finally:
+            connection.close()
+
+    def _lose(self):
+        """Stop a run whose job was re-queued as stale or finished elsewhere"""
+        if not self.lost.is_set():
+            print(f"⚠️ Job {self.job.id} attempt {self.job.attempts} is no longer owned by {self.worker_id}, stopping")
+            self.lost.set()
+            self.cancel_event.set()
+
+    def _finish(self, status: str, error: str = '') -> bool:
+        """
+        Record the final status
+
+        Returns:
+            False if the job no longer belongs to this run (nothing was written)
+        """
+        updated = self._owned().update(
+            status=status,
+            last_error=error,
+            finished_at=timezone.now()
+        )
+        if not updated:
+            self._lose()
+            return False
+
+        print(f"⏹️ Job {self.job.id} {status}")
+        return True
+
+    def _fail(self, error: Exception):
+        job = self.job
+
+        if job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            updated = self._owned().update(
+                status='queued',
+                locked_by='',
+                last_error=str(error),
+                run_after=timezone.now() + timedelta(seconds=delay)
+            )
+            if not updated:
+                self._lose()
+                return
+            job.repository.update_progress('queued', f'Failed, retrying in {delay}s: {error}', 0)
+            print(f"🔁 Job {job.id} failed, retrying in {delay}s")
+        elif self._finish('failed', str(error)):
+            job.repository.mark_as_failed(error)
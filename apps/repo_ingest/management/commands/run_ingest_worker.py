@@ -0,0 +1,85 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.repo_ingest.jobs import claim_job, requeue_stale_jobs, JobRunner
+
+
+class Command(BaseCommand):
+    help = 'Run queued repository ingestion and sync jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=int(os.getenv('INGEST_WORKER_CONCURRENCY', '2')),
+            help='Jobs run at the same time by this worker (default: 2)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds between queue polls when idle (default: 2)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty and running jobs have finished',
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            self.stdout.write(self.style.WARNING('Stopping: no new jobs will be claimed'))
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Ingest worker {worker_id} started (concurrency {concurrency})'
+        ))
+
+        running = []
+
+        while not stopping.is_set():
+            running = [thread for thread in running if thread.is_alive()]
+            claimed = False
+
+            try:
+                close_old_connections()
+                requeue_stale_jobs()
+
+                while len(running) < concurrency:
+                    job = claim_job(worker_id)
+                    if job is None:
+                        break
+
+                    thread = threading.Thread(
+                        target=JobRunner(job, worker_id).run,
+                        name=f"job-{job.id}",
+                        daemon=True
+                    )
+                    thread.start()
+                    running.append(thread)
+                    claimed = True
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Queue poll failed: {e}'))
+
+            if options['once'] and not claimed and not running:
+                break
+
+            if not claimed:
+                stopping.wait(options['poll_interval'])
+
+        # Let running jobs finish; anything cut off is re-queued by its stale heartbeat
+        for thread in running:
+            thread.join()
+
+        self.stdout.write(self.style.SUCCESS('✅ Ingest worker stopped'))
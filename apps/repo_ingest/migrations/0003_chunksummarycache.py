@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 09:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repo_ingest', '0002_repository_suggested_prompts_repository_zip_file_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkSummaryCache',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('model_name', models.CharField(max_length=100)),
+                ('summary', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
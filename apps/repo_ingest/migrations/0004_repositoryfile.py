@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repo_ingest', '0003_chunksummarycache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepositoryFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=500)),
+                ('file_hash', models.CharField(max_length=40)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='repo_ingest.repository')),
+            ],
+            options={
+                'ordering': ['file_path'],
+                'unique_together': {('repository', 'file_path')},
+            },
+        ),
+    ]
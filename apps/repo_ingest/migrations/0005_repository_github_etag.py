@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repo_ingest', '0004_repositoryfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='github_etag',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-17 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repo_ingest', '0006_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_index', models.IntegerField()),
+                ('stage', models.CharField(choices=[('summarized', 'Summarized'), ('indexed', 'Indexed'), ('saved', 'Saved')], max_length=20)),
+                ('start_index', models.IntegerField(default=1)),
+                ('files', models.JSONField(default=dict)),
+                ('summaries', models.JSONField(blank=True, default=list)),
+                ('doc_ids', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='repo_ingest.repository')),
+            ],
+            options={
+                'ordering': ['batch_index'],
+                'unique_together': {('repository', 'batch_index')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repo_ingest', '0007_ingestioncheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='ingest_stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repo_ingest', '0008_repository_ingest_stats'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='ingestionjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'running')), fields=('repository',), name='one_running_job_per_repository'),
+        ),
+    ]
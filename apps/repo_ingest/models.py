@@ -2,10 +2,23 @@
 # apps/repo_ingest/models.py
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.utils import timezone
+import os
+import time
 import uuid
 
 
+# Progress is written to the DB at most this often (status changes always are)
+PROGRESS_WRITE_INTERVAL = float(os.getenv('PROGRESS_WRITE_INTERVAL', '2'))
+PROGRESS_CACHE_TIMEOUT = 3600  # seconds
+SKIPPED_FILES_LIMIT = 1000  # Skipped paths kept in ingest_stats (counts cover all)
+
+
+def progress_cache_key(repo_id) -> str:
+    return f"repo_progress:{repo_id}"
+
+
 class Repository(models.Model):
     """Repository uploaded by user"""
     
@@ -16,6 +29,7 @@ class Repository(models.Model):
     
     STATUS_CHOICES = [
         ('uploading', 'Uploading'),
+        ('queued', 'Queued'),
         ('processing', 'Processing'),
         ('parsing', 'Parsing Code'),
         ('embedding', 'Generating Embeddings'),
@@ -35,6 +49,7 @@ class Repository(models.Model):
     github_branch = models.CharField(max_length=100, default='main', blank=True)
     zip_file = models.FileField(upload_to='uploads/', blank=True)
     last_commit_sha = models.CharField(max_length=40, blank=True, null=True)  # For smart sync
+    github_etag = models.CharField(max_length=200, blank=True)  # ETag of the last branch lookup
     
     # Storage
     storage_path = models.CharField(max_length=500, blank=True)  # Cloud Storage path
@@ -50,6 +65,7 @@ class Repository(models.Model):
     total_files = models.IntegerField(default=0)
     total_chunks = models.IntegerField(default=0)
     total_lines = models.IntegerField(default=0)
+    ingest_stats = models.JSONField(default=dict, blank=True)  # Skipped files and reasons
     
     # Project context
     project_context = models.TextField(blank=True)  # README or user input
@@ -72,15 +88,84 @@ class Repository(models.Model):
         """Mark repository as failed with error message"""
         self.status = 'failed'
         self.error_message = str(error)
-        self.save()
+        self.updated_at = timezone.now()
+        self.save(update_fields=['status', 'error_message', 'updated_at'])
+        self._progress_written(time.monotonic())
+        self.publish_progress()
+    
+    def record_skipped_files(self, skipped, replace_paths=None):
+        """
+        Store files the pre-parse filter skipped in ingest_stats
+        
+        Args:
+            skipped: {file_path: reason} found in this run
+            replace_paths: None for a full ingestion (replaces everything);
+                otherwise only these paths' earlier entries are dropped (sync)
+        """
+        stats = dict(self.ingest_stats or {})
+        
+        if replace_paths is None:
+            files = {}
+        else:
+            files = {
+                path: reason for path, reason in stats.get('skipped_files', {}).items()
+                if path not in replace_paths
+            }
+        files.update(skipped)
+        
+        by_reason = {}
+        for reason in files.values():
+            by_reason[reason] = by_reason.get(reason, 0) + 1
+        
+        stats['skipped_total'] = len(files)
+        stats['skipped_by_reason'] = by_reason
+        stats['skipped_files'] = dict(sorted(files.items())[:SKIPPED_FILES_LIMIT])
+        
+        self.ingest_stats = stats
+        self.save(update_fields=['ingest_stats'])
     
-    def update_progress(self, status, step, percentage):
-        """Update processing progress"""
+    def update_progress(self, status, step, percentage, force=False):
+        """
+        Update processing progress
+        
+        Every update is published to the cache for the progress stream. The
+        row itself is only written (progress fields only) when the status
+        changes, when forced, or once PROGRESS_WRITE_INTERVAL has passed, so
+        tight loops cost no more than a write every couple of seconds.
+        """
         self.status = status
         self.current_step = step
         self.progress_percentage = percentage
         self.updated_at = timezone.now()
-        self.save()
+        self.publish_progress()
+        
+        now = time.monotonic()
+        written_status, written_at = getattr(self, '_progress_write_state', (None, 0.0))
+        
+        if force or status != written_status or now - written_at >= PROGRESS_WRITE_INTERVAL:
+            self.save(update_fields=['status', 'current_step', 'progress_percentage', 'updated_at'])
+            self._progress_written(now)
+    
+    def _progress_written(self, now):
+        self._progress_write_state = (self.status, now)
+    
+    def progress_snapshot(self):
+        """Fields shown on the status page"""
+        return {
+            'status': self.status,
+            'current_step': self.current_step,
+            'progress_percentage': self.progress_percentage,
+            'error_message': self.error_message,
+            'total_files': self.total_files,
+            'total_chunks': self.total_chunks,
+        }
+    
+    def publish_progress(self):
+        """Push the current progress to the cache (read by the progress stream)"""
+        try:
+            cache.set(progress_cache_key(self.id), self.progress_snapshot(), PROGRESS_CACHE_TIMEOUT)
+        except Exception as e:
+            print(f"⚠️ Progress publish failed: {e}")
 
 
 class CodeChunk(models.Model):
@@ -115,3 +200,132 @@ class CodeChunk(models.Model):
     
     def __str__(self):
         return f"{self.chunk_name} ({self.file_name})"
+
+
+class RepositoryFile(models.Model):
+    """Per-file content hash, used to re-ingest only changed files"""
+    
+    repository = models.ForeignKey(Repository, on_delete=models.CASCADE, related_name='files')
+    file_path = models.CharField(max_length=500)  # Repository-relative path
+    file_hash = models.CharField(max_length=40)  # Git blob SHA-1 of file content
+    chunk_count = models.IntegerField(default=0)
+    
+    # Timestamps
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['file_path']
+        unique_together = [('repository', 'file_path')]
+    
+    def __str__(self):
+        return f"{self.file_path} ({self.file_hash[:7]})"
+
+
+class IngestionJob(models.Model):
+    """Durable background job, claimed and run by the run_ingest_worker command"""
+    
+    JOB_TYPE_CHOICES = [
+        ('zip_upload', 'ZIP Upload'),
+        ('github_clone', 'GitHub Clone'),
+        ('github_sync', 'GitHub Sync'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    ACTIVE_STATUSES = ('queued', 'running')
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    repository = models.ForeignKey(Repository, on_delete=models.CASCADE, related_name='jobs')
+    job_type = models.CharField(max_length=20, choices=JOB_TYPE_CHOICES)
+    payload = models.JSONField(default=dict, blank=True)  # e.g. {'incremental': True}
+    
+    # Scheduling
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    run_after = models.DateTimeField(default=timezone.now)  # Backoff between retries
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    
+    # Worker ownership
+    locked_by = models.CharField(max_length=200, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+        constraints = [
+            # Two running jobs on one repository would race on its chunks and index
+            models.UniqueConstraint(
+                fields=['repository'],
+                condition=models.Q(status='running'),
+                name='one_running_job_per_repository',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.job_type} {self.repository_id} ({self.status})"
+
+
+class IngestionCheckpoint(models.Model):
+    """
+    Progress of one pipeline batch, so a failed ingestion can resume
+    
+    Each batch is recorded after summarizing, after indexing and after
+    saving. A retry skips saved batches and re-enters the others at the
+    stage after the last one recorded.
+    """
+    
+    STAGE_CHOICES = [
+        ('summarized', 'Summarized'),
+        ('indexed', 'Indexed'),
+        ('saved', 'Saved'),
+    ]
+    
+    repository = models.ForeignKey(Repository, on_delete=models.CASCADE, related_name='checkpoints')
+    batch_index = models.IntegerField()
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES)
+    start_index = models.IntegerField(default=1)  # chunk_id of the batch's first chunk
+    
+    # {file_path: {'hash': blob SHA, 'chunks': n}} for every file in the batch
+    files = models.JSONField(default=dict)
+    summaries = models.JSONField(default=list, blank=True)  # Per chunk, in order
+    doc_ids = models.JSONField(default=list, blank=True)  # Per chunk, in order
+    
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['batch_index']
+        unique_together = [('repository', 'batch_index')]
+    
+    def __str__(self):
+        return f"{self.repository_id} batch {self.batch_index} ({self.stage})"
+
+
+class ChunkSummaryCache(models.Model):
+    """Chunk summary cached by (model, hash of code, hash of project context)"""
+    
+    key = models.CharField(max_length=64, primary_key=True)  # sha256 hex
+    model_name = models.CharField(max_length=100)
+    summary = models.TextField()
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.model_name} {self.key[:12]}: {self.summary[:50]}"
@@ -0,0 +1,525 @@
+# apps/repo_ingest/pipeline.py
+"""
+Streaming ingestion pipeline - parse → summarize → embed → ES bulk → DB bulk_create
+
+Each stage runs in its own thread and hands fixed-size batches to the next
+stage through a bounded queue, so only a few batches are ever held in memory
+and the first chunks are searchable long before the last file is parsed.
+
+Every batch is checkpointed (IngestionCheckpoint) after it is summarized,
+indexed and saved. A resumed run skips saved batches and re-enters the
+others after their last completed stage.
+"""
+from .models import Repository, CodeChunk, RepositoryFile, IngestionCheckpoint
+from .tree_sitter_parser import iter_parse_repository
+from .chunk_summarizer import ChunkSummarizer
+from .chunk_embedder import ChunkEmbedder, EMBED_BATCH_MAX_ITEMS, EMBED_CONCURRENCY
+from .exceptions import check_cancelled
+from apps.rag_search.vector_store import LocalVectorIndex
+from django.db import connections, transaction
+from django.utils import timezone
+from typing import List, Dict, Callable, Optional, Iterable, Tuple
+from itertools import islice
+import os
+import queue
+import threading
+
+
+PIPELINE_BATCH_SIZE = int(os.getenv('PIPELINE_BATCH_SIZE', '50'))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '4'))
+# Chunks the embed stage gathers from waiting batches (fills every concurrent request)
+EMBED_GROUP_CHUNKS = EMBED_BATCH_MAX_ITEMS * EMBED_CONCURRENCY
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage has already failed"""
+
+
+def save_chunks_to_db(repository: Repository, chunks: List[Dict]) -> int:
+    """Save chunk dicts as CodeChunk rows, returns number of rows created"""
+    chunk_objects = []
+
+    for chunk in chunks:
+        chunk_obj = CodeChunk(
+            repository=repository,
+            file_path=chunk.get('file_path', ''),
+            file_name=chunk.get('file_name', ''),
+            language=chunk.get('language', 'text'),
+            chunk_type=chunk.get('chunk_type', 'function'),
+            chunk_name=chunk.get('chunk_name', 'anonymous'),
+            code=chunk.get('code', ''),
+            summary=chunk.get('summary', ''),
+            start_line=chunk.get('start_line', 0),
+            end_line=chunk.get('end_line', 0),
+            es_doc_id=chunk.get('es_doc_id', '')
+        )
+        chunk_objects.append(chunk_obj)
+
+    # Bulk create
+    CodeChunk.objects.bulk_create(chunk_objects, batch_size=500)
+    return len(chunk_objects)
+
+
+def save_file_records(repository: Repository, records: Iterable[Tuple[str, str, int]]):
+    """Upsert RepositoryFile rows from (file_path, file_hash, chunk_count) tuples"""
+    now = timezone.now()
+    rows = [
+        RepositoryFile(
+            repository=repository,
+            file_path=file_path,
+            file_hash=file_hash,
+            chunk_count=chunk_count,
+            updated_at=now
+        )
+        for file_path, file_hash, chunk_count in records
+    ]
+
+    RepositoryFile.objects.bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['repository', 'file_path'],
+        update_fields=['file_hash', 'chunk_count', 'updated_at']
+    )
+
+
+def sync_local_index(repository: Repository):
+    """Trim the repository's local vector index to the chunks saved in the DB"""
+    doc_ids = (
+        CodeChunk.objects
+        .filter(repository=repository)
+        .exclude(es_doc_id='')
+        .values_list('es_doc_id', flat=True)
+    )
+    deleted = LocalVectorIndex(repository.id).retain(doc_ids.iterator())
+    if deleted:
+        print(f"🗑️ Removed {deleted} outdated vectors from the local index")
+
+
+def _repo_path(file_info: Dict) -> str:
+    return file_info['relative_path'].replace(os.sep, '/')
+
+
+class IngestionPipeline:
+    """Run the ingestion stages concurrently over bounded queues"""
+
+    def __init__(
+        self,
+        repository: Repository,
+        repo_path: str,
+        project_context: str = "",
+        batch_size: int = PIPELINE_BATCH_SIZE,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        cancel_event: Optional[threading.Event] = None
+    ):
+        self.repository = repository
+        self.repo_path = repo_path
+        self.project_context = project_context
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.cancel_event = cancel_event
+
+        self.summarizer = ChunkSummarizer(cancel_event=cancel_event)
+        self.embedder = ChunkEmbedder(cancel_event=cancel_event)
+
+        self._failed = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'total_files': 0,
+            'parsed_files': 0,
+            'total_chunks': 0,
+            'indexed': 0,
+            'unchanged': 0,
+            'failed': 0,
+            'saved': 0,
+        }
+
+        # Filled in as the pipeline runs (and from saved checkpoints when resuming)
+        self.file_chunk_counts: Dict[str, int] = {}  # relative_path -> chunks parsed
+        self.doc_ids = set()  # ES ids of every chunk that is now indexed
+
+        # Checkpoint state
+        self.saved_files = set()  # Files of fully saved batches (skipped on resume)
+        self._pending_checkpoints: List[IngestionCheckpoint] = []
+        self._failed_doc_ids = set()  # Ids the last bulk request holding them failed to index
+        self._next_batch_index = 0
+        self._next_chunk_id = 1
+
+    # ------------------------------------------------------------------
+    # Checkpoints
+    # ------------------------------------------------------------------
+
+    def clear_checkpoints(self):
+        """Forget any earlier attempt (fresh run, or after a successful one)"""
+        IngestionCheckpoint.objects.filter(repository=self.repository).delete()
+
+    def resume_from_checkpoints(self, code_files: List[Dict]) -> int:
+        """
+        Load the checkpoints of a failed attempt
+
+        Checkpoints are only trusted if every file they cover still has the
+        same content hash; otherwise they are discarded and the run starts
+        over.
+
+        Returns:
+            Number of saved batches that will be skipped
+        """
+        checkpoints = list(IngestionCheckpoint.objects.filter(repository=self.repository))
+        hashes = {_repo_path(f): f.get('file_hash', '') for f in code_files}
+
+        for checkpoint in checkpoints:
+            for path, info in checkpoint.files.items():
+                if hashes.get(path) != info.get('hash'):
+                    print(f"⚠️ {path} changed since the last attempt, discarding checkpoints")
+                    self.clear_checkpoints()
+                    return 0
+
+        saved = 0
+        for checkpoint in checkpoints:
+            chunk_total = sum(info.get('chunks', 0) for info in checkpoint.files.values())
+            self._next_batch_index = max(self._next_batch_index, checkpoint.batch_index + 1)
+            self._next_chunk_id = max(self._next_chunk_id, checkpoint.start_index + chunk_total)
+
+            if checkpoint.stage == 'saved':
+                saved += 1
+                for path, info in checkpoint.files.items():
+                    self.saved_files.add(path)
+                    self.file_chunk_counts[path] = info.get('chunks', 0)
+                self.doc_ids.update(doc_id for doc_id in checkpoint.doc_ids if doc_id)
+                self.stats['saved'] += chunk_total
+            else:
+                self._pending_checkpoints.append(checkpoint)
+
+        print(f"⏩ Resuming: {saved} batches saved, {len(self._pending_checkpoints)} partially done")
+        return saved
+
+    def _checkpoint(self, batch: Dict, stage: str, **fields):
+        IngestionCheckpoint.objects.update_or_create(
+            repository=self.repository,
+            batch_index=batch['index'],
+            defaults={
+                'stage': stage,
+                'start_index': batch['start_index'],
+                'files': batch['files'],
+                **fields
+            }
+        )
+        batch['stage'] = stage
+
+    def run(self, code_files: List[Dict]) -> Dict:
+        """
+        Stream code_files through every stage and wait for completion
+
+        Args:
+            code_files: List of file dicts from scan_repository()
+
+        Returns:
+            Stats dict (total_chunks, indexed, failed, saved, ...)
+        """
+        self.stats['total_files'] = len(code_files)
+        self.stats['parsed_files'] = sum(1 for f in code_files if _repo_path(f) in self.saved_files)
+
+        parsed_q = queue.Queue(maxsize=self.queue_size)
+        summarized_q = queue.Queue(maxsize=self.queue_size)
+        embedded_q = queue.Queue(maxsize=self.queue_size)
+        indexed_q = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            self._start('parse', self._parse_stage, code_files, parsed_q),
+            self._start('summarize', self._group_stage, self._summarize_batches, self._summarize_group_chunks(), parsed_q, summarized_q),
+            self._start('embed', self._group_stage, self._embed_batches, EMBED_GROUP_CHUNKS, summarized_q, embedded_q),
+            self._start('es-bulk', self._transform_stage, self._index_batch, embedded_q, indexed_q),
+            self._start('db-bulk', self._transform_stage, self._save_batch, indexed_q, None),
+        ]
+
+        for thread in threads:
+            thread.join()
+        self.embedder.close()
+
+        if self._error is not None:
+            raise self._error
+
+        self.stats['unchanged'] = self.embedder.skipped_count
+        return self.stats
+
+    # ------------------------------------------------------------------
+    # Stage plumbing
+    # ------------------------------------------------------------------
+
+    def _start(self, name: str, target: Callable, *args) -> threading.Thread:
+        thread = threading.Thread(
+            target=self._run_stage,
+            args=(name, target) + args,
+            name=f"ingest-{name}-{self.repository.id}",
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _run_stage(self, name: str, target: Callable, *args):
+        """Run a stage, record the first failure and always signal downstream"""
+        out_q = args[-1]
+        try:
+            target(*args)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            print(f"❌ Pipeline stage '{name}' failed: {e}")
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+            self._failed.set()
+        finally:
+            if out_q is not None:
+                self._put(out_q, _DONE, force=True)
+            connections.close_all()
+
+    def _put(self, out_q: queue.Queue, item, force: bool = False):
+        """Blocking put that gives up once another stage has failed"""
+        while True:
+            if self._failed.is_set() and not force:
+                raise PipelineAborted()
+            try:
+                out_q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if force and self._failed.is_set():
+                    # Downstream is draining or gone; drop whatever is queued
+                    try:
+                        out_q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def _transform_stage(self, fn: Callable, in_q: queue.Queue, out_q: Optional[queue.Queue]):
+        """Apply fn to every batch from in_q and forward the result"""
+        while True:
+            batch = in_q.get()
+            if batch is _DONE:
+                return
+            if self._failed.is_set():
+                # Keep draining so upstream never blocks on a full queue
+                continue
+            result = fn(batch)
+            if out_q is not None:
+                self._put(out_q, result)
+
+    def _group_stage(self, fn: Callable, min_chunks: int, in_q: queue.Queue, out_q: Optional[queue.Queue]):
+        """
+        Apply fn to groups of batches and forward each batch
+
+        After one batch arrives, batches already waiting in in_q are added
+        (without waiting for more) until the group holds min_chunks chunks,
+        so a stage that fans out requests can keep them all busy.
+        """
+        done = False
+        while not done:
+            group = [in_q.get()]
+            if group[0] is _DONE:
+                return
+
+            total = len(group[0]['chunks'])
+            while total < min_chunks:
+                try:
+                    batch = in_q.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is _DONE:
+                    done = True
+                    break
+                group.append(batch)
+                total += len(batch['chunks'])
+
+            if self._failed.is_set():
+                # Keep draining so upstream never blocks on a full queue
+                continue
+            for result in fn(group):
+                if out_q is not None:
+                    self._put(out_q, result)
+
+    # ------------------------------------------------------------------
+    # Stages
+    # ------------------------------------------------------------------
+
+    def _parse_stage(self, code_files: List[Dict], out_q: queue.Queue):
+        """Parse files in order and emit batches of ~batch_size chunks"""
+        # Partially done batches are rebuilt from their checkpointed files first
+        by_path = {_repo_path(f): f for f in code_files}
+        claimed = set(self.saved_files)
+        groups = []
+
+        for checkpoint in self._pending_checkpoints:
+            files = [by_path[path] for path in checkpoint.files if path in by_path]
+            if files:
+                groups.append((checkpoint, files))
+                claimed.update(checkpoint.files)
+
+        rest = [f for f in code_files if _repo_path(f) not in claimed]
+        ordered = [f for _, files in groups for f in files] + rest
+
+        parsed = iter_parse_repository(self.repo_path, ordered, self.project_context)
+        results = zip(ordered, parsed)
+
+        try:
+            for checkpoint, files in groups:
+                chunks, file_info_map = [], {}
+                for file_info, file_chunks in islice(results, len(files)):
+                    self._record_file(file_info, file_chunks, file_info_map)
+                    chunks.extend(file_chunks)
+                self._put(out_q, self._make_batch(chunks, file_info_map, checkpoint))
+
+            pending, file_info_map = [], {}
+            for file_info, file_chunks in results:
+                self._record_file(file_info, file_chunks, file_info_map)
+                pending.extend(file_chunks)
+
+                if len(pending) >= self.batch_size:
+                    self._put(out_q, self._make_batch(pending, file_info_map))
+                    pending, file_info_map = [], {}
+        finally:
+            # Shuts the parser pool down if we stop early
+            parsed.close()
+
+        if pending or file_info_map:
+            self._put(out_q, self._make_batch(pending, file_info_map))
+
+    def _record_file(self, file_info: Dict, file_chunks: List[Dict], file_info_map: Dict):
+        if self._failed.is_set():
+            raise PipelineAborted()
+        check_cancelled(self.cancel_event)
+
+        path = _repo_path(file_info)
+        self.stats['parsed_files'] += 1
+        self.file_chunk_counts[path] = len(file_chunks)
+        file_info_map[path] = {'hash': file_info.get('file_hash', ''), 'chunks': len(file_chunks)}
+
+    def _make_batch(
+        self,
+        chunks: List[Dict],
+        files: Dict,
+        checkpoint: Optional[IngestionCheckpoint] = None
+    ) -> Dict:
+        self.stats['total_chunks'] += len(chunks)
+
+        if checkpoint is not None:
+            return {
+                'index': checkpoint.batch_index,
+                'start_index': checkpoint.start_index,
+                'files': files,
+                'chunks': chunks,
+                'parsed_files': self.stats['parsed_files'],
+                'documents': None,
+                'stage': checkpoint.stage,
+                'summaries': checkpoint.summaries,
+                'doc_ids': checkpoint.doc_ids,
+            }
+
+        batch = {
+            'index': self._next_batch_index,
+            'start_index': self._next_chunk_id,
+            'files': files,
+            'chunks': chunks,
+            'parsed_files': self.stats['parsed_files'],
+            'documents': None,
+            'stage': None,
+            'summaries': [],
+            'doc_ids': [],
+        }
+        self._next_batch_index += 1
+        self._next_chunk_id += len(chunks)
+        return batch
+
+    def _summarize_group_chunks(self) -> int:
+        """Chunks per summarize call that fill every concurrent prompt slot"""
+        return self.summarizer.concurrency * self.summarizer.chunks_per_prompt
+
+    def _summarize_batches(self, batches: List[Dict]) -> List[Dict]:
+        """Summarize several batches in one call, so their prompts run concurrently"""
+        pending = []
+
+        for batch in batches:
+            chunks = batch['chunks']
+            if batch['stage'] is not None and len(batch['summaries']) == len(chunks):
+                for chunk, summary in zip(chunks, batch['summaries']):
+                    chunk['summary'] = summary
+            else:
+                pending.append(batch)
+
+        if pending:
+            self.summarizer.summarize_chunks_batch(
+                [chunk for batch in pending for chunk in batch['chunks']],
+                self.project_context
+            )
+            for batch in pending:
+                self._checkpoint(batch, 'summarized', summaries=[c.get('summary', '') for c in batch['chunks']])
+
+        return batches
+
+    def _embed_batches(self, batches: List[Dict]) -> List[Dict]:
+        """Embed several batches with shared, fully packed embedding requests"""
+        pending = []
+
+        for batch in batches:
+            if batch['stage'] == 'indexed' and len(batch['doc_ids']) == len(batch['chunks']) and all(batch['doc_ids']):
+                # Every chunk already in Elasticsearch (batches with failed
+                # chunks are embedded again; their indexed chunks are skipped by id)
+                for chunk, doc_id in zip(batch['chunks'], batch['doc_ids']):
+                    chunk['es_doc_id'] = doc_id
+                batch['documents'] = []
+            else:
+                pending.append(batch)
+
+        if pending:
+            documents = self.embedder.build_documents_for_batches(
+                [(batch['chunks'], batch['start_index']) for batch in pending],
+                repository_id=str(self.repository.id),
+                repository_name=self.repository.name,
+                user_id=self.repository.user_id
+            )
+            for batch, batch_documents in zip(pending, documents):
+                batch['documents'] = batch_documents
+
+        return batches
+
+    def _index_batch(self, batch: Dict) -> Dict:
+        if batch['documents']:
+            success, failed_ids = self.embedder.index_documents(batch['documents'])
+            self.stats['indexed'] += success
+            self.stats['failed'] += len(failed_ids)
+
+            self._failed_doc_ids -= {doc['id'] for doc in batch['documents']}
+            self._failed_doc_ids |= failed_ids
+
+        # Chunks whose document failed (here, or in an earlier batch holding
+        # the same content) are checkpointed and saved without an id, so a
+        # resumed run embeds and indexes them again
+        for chunk in batch['chunks']:
+            if chunk.get('es_doc_id') in self._failed_doc_ids:
+                chunk['es_doc_id'] = ''
+
+        if batch['stage'] != 'indexed' or batch['documents']:
+            self._checkpoint(batch, 'indexed', doc_ids=[c.get('es_doc_id', '') for c in batch['chunks']])
+
+        # Vectors are no longer needed once they are in Elasticsearch
+        batch['documents'] = None
+        return batch
+
+    def _save_batch(self, batch: Dict):
+        # Rows and the 'saved' checkpoint commit together, so a retry never duplicates rows
+        with transaction.atomic():
+            self.stats['saved'] += save_chunks_to_db(self.repository, batch['chunks'])
+            self._checkpoint(batch, 'saved')
+
+        self.doc_ids.update(chunk['es_doc_id'] for chunk in batch['chunks'] if chunk.get('es_doc_id'))
+
+        total_files = self.stats['total_files'] or 1
+        progress = 30 + (batch['parsed_files'] * 65 // total_files)
+        self.repository.update_progress(
+            'indexing',
+            f"Indexed {self.stats['saved']} chunks ({batch['parsed_files']}/{total_files} files)",
+            min(progress, 95)
+        )
@@ -2,37 +2,47 @@
 """
 Main processing orchestrator - handles complete ingestion pipeline
 """
-from .models import Repository, CodeChunk
+from .models import Repository, CodeChunk, RepositoryFile
 from .file_utils import (
     scan_repository, 
     extract_project_context,
     cleanup_temp_directory,
-    get_repository_stats
+    get_repository_stats,
+    extract_zip_selective,
+    add_file_hashes,
+    filter_code_files,
+    HASHED_SKIP_REASONS
 )
-from .tree_sitter_parser import parse_repository
-from .chunk_summarizer import add_summaries_to_chunks
-from .chunk_embedder import ChunkEmbedder
+from .pipeline import IngestionPipeline, save_file_records, sync_local_index
 from .github_utils import clone_github_repo
+from apps.rag_search.embedding_cache import EmbeddingCache
+from apps.rag_search.es_ops import ElasticsearchManager
+from apps.rag_search.vector_store import uses_local_index
 import os
 import shutil
-import zipfile
 from django.utils import timezone
 
 
 class RepositoryProcessor:
     """Process repository ingestion from start to finish"""
     
-    def __init__(self, repository: Repository):
+    def __init__(self, repository: Repository, cancel_event=None):
         self.repository = repository
+        self.cancel_event = cancel_event  # threading.Event set when the job is cancelled
         self.temp_dir = None
         self.extracted_path = None
+        self.extraction_skipped = {}  # relative path -> reason, for files never extracted
+        self._changed_paths = []
     
-    def process_zip_upload(self, zip_file_path: str):
+    def process_zip_upload(self, zip_file_path: str, incremental: bool = False, resume: bool = False):
         """
         Process uploaded ZIP file
         
         Args:
             zip_file_path: Path to uploaded ZIP file
+            incremental: Re-upload of an existing repository - only process
+                files whose content hash changed
+            resume: Continue from the checkpoints of a failed attempt
         """
         try:
             # Create temp directory
@@ -41,22 +51,14 @@ class RepositoryProcessor:
             
             self.repository.update_progress('processing', 'Extracting ZIP file', 5)
             
-            # Extract ZIP
-            with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-                zip_ref.extractall(self.temp_dir)
-            
-            # Find extracted directory
-            items = os.listdir(self.temp_dir)
-            if len(items) == 1 and os.path.isdir(os.path.join(self.temp_dir, items[0])):
-                self.extracted_path = os.path.join(self.temp_dir, items[0])
-            else:
-                self.extracted_path = self.temp_dir
+            # Extract only the files we will actually ingest
+            self.extracted_path, self.extraction_skipped = extract_zip_selective(zip_file_path, self.temp_dir)
             
             self.repository.local_path = self.extracted_path
-            self.repository.save()
+            self.repository.save(update_fields=['local_path'])
             
             # Continue with processing
-            self._process_repository()
+            self._process_repository(incremental=incremental, resume=resume)
 
             self._generate_prompts()
             
@@ -66,13 +68,14 @@ class RepositoryProcessor:
         finally:
             self._cleanup()
     
-    def process_github_url(self, github_url: str, branch: str = "main"):
+    def process_github_url(self, github_url: str, branch: str = "main", resume: bool = False):
         """
         Process GitHub repository URL
         
         Args:
             github_url: GitHub repository URL
             branch: Branch name to clone
+            resume: Continue from the checkpoints of a failed attempt
         """
         try:
             # Create temp directory
@@ -82,7 +85,7 @@ class RepositoryProcessor:
             self.repository.update_progress('processing', 'Downloading from GitHub', 5)
             
             # Clone repository
-            self.extracted_path, commit_sha = clone_github_repo(
+            self.extracted_path, commit_sha, self.extraction_skipped = clone_github_repo(
                 github_url, 
                 self.temp_dir,
                 branch
@@ -93,10 +96,10 @@ class RepositoryProcessor:
             self.repository.github_branch = branch
             self.repository.last_commit_sha = commit_sha
             self.repository.local_path = self.extracted_path
-            self.repository.save()
+            self.repository.save(update_fields=['github_url', 'github_branch', 'last_commit_sha', 'local_path'])
             
             # Continue with processing
-            self._process_repository()
+            self._process_repository(resume=resume)
             
             self._generate_prompts()
 
@@ -106,22 +109,31 @@ class RepositoryProcessor:
         finally:
             self._cleanup()
     
-    def _process_repository(self):
+    def _process_repository(self, incremental: bool = False, resume: bool = False):
         """Main processing pipeline"""
         try:
             # Step 1: Extract project context
             self.repository.update_progress('processing', 'Reading project context', 10)
             project_context = extract_project_context(self.extracted_path)
             self.repository.project_context = project_context
-            self.repository.save()
+            self.repository.save(update_fields=['project_context'])
             
             # Step 2: Scan for code files
             self.repository.update_progress('processing', 'Scanning code files', 20)
-            code_files = scan_repository(self.extracted_path)
+            scanned_files = scan_repository(self.extracted_path)
+            code_files, skipped = filter_code_files(scanned_files)
+            code_files = add_file_hashes(code_files)
+            skipped_files = add_file_hashes([
+                f for f in scanned_files
+                if skipped.get(f['relative_path'].replace(os.sep, '/')) in HASHED_SKIP_REASONS
+            ])
             stats = get_repository_stats(code_files)
             
+            # Files too large to extract are reported like GitHub sync reports them
+            self.repository.record_skipped_files({**self.extraction_skipped, **skipped})
+            
             self.repository.total_files = stats['total_files']
-            self.repository.save()
+            self.repository.save(update_fields=['total_files'])
             
             print(f"📊 Found {len(code_files)} code files")
             print(f"   Languages: {stats['by_language']}")
@@ -129,72 +141,166 @@ class RepositoryProcessor:
             if len(code_files) == 0:
                 raise ValueError("No supported code files found in repository")
             
-            # Step 3: Parse with Tree-sitter
-            self.repository.update_progress('parsing', 'Parsing code with Tree-sitter', 30)
-            chunks = parse_repository(self.extracted_path, code_files, project_context)
+            pipeline = IngestionPipeline(
+                repository=self.repository,
+                repo_path=self.extracted_path,
+                project_context=project_context,
+                cancel_event=self.cancel_event
+            )
             
-            print(f"🔍 Extracted {len(chunks)} code chunks")
+            if resume:
+                pipeline.resume_from_checkpoints(code_files)
+            else:
+                pipeline.clear_checkpoints()
             
-            if len(chunks) == 0:
-                raise ValueError("No code chunks extracted from repository")
+            if incremental:
+                files_to_process = self._prepare_incremental(
+                    code_files,
+                    keep_paths=pipeline.saved_files,
+                    skipped_files=skipped_files
+                )
+            else:
+                if not pipeline.saved_files:
+                    # Nothing from an earlier attempt to keep
+                    CodeChunk.objects.filter(repository=self.repository).delete()
+                    RepositoryFile.objects.filter(repository=self.repository).delete()
+                files_to_process = code_files
             
-            self.repository.total_chunks = len(chunks)
-            self.repository.save()
-            
-            # Step 4: Generate summaries
-            self.repository.update_progress('embedding', 'Generating summaries', 50)
-            chunks = add_summaries_to_chunks(chunks, project_context)
-            
-            # Step 5: Generate embeddings and index
-            self.repository.update_progress('indexing', 'Indexing to Elasticsearch', 70)
-            embedder = ChunkEmbedder()
-            success_count, failed_count = embedder.embed_and_index_chunks(
-                chunks=chunks,
-                repository_id=str(self.repository.id),
-                repository_name=self.repository.name,
-                user_id=self.repository.user.id
-            )
+            # Steps 3-6: Parse → summarize → embed → index → save, streamed in batches
+            self.repository.update_progress('parsing', 'Parsing, embedding and indexing code', 30)
+            result = pipeline.run(files_to_process)
             
-            # Step 6: Save chunks to database
-            self.repository.update_progress('indexing', 'Saving to database', 90)
-            self._save_chunks_to_db(chunks)
+            print(f"🔍 Extracted {result['total_chunks']} code chunks")
+            
+            if incremental:
+                self._finish_incremental(pipeline)
+            
+            # Skipped files get a row without chunks, as GitHub sync records them
+            self._save_file_hashes(files_to_process + skipped_files, pipeline.file_chunk_counts)
+            pipeline.clear_checkpoints()
+            
+            if uses_local_index():
+                sync_local_index(self.repository)
+            
+            total_chunks = CodeChunk.objects.filter(repository=self.repository).count()
+            
+            if total_chunks == 0:
+                raise ValueError("No code chunks extracted from repository")
+            
+            self.repository.total_chunks = total_chunks
+            self.repository.last_synced_at = timezone.now()
+            self.repository.save(update_fields=['total_chunks', 'last_synced_at'])
             
             # Mark as completed
             self.repository.update_progress('completed', 'Processing complete', 100)
-            self.repository.last_synced_at = timezone.now()
-            self.repository.save()
             
             print(f"✅ Repository processing complete!")
-            print(f"   Total chunks: {len(chunks)}")
-            print(f"   Indexed: {success_count}, Failed: {failed_count}")
+            print(f"   Total chunks: {total_chunks} ({result['total_chunks']} parsed this run)")
+            print(f"   Indexed: {result['indexed']}, Unchanged: {result['unchanged']}, Failed: {result['failed']}")
+            
+            cache_stats = EmbeddingCache.get_stats()
+            print(f"   Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
             
         except Exception as e:
             print(f"❌ Processing failed: {e}")
             self.repository.mark_as_failed(e)
             raise
     
-    def _save_chunks_to_db(self, chunks: list):
-        """Save chunks to Django database"""
-        chunk_objects = []
+    def _prepare_incremental(
+        self,
+        code_files: list,
+        keep_paths: set = frozenset(),
+        skipped_files: list = ()
+    ) -> list:
+        """
+        Diff scanned files against stored hashes and drop stale chunks
         
-        for chunk in chunks:
-            chunk_obj = CodeChunk(
-                repository=self.repository,
-                file_path=chunk.get('file_path', ''),
-                file_name=chunk.get('file_name', ''),
-                language=chunk.get('language', 'text'),
-                chunk_type=chunk.get('chunk_type', 'function'),
-                chunk_name=chunk.get('chunk_name', 'anonymous'),
-                code=chunk.get('code', ''),
-                summary=chunk.get('summary', ''),
-                start_line=chunk.get('start_line', 0),
-                end_line=chunk.get('end_line', 0)
+        Args:
+            keep_paths: Files already re-ingested by a failed attempt (their
+                new chunks are kept)
+            skipped_files: Hashed files the pre-parse filter dropped; unchanged
+                ones keep their rows, changed ones lose any old chunks
+        
+        Returns:
+            Files that were added or changed (the only ones to process)
+        """
+        stored = dict(
+            RepositoryFile.objects
+            .filter(repository=self.repository)
+            .values_list('file_path', 'file_hash')
+        )
+        
+        if not stored:
+            # Ingested before file hashes existed - start over (unless a
+            # failed attempt already did and left work to resume)
+            print("⚠️ No stored file hashes, re-ingesting all files")
+            if not keep_paths:
+                CodeChunk.objects.filter(repository=self.repository).delete()
+                if not uses_local_index():
+                    ElasticsearchManager().delete_repository_data(
+                        "jarvis_repo_chunks", self.repository.user_id, self.repository.id
+                    )
+            self._changed_paths = []
+            return code_files
+        
+        current = {f['relative_path'].replace(os.sep, '/'): f for f in code_files}
+        changed = [
+            f for path, f in current.items()
+            if not f['file_hash'] or stored.get(path) != f['file_hash']
+        ]
+        skipped_hashes = {f['relative_path'].replace(os.sep, '/'): f['file_hash'] for f in skipped_files}
+        removed = [
+            path for path in stored
+            if path not in current and stored[path] != skipped_hashes.get(path)
+        ]
+        
+        self._changed_paths = [f['relative_path'].replace(os.sep, '/') for f in changed]
+        
+        print(f"🔁 Incremental update: {len(changed)} added/changed, {len(removed)} removed, "
+              f"{len(code_files) - len(changed)} unchanged files")
+        
+        # Drop DB rows of removed files and of files about to be re-parsed
+        stale_paths = removed + [path for path in self._changed_paths if path not in keep_paths]
+        for i in range(0, len(stale_paths), 500):
+            batch = stale_paths[i:i + 500]
+            CodeChunk.objects.filter(repository=self.repository, file_path__in=batch).delete()
+            RepositoryFile.objects.filter(repository=self.repository, file_path__in=batch).delete()
+        
+        # Removed files disappear from the index entirely (the local
+        # index is trimmed to the saved chunks after the run instead)
+        if not uses_local_index():
+            ElasticsearchManager().delete_file_chunks(
+                "jarvis_repo_chunks",
+                self.repository.user_id,
+                self.repository.id,
+                removed
             )
-            chunk_objects.append(chunk_obj)
         
-        # Bulk create
-        CodeChunk.objects.bulk_create(chunk_objects, batch_size=500)
-        print(f"✅ Saved {len(chunk_objects)} chunks to database")
+        return changed
+    
+    def _finish_incremental(self, pipeline: IngestionPipeline):
+        """Remove ES docs of changed files that no longer match any chunk"""
+        if not self._changed_paths or uses_local_index():
+            return
+        
+        deleted = ElasticsearchManager().delete_file_chunks(
+            "jarvis_repo_chunks",
+            self.repository.user_id,
+            self.repository.id,
+            self._changed_paths,
+            keep_ids=pipeline.doc_ids
+        )
+        print(f"🗑️ Removed {deleted} outdated chunks from Elasticsearch")
+    
+    def _save_file_hashes(self, code_files: list, chunk_counts: dict):
+        """Upsert RepositoryFile rows for the files processed in this run"""
+        records = []
+        
+        for file_info in code_files:
+            path = file_info['relative_path'].replace(os.sep, '/')
+            records.append((path, file_info.get('file_hash', ''), chunk_counts.get(path, 0)))
+        
+        save_file_records(self.repository, records)
     
     def _cleanup(self):
         """Cleanup temporary files"""
@@ -212,7 +318,7 @@ class RepositoryProcessor:
             prompts = generator.generate_prompts(self.repository)
             
             self.repository.suggested_prompts = prompts
-            self.repository.save()
+            self.repository.save(update_fields=['suggested_prompts'])
             
             print(f"✅ Saved {len(prompts)} suggested prompts")
         except Exception as e:
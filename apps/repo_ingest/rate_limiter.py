@@ -0,0 +1,84 @@
+# apps/repo_ingest/rate_limiter.py
+"""
+Token-bucket rate limiter shared by every Gemini caller in the process
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '1000'))
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv('GEMINI_TOKENS_PER_MINUTE', '1000000'))
+
+
+class TokenBucketLimiter:
+    """
+    Limit both requests/minute and tokens/minute
+
+    Each acquire() takes one request and an estimated number of tokens. The
+    buckets start full and refill continuously, so short bursts are allowed
+    while the sustained rate never exceeds the quota.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.request_capacity = float(max(1, requests_per_minute))
+        self.token_capacity = float(max(1, tokens_per_minute))
+        self.request_rate = self.request_capacity / 60.0  # per second
+        self.token_rate = self.token_capacity / 60.0
+
+        self._requests = self.request_capacity
+        self._tokens = self.token_capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1):
+        """Block until one request and `tokens` tokens are available"""
+        # A single oversized request may use the whole bucket, never more
+        tokens = min(float(max(0, tokens)), self.token_capacity)
+
+        while True:
+            with self._lock:
+                self._refill()
+
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+
+                wait = max(
+                    (1 - self._requests) / self.request_rate,
+                    (tokens - self._tokens) / self.token_rate,
+                    0.0
+                )
+
+            time.sleep(min(wait, 1.0) or 0.01)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.request_capacity, self._requests + elapsed * self.request_rate)
+        self._tokens = min(self.token_capacity, self._tokens + elapsed * self.token_rate)
+
+
+_gemini_limiter: Optional[TokenBucketLimiter] = None
+_gemini_limiter_lock = threading.Lock()
+
+
+def get_gemini_limiter() -> TokenBucketLimiter:
+    """Process-wide limiter configured from GEMINI_REQUESTS_PER_MINUTE / GEMINI_TOKENS_PER_MINUTE"""
+    global _gemini_limiter
+
+    with _gemini_limiter_lock:
+        if _gemini_limiter is None:
+            _gemini_limiter = TokenBucketLimiter(
+                GEMINI_REQUESTS_PER_MINUTE,
+                GEMINI_TOKENS_PER_MINUTE
+            )
+        return _gemini_limiter
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
@@ -1,22 +1,51 @@
 # apps/repo_ingest/sync_views.py
 """
 GitHub Smart Sync - Incremental updates
+
+The tree at the branch head is compared with the blob SHAs stored in
+RepositoryFile, so only files whose content changed are fetched and re-indexed.
 """
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
-from .models import Repository, CodeChunk
+from django.utils import timezone
+from .models import Repository, CodeChunk, RepositoryFile
 from .github_utils import GitHubHandler
 from .tree_sitter_parser import TreeSitterParser
 from .chunk_summarizer import ChunkSummarizer
 from .chunk_embedder import ChunkEmbedder
-from .file_utils import is_supported_file, get_language, read_file_content
+from .pipeline import save_chunks_to_db, save_file_records, sync_local_index
+from .exceptions import IngestionCancelled
+from .jobs import enqueue_job, has_active_job
+from .ignore_rules import IgnoreRules
+from .file_utils import (
+    decode_file_content,
+    is_ingestible_path,
+    is_ignore_rule_path,
+    should_ignore_folder,
+    get_parts_depth,
+    get_max_file_size,
+    get_skip_reason,
+    MAX_DEPTH,
+    SNIFF_BYTES
+)
 from apps.rag_search.es_ops import ElasticsearchManager
-import threading
+from apps.rag_search.vector_store import uses_local_index
+from collections import Counter
 import os
 
 
+# Files fetched, parsed and indexed per round (bounds memory on huge diffs)
+SYNC_BATCH_FILES = int(os.getenv('SYNC_BATCH_FILES', '100'))
+
+
+def _skip_tree_dir(dir_path: str) -> bool:
+    """Whether no file below dir_path ('a/b') can be ingested"""
+    parts = dir_path.split('/')
+    return should_ignore_folder(parts[-1]) or get_parts_depth(parts) > MAX_DEPTH
+
+
 @login_required
 @require_http_methods(["POST"])
 def repository_sync(request, repo_id):
@@ -30,48 +59,47 @@ def repository_sync(request, repo_id):
         return JsonResponse({'error': 'Repository is not from GitHub'}, status=400)
     
     # Check if not already syncing
-    if repository.status == 'processing':
+    if has_active_job(repository):
         return JsonResponse({'error': 'Repository is already being processed'}, status=400)
     
-    # Start sync in background
-    syncer = GitHubSyncer(repository)
-    thread = threading.Thread(target=syncer.sync)
-    thread.daemon = True
-    thread.start()
+    # Queue sync for a worker
+    job = enqueue_job(repository, 'github_sync')
     
     return JsonResponse({
         'success': True,
-        'message': 'Sync started'
+        'message': 'Sync queued',
+        'job_id': str(job.id)
     })
 
 
 class GitHubSyncer:
     """Handle GitHub smart sync operations"""
     
-    def __init__(self, repository: Repository):
+    def __init__(self, repository: Repository, cancel_event=None):
         self.repository = repository
+        self.cancel_event = cancel_event  # threading.Event set when the job is cancelled
         self.github_handler = GitHubHandler(
             repository.github_url,
             repository.github_branch
         )
         self.es_manager = ElasticsearchManager()
-        self.temp_dir = None
+        self.skipped = {}  # file_path -> reason, from the pre-parse filter
     
     def sync(self):
         """Main sync method"""
         try:
             self.repository.update_progress('processing', 'Checking for changes', 5)
             
-            # Get current commit SHA
-            new_commit_sha = self.github_handler.get_latest_commit_sha()
-            
-            if not new_commit_sha:
-                raise Exception("Could not fetch latest commit from GitHub")
+            # Conditional request: an unchanged branch is a single 304
+            modified, new_commit_sha, etag = self.github_handler.check_latest_commit(
+                self.repository.github_etag
+            )
             
-            # Check if anything changed
             old_commit_sha = self.repository.last_commit_sha
             
-            if old_commit_sha == new_commit_sha:
+            if not modified or old_commit_sha == new_commit_sha:
+                self.repository.github_etag = etag
+                self.repository.save(update_fields=['github_etag'])
                 self.repository.update_progress(
                     'completed', 
                     'No changes detected', 
@@ -79,196 +107,269 @@ class GitHubSyncer:
                 )
                 return
             
-            print(f"🔄 Syncing from {old_commit_sha[:7]} to {new_commit_sha[:7]}")
+            print(f"🔄 Syncing from {(old_commit_sha or 'scratch')[:7]} to {new_commit_sha[:7]}")
             
-            # Get list of changed files
-            if old_commit_sha:
-                changed_files = self.github_handler.get_changed_files(
-                    old_commit_sha, 
-                    new_commit_sha
-                )
-            else:
-                # First sync - treat everything as changed
-                changed_files = self._get_all_files()
+            # Diff the tree at the new commit against stored blob SHAs
+            self.repository.update_progress('processing', 'Listing repository tree', 8)
+            tree_files = self.github_handler.get_tree_files(new_commit_sha, skip_dir=_skip_tree_dir)
+            changed_files, removed_paths = self._diff_tree(tree_files, new_commit_sha)
             
-            print(f"📝 Found {len(changed_files)} changed files")
+            print(f"📝 {len(changed_files)} added/modified, {len(removed_paths)} removed files")
             
-            # Filter to only supported files
-            supported_changed = [
-                f for f in changed_files 
-                if is_supported_file(f['filename'])
-            ]
+            missing = 0
+            if changed_files or removed_paths:
+                missing = self._process_changed_files(changed_files, removed_paths, new_commit_sha)
             
-            print(f"✅ Processing {len(supported_changed)} supported files")
+            # Unchanged files keep their earlier skip entries
+            self.repository.record_skipped_files(
+                self.skipped,
+                replace_paths={entry['path'] for entry in changed_files} | set(removed_paths) | set(self.skipped)
+            )
             
-            if len(supported_changed) == 0:
+            # Only move forward once every file is in; otherwise the next sync
+            # diffs again and picks up whatever failed
+            if missing == 0:
                 self.repository.last_commit_sha = new_commit_sha
-                self.repository.update_progress('completed', 'No code changes', 100)
-                return
-            
-            # Process each changed file
-            self._process_changed_files(supported_changed)
+                self.repository.github_etag = etag
+                step = 'Sync complete'
+            else:
+                step = f'Sync complete ({missing} files could not be downloaded or parsed)'
             
-            # Update commit SHA
-            self.repository.last_commit_sha = new_commit_sha
-            self.repository.update_progress('completed', 'Sync complete', 100)
+            self.repository.last_synced_at = timezone.now()
+            self.repository.save(update_fields=['last_commit_sha', 'github_etag', 'last_synced_at'])
+            self.repository.update_progress('completed', step, 100)
             
-            print(f"✅ Sync complete!")
+            print(f"✅ {step}")
             
         except Exception as e:
             print(f"❌ Sync failed: {e}")
             self.repository.mark_as_failed(e)
-
+            raise
+    
+    def _diff_tree(self, tree_files: list, ref: str) -> tuple:
+        """
+        Compare a tree listing with the stored per-file blob SHAs
+        
+        Files excluded by the tree's .gitignore / .gitattributes rules are
+        left out exactly as scan_repository() leaves them out on ingestion.
+        
+        Args:
+            tree_files: Blobs from GitHubHandler.get_tree_files()
+            ref: Commit the tree belongs to (rule files are fetched from it)
+        
+        Returns:
+            (changed tree entries, removed file paths)
+        """
+        rules = self._load_ignore_rules(tree_files, ref)
+        
+        current = {}
+        for entry in tree_files:
+            if not is_ingestible_path(entry['path']) or rules.is_excluded(entry['path']):
+                continue
+            if entry.get('size', 0) > get_max_file_size(entry['path']):
+                self.skipped[entry['path']] = 'too_large'
+            else:
+                current[entry['path']] = entry
+        
+        stored = dict(
+            RepositoryFile.objects
+            .filter(repository=self.repository)
+            .values_list('file_path', 'file_hash')
+        )
+        
+        # Chunks indexed before file hashes were recorded count as changed
+        chunk_paths = (
+            CodeChunk.objects
+            .filter(repository=self.repository)
+            .values_list('file_path', flat=True)
+            .distinct()
+        )
+        for path in chunk_paths:
+            stored.setdefault(path, '')
+        
+        changed = [
+            entry for path, entry in current.items()
+            if stored.get(path) != entry['sha']
+        ]
+        removed = [path for path in stored if path not in current]
+        
+        return changed, removed
+    
+    def _load_ignore_rules(self, tree_files: list, ref: str) -> IgnoreRules:
+        """Build IgnoreRules from the .gitignore / .gitattributes blobs in a tree"""
+        rule_paths = [entry['path'] for entry in tree_files if is_ignore_rule_path(entry['path'])]
+        if not rule_paths:
+            return IgnoreRules()
+        
+        contents = self.github_handler.fetch_files(rule_paths, ref=ref)
+        if len(contents) < len(rule_paths):
+            # Without every rule file the diff could drop or add files by mistake
+            raise RuntimeError(f"Could not download {len(rule_paths) - len(contents)} ignore rule files")
+        
+        return IgnoreRules.from_files({
+            path: decode_file_content(data) for path, data in contents.items()
+        })
 
     def _update_repository_stats(self):
         """Update repository file and chunk counts"""
-        from apps.repo_ingest.models import CodeChunk
-    
-        # Count total unique files
-        unique_files = CodeChunk.objects.filter(
-        repository=self.repository
-        ).values('file_path').distinct().count()
+        total_files = RepositoryFile.objects.filter(
+            repository=self.repository
+        ).count()
     
-        # Count total chunks
         total_chunks = CodeChunk.objects.filter(
-        repository=self.repository
+            repository=self.repository
         ).count()
     
-        # Update repository
-        self.repository.total_files = unique_files
+        self.repository.total_files = total_files
         self.repository.total_chunks = total_chunks
-        self.repository.save()        
-        print(f"📊 Updated stats: {unique_files} files, {total_chunks} chunks")
+        self.repository.save(update_fields=['total_files', 'total_chunks'])
+        print(f"📊 Updated stats: {total_files} files, {total_chunks} chunks")
+        
+    def _process_changed_files(self, changed_files: list, removed_paths: list, ref: str) -> int:
+        """
+        Apply a tree diff in bounded batches with batched ES mutations
+        
+        Removed files go in one delete. Changed files are then fetched,
+        parsed and indexed SYNC_BATCH_FILES at a time - each batch is one
+        delete_by_query plus one bulk request - and the index is refreshed
+        once at the end.
+        
+        Returns:
+            Number of files that could not be downloaded or parsed
+        """
+        if removed_paths:
+            self.repository.update_progress('processing', f'Removing {len(removed_paths)} files', 10)
+            self._apply_changes(removed_paths, {}, 10)
+            for i in range(0, len(removed_paths), 500):
+                RepositoryFile.objects.filter(
+                    repository=self.repository,
+                    file_path__in=removed_paths[i:i + 500]
+                ).delete()
         
-    def _process_changed_files(self, changed_files: list):
-        """Process each changed file"""
         total = len(changed_files)
+        missing = 0
         
-        for i, file_info in enumerate(changed_files, 1):
-            filename = file_info['filename']
-            status = file_info['status']
+        for start in range(0, total, SYNC_BATCH_FILES):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                raise IngestionCancelled("Sync cancelled")
+            
+            batch = changed_files[start:start + SYNC_BATCH_FILES]
+            progress = 10 + (start * 85 // total)
             
-            progress = 10 + (i * 80 // total)
+            # Fetch the batch over the pooled session
             self.repository.update_progress(
                 'processing',
-                f'Processing {filename} ({i}/{total})',
+                f'Downloading files {start + 1}-{start + len(batch)} of {total}',
                 progress
             )
+            contents = self.github_handler.fetch_files([entry['path'] for entry in batch], ref=ref)
             
-            try:
-                if status == 'removed':
-                    # Delete chunks for removed file
-                    self._delete_file_chunks(filename)
-                    print(f"❌ Deleted chunks for {filename}")
-                
-                elif status in ['added', 'modified']:
-                    # Re-process file
-                    self._reprocess_file(filename)
-                    print(f"✅ Updated chunks for {filename}")
-                
-            except Exception as e:
-                print(f"⚠️ Failed to process {filename}: {e}")
-                continue
-
-        # ✅ ADD THIS: Update repository stats after sync
-        self._update_repository_stats()
-
-    def _delete_file_chunks(self, file_path: str):
-        """Delete all chunks for a file from both ES and Django"""
-        # Delete from Elasticsearch
-        try:
-            self.es_manager.client.delete_by_query(
-                index="jarvis_repo_chunks",
-                body={
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {"term": {"user_id": self.repository.user.id}},
-                                {"term": {"repo_id": str(self.repository.id)}},
-                                {"term": {"file_path.keyword": file_path}}
-                            ]
-                        }
-                    }
-                }
+            fetched = [entry for entry in batch if entry['path'] in contents]
+            if len(fetched) < len(batch):
+                print(f"⚠️ Could not download {len(batch) - len(fetched)} files, keeping their old chunks")
+                missing += len(batch) - len(fetched)
+            
+            chunks, processed = self._apply_changes([], contents, progress)
+            
+            # Files that failed to parse keep their old SHA (and old chunks),
+            # so the next sync picks them up again
+            failed = [entry for entry in fetched if entry['path'] not in processed]
+            missing += len(failed)
+            
+            chunk_counts = Counter(chunk['file_path'] for chunk in chunks)
+            save_file_records(
+                self.repository,
+                [
+                    (entry['path'], entry['sha'], chunk_counts.get(entry['path'], 0))
+                    for entry in fetched if entry['path'] in processed
+                ]
             )
-        except Exception as e:
-            print(f"⚠️ ES delete failed: {e}")
         
-        # Delete from Django
-        CodeChunk.objects.filter(
-            repository=self.repository,
-            file_path=file_path
-        ).delete()
+        if uses_local_index():
+            sync_local_index(self.repository)
+        else:
+            self.es_manager.refresh_index("jarvis_repo_chunks")
+        self._update_repository_stats()
+        return missing
     
-    def _reprocess_file(self, file_path: str):
-        """Re-parse, re-embed, and re-index a single file"""
-        # Step 1: Delete old chunks
-        self._delete_file_chunks(file_path)
+    def _apply_changes(self, removed_paths: list, contents: dict, progress: int) -> tuple:
+        """
+        Replace the chunks of one set of files
         
-        # Step 2: Download file content
-        self.temp_dir = f"/tmp/jarvis_sync_{self.repository.id}"
-        os.makedirs(self.temp_dir, exist_ok=True)
+        Args:
+            removed_paths: Files deleted from the repository
+            contents: {file_path: bytes} of added/modified files (consumed)
+            progress: Percentage to report while working on this set
         
-        local_file_path = os.path.join(self.temp_dir, os.path.basename(file_path))
+        Returns:
+            (new chunks with es_doc_id set, set of file paths parsed or
+            skipped - files whose parse failed are left out)
+        """
+        # Step 1: Parse every fetched file (content is already in memory)
+        self.repository.update_progress('processing', f'Parsing {len(contents)} files', progress)
+        parser = TreeSitterParser(self.repository.project_context)
+        chunks = []
+        parsed_paths = []
         
-        success = self.github_handler.download_single_file(file_path, local_file_path)
+        for file_path in list(contents):
+            try:
+                data = contents.pop(file_path)
+                
+                # Skipped files still have their old chunks removed below
+                reason = get_skip_reason(file_path, len(data), data[:SNIFF_BYTES])
+                if reason:
+                    self.skipped[file_path] = reason
+                else:
+                    chunks.extend(parser.parse_file(file_path, decode_file_content(data)))
+                parsed_paths.append(file_path)
+            except Exception as e:
+                print(f"⚠️ Failed to parse {file_path}: {e}")
         
-        if not success:
-            print(f"⚠️ Could not download {file_path}")
-            return
+        stale_paths = removed_paths + parsed_paths
         
-        # Step 3: Parse with Tree-sitter
-        content = read_file_content(local_file_path)
+        # Step 2: One delete for all stale chunks, keeping ES docs whose content is unchanged
+        # (the local vector index is trimmed once at the end of the sync)
+        if not uses_local_index():
+            keep_ids = [
+                ChunkEmbedder.make_doc_id(str(self.repository.id), chunk)
+                for chunk in chunks
+            ]
+            deleted = self.es_manager.delete_file_chunks(
+                "jarvis_repo_chunks",
+                self.repository.user.id,
+                self.repository.id,
+                stale_paths,
+                keep_ids=keep_ids
+            )
+            print(f"🗑️ Removed {deleted} stale chunks from {len(stale_paths)} files")
         
-        parser = TreeSitterParser(self.repository.project_context)
-        chunks = parser.parse_file(file_path, content)
+        for i in range(0, len(stale_paths), 500):
+            CodeChunk.objects.filter(
+                repository=self.repository,
+                file_path__in=stale_paths[i:i + 500]
+            ).delete()
         
         if not chunks:
-            print(f"⚠️ No chunks extracted from {file_path}")
-            return
+            return chunks, set(parsed_paths)
         
-        # Step 4: Generate summaries
-        summarizer = ChunkSummarizer()
-        for chunk in chunks:
-            chunk['summary'] = summarizer.summarize_chunk(
-                chunk, 
-                self.repository.project_context
-            )
-        
-        # Step 5: Embed and index
-        embedder = ChunkEmbedder()
-        embedder.embed_and_index_chunks(
-            chunks,
-            str(self.repository.id),
-            self.repository.name,
-            self.repository.user.id
-        )
+        # Step 3: Generate summaries
+        self.repository.update_progress('processing', f'Summarizing {len(chunks)} chunks', progress)
+        summarizer = ChunkSummarizer(cancel_event=self.cancel_event)
+        summarizer.summarize_chunks_batch(chunks, self.repository.project_context)
         
-        # Step 6: Save to Django
-        chunk_objects = []
-        for chunk in chunks:
-            chunk_obj = CodeChunk(
-                repository=self.repository,
-                file_path=chunk['file_path'],
-                file_name=chunk['file_name'],
-                language=chunk['language'],
-                chunk_type=chunk['chunk_type'],
-                chunk_name=chunk['chunk_name'],
-                code=chunk['code'],
-                summary=chunk['summary'],
-                start_line=chunk['start_line'],
-                end_line=chunk['end_line']
+        # Step 4: Embed and index in one bulk request (unchanged chunks are skipped)
+        self.repository.update_progress('processing', f'Indexing {len(chunks)} chunks', progress)
+        embedder = ChunkEmbedder(cancel_event=self.cancel_event)
+        try:
+            embedder.embed_and_index_chunks(
+                chunks,
+                str(self.repository.id),
+                self.repository.name,
+                self.repository.user.id
             )
-            chunk_objects.append(chunk_obj)
-        
-        CodeChunk.objects.bulk_create(chunk_objects)
+        finally:
+            embedder.close()
         
-        # Cleanup
-        if os.path.exists(local_file_path):
-            os.remove(local_file_path)
-    
-    def _get_all_files(self):
-        """Get all files in repository (for first sync)"""
-        # This is a simplified version - in production you'd use GitHub Tree API
-        return []
-
+        # Step 5: Save to Django
+        save_chunks_to_db(self.repository, chunks)
+        return chunks, set(parsed_paths)
@@ -1,3 +1,71 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import zipfile
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .file_utils import extract_zip_selective, scan_repository, MAX_FILE_SIZE
+from .ignore_rules import IgnoreRules
+
+
+class IgnoredPathsZipTests(SimpleTestCase):
+    """ZIP ingestion and GitHub sync must drop the same .gitignore'd / generated files"""
+
+    FILES = {
+        'repo-main/.gitignore': 'secret/\n*.gen.py\n',
+        'repo-main/.gitattributes': 'gen/** linguist-generated\n',
+        'repo-main/a.py': 'def a():\n    return 1\n',
+        'repo-main/x.gen.py': 'X = 1\n',
+        'repo-main/secret/s.py': 'TOKEN = "x"\n',
+        'repo-main/gen/g.py': 'G = 1\n',
+        'repo-main/pkg/.gitignore': 'local.py\n',
+        'repo-main/pkg/local.py': 'L = 1\n',
+        'repo-main/pkg/keep.py': 'K = 1\n',
+    }
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.temp_dir, 'repo.zip')
+
+        with zipfile.ZipFile(self.zip_path, 'w') as zf:
+            for name, content in self.FILES.items():
+                zf.writestr(name, content)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_zip_ingestion_skips_ignored_paths(self):
+        repo_path, skipped = extract_zip_selective(self.zip_path, os.path.join(self.temp_dir, 'out'))
+
+        self.assertTrue(os.path.exists(os.path.join(repo_path, '.gitignore')))
+        self.assertTrue(os.path.exists(os.path.join(repo_path, 'pkg', '.gitignore')))
+
+        scanned = [f['relative_path'].replace(os.sep, '/') for f in scan_repository(repo_path)]
+        self.assertEqual(scanned, ['a.py', 'pkg/keep.py'])
+        self.assertEqual(skipped, {})
+
+    def test_zip_extraction_reports_large_files(self):
+        with zipfile.ZipFile(self.zip_path, 'a') as zf:
+            zf.writestr('repo-main/big.py', '#' * (MAX_FILE_SIZE + 1))
+            zf.writestr('repo-main/secret/big.py', '#' * (MAX_FILE_SIZE + 1))
+
+        repo_path, skipped = extract_zip_selective(self.zip_path, os.path.join(self.temp_dir, 'out'))
+
+        # Ignored paths are not reported, as the scanner would not see them either
+        self.assertEqual(skipped, {'big.py': 'too_large'})
+        self.assertFalse(os.path.exists(os.path.join(repo_path, 'big.py')))
+
+    def test_sync_rules_match_scanner(self):
+        prefix = 'repo-main/'
+        rules = IgnoreRules.from_files({
+            name[len(prefix):]: content
+            for name, content in self.FILES.items()
+            if name.endswith(('.gitignore', '.gitattributes'))
+        })
+
+        kept = sorted(
+            name[len(prefix):] for name in self.FILES
+            if name.endswith('.py') and not rules.is_excluded(name[len(prefix):])
+        )
+        self.assertEqual(kept, ['a.py', 'pkg/keep.py'])
@@ -2,9 +2,29 @@
 """
 Tree-sitter based code parser - Direct port from your desktop chunker.py
 """
-from tree_sitter_language_pack import get_parser
-from typing import List, Dict, Optional
+from tree_sitter import Parser
+from tree_sitter_language_pack import get_language
+from typing import List, Dict, Optional, Iterator, Iterable
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import os
+import threading
+import time
+
+from .rate_limiter import estimate_tokens
+
+
+# Process pool settings for parse_repository
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', str(os.cpu_count() or 1)))
+PARSE_PARALLEL_MIN_FILES = 20  # Below this the pool startup costs more than it saves
+
+# Chunk size policy (estimated tokens): bigger nodes are split into overlapping
+# windows, runs of smaller sibling nodes are merged
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '1500'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '100'))
+CHUNK_MIN_TOKENS = int(os.getenv('CHUNK_MIN_TOKENS', '80'))
+CHUNK_NAME_MAX_LENGTH = 200  # CodeChunk.chunk_name max_length
 
 
 # Node types for chunking (from your desktop code)
@@ -67,13 +87,69 @@ LANGUAGES = {
     ".hpp": "cpp",
 }
 
-# Initialize parsers for each language
-PARSERS = {}
-for ext, lang in LANGUAGES.items():
-    try:
-        PARSERS[ext] = get_parser(lang)
-    except Exception as e:
-        print(f"⚠️ Could not load parser for {lang} ({ext}): {e}")
+# Grammars are loaded lazily, on first use of each language, and shared by
+# the whole process. Parser objects are cheap and not safe to share between
+# threads, so each thread keeps its own.
+_LANGUAGES_LOADED = {}  # lang -> Language (None if it failed to load)
+_LANGUAGE_LOAD_MS = {}  # lang -> load time in ms, for cold-start measurements
+_languages_lock = threading.Lock()
+_thread_parsers = threading.local()
+
+
+def _load_language(lang: str):
+    """Load (once per process) the tree-sitter grammar for lang"""
+    with _languages_lock:
+        if lang not in _LANGUAGES_LOADED:
+            start = time.perf_counter()
+            try:
+                _LANGUAGES_LOADED[lang] = get_language(lang)
+            except Exception as e:
+                print(f"⚠️ Could not load parser for {lang}: {e}")
+                _LANGUAGES_LOADED[lang] = None
+            _LANGUAGE_LOAD_MS[lang] = (time.perf_counter() - start) * 1000
+        
+        return _LANGUAGES_LOADED[lang]
+
+
+def get_language_parser(ext: str) -> Optional[Parser]:
+    """Parser for a file extension, created on first use in this thread"""
+    parsers = getattr(_thread_parsers, 'parsers', None)
+    if parsers is None:
+        parsers = _thread_parsers.parsers = {}
+    
+    if ext not in parsers:
+        lang = LANGUAGES.get(ext)
+        language = _load_language(lang) if lang else None
+        parsers[ext] = Parser(language) if language is not None else None
+    
+    return parsers[ext]
+
+
+def warm_up_parsers(extensions: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Optional warm-up hook - load grammars now instead of on first parse
+    
+    Args:
+        extensions: Extensions to load (default: every supported extension)
+    
+    Returns:
+        Load time in ms per language (languages already loaded report their
+        original load time)
+    """
+    start = time.perf_counter()
+    langs = {LANGUAGES[ext] for ext in (extensions or LANGUAGES) if ext in LANGUAGES}
+    
+    for lang in sorted(langs):
+        _load_language(lang)
+    
+    print(f"🔥 Warmed up {len(langs)} tree-sitter grammars in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return get_language_load_times()
+
+
+def get_language_load_times() -> Dict[str, float]:
+    """Grammar load times (ms) recorded in this process"""
+    with _languages_lock:
+        return dict(_LANGUAGE_LOAD_MS)
 
 
 class TreeSitterParser:
@@ -101,11 +177,14 @@ class TreeSitterParser:
         """
         ext = os.path.splitext(file_path)[1].lower()
         
-        if ext not in PARSERS:
+        if ext not in LANGUAGES:
             return []
         
         try:
-            parser = PARSERS[ext]
+            parser = get_language_parser(ext)
+            if parser is None:
+                return []
+            
             tree = parser.parse(bytes(content, "utf-8"))
             root = tree.root_node
             
@@ -116,10 +195,9 @@ class TreeSitterParser:
             for node in root.children:
                 # Top-level functions/methods
                 if node.type in METHOD_NODES:
-                    chunk = self._make_chunk(
+                    chunks.extend(self._node_chunks(
                         node, file_path, file_name, language, content
-                    )
-                    chunks.append(chunk)
+                    ))
                 
                 # Class-like structures
                 elif node.type in CLASS_NODES:
@@ -130,29 +208,26 @@ class TreeSitterParser:
                     for child in node.named_children:
                         if child.type in METHOD_NODES:
                             has_methods = True
-                            chunk = self._make_chunk(
-                                child, file_path, file_name, language, content
-                            )
-                            chunk['class_name'] = class_name
-                            chunks.append(chunk)
+                            chunks.extend(self._node_chunks(
+                                child, file_path, file_name, language, content,
+                                class_name=class_name
+                            ))
                     
                     # If class has no methods, store entire class
                     if not has_methods and node.end_byte - node.start_byte > 5:
-                        chunk = self._make_chunk(
-                            node, file_path, file_name, language, content
-                        )
-                        chunk['chunk_type'] = 'class'
-                        chunks.append(chunk)
+                        chunks.extend(self._node_chunks(
+                            node, file_path, file_name, language, content,
+                            chunk_type='class'
+                        ))
                 
                 # Special chunks (JSX, CSS rules, etc.)
                 elif node.type in SPECIAL_CHUNK_TYPES:
-                    chunk = self._make_chunk(
-                        node, file_path, file_name, language, content
-                    )
-                    chunk['chunk_type'] = 'special'
-                    chunks.append(chunk)
+                    chunks.extend(self._node_chunks(
+                        node, file_path, file_name, language, content,
+                        chunk_type='special'
+                    ))
             
-            return chunks
+            return self._merge_small_chunks(chunks)
             
         except Exception as e:
             print(f"❌ Error parsing {file_path}: {e}")
@@ -181,6 +256,153 @@ class TreeSitterParser:
             'end_line': node.end_point[0] + 1,
         }
     
+    def _node_chunks(
+        self,
+        node,
+        file_path: str,
+        file_name: str,
+        language: str,
+        full_content: str,
+        chunk_type: Optional[str] = None,
+        class_name: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Chunks for one node: the whole node, or overlapping windows if it is
+        larger than CHUNK_MAX_TOKENS
+        """
+        chunk = self._make_chunk(node, file_path, file_name, language, full_content)
+        if chunk_type:
+            chunk['chunk_type'] = chunk_type
+        if class_name is not None:
+            chunk['class_name'] = class_name
+        
+        if estimate_tokens(chunk['code']) <= CHUNK_MAX_TOKENS:
+            return [chunk]
+        
+        return self._split_chunk(chunk, self._get_signature(node))
+    
+    def _get_signature(self, node) -> str:
+        """Node text before its body (e.g. `def f(a, b):`), capped to a few lines"""
+        body = node.child_by_field_name("body")
+        end = body.start_byte if body is not None else node.end_byte
+        header = node.text[:end - node.start_byte].decode('utf-8', errors='ignore')
+        
+        lines = header.rstrip().splitlines()[:5]
+        return '\n'.join(lines)[:CHUNK_MAX_TOKENS]  # ~1/4 of the token budget at most
+    
+    def _split_chunk(self, chunk: Dict, signature: str) -> List[Dict]:
+        """
+        Split an oversized chunk into line windows of at most CHUNK_MAX_TOKENS
+        
+        Each window after the first repeats the signature as a header, and
+        starts CHUNK_OVERLAP_TOKENS before the previous window ended.
+        """
+        header_tokens = estimate_tokens(signature) + 1
+        budget = max(CHUNK_MAX_TOKENS - header_tokens, 1)
+        overlap = min(CHUNK_OVERLAP_TOKENS, budget // 2)
+        
+        # (line number, text) pieces; lines longer than the budget
+        # (minified code) are cut into budget-sized slices
+        pieces = []
+        max_chars = budget * 4
+        for offset, line in enumerate(chunk['code'].splitlines()):
+            line_no = chunk['start_line'] + offset
+            for i in range(0, max(len(line), 1), max_chars):
+                pieces.append((line_no, line[i:i + max_chars]))
+        
+        windows = []
+        start = 0
+        while start < len(pieces):
+            end, tokens = start, 0
+            while end < len(pieces):
+                piece_tokens = estimate_tokens(pieces[end][1])
+                if end > start and tokens + piece_tokens > budget:
+                    break
+                tokens += piece_tokens
+                end += 1
+            
+            windows.append((start, end))
+            if end >= len(pieces):
+                break
+            
+            # Step back over the overlap, but always make progress
+            back, back_tokens = end, 0
+            while back > start + 1 and back_tokens < overlap:
+                back -= 1
+                back_tokens += estimate_tokens(pieces[back][1])
+            start = back
+        
+        parts = []
+        for number, (start, end) in enumerate(windows, 1):
+            lines = [text for _, text in pieces[start:end]]
+            if number > 1 and signature:
+                lines.insert(0, signature)
+            
+            part = dict(chunk)
+            part['code'] = '\n'.join(lines)
+            part['chunk_name'] = f"{chunk['chunk_name']} (part {number}/{len(windows)})"[:CHUNK_NAME_MAX_LENGTH]
+            part['start_line'] = pieces[start][0]
+            part['end_line'] = pieces[end - 1][0]
+            parts.append(part)
+        
+        return parts
+    
+    def _merge_small_chunks(self, chunks: List[Dict]) -> List[Dict]:
+        """
+        Merge runs of adjacent sibling chunks below CHUNK_MIN_TOKENS
+        
+        Siblings share the same class (or are all top-level). A merged chunk
+        grows until it reaches CHUNK_MIN_TOKENS, never past CHUNK_MAX_TOKENS.
+        """
+        merged = []
+        group = []
+        group_tokens = 0
+        
+        def flush():
+            if len(group) == 1:
+                merged.append(group[0])
+            elif group:
+                merged.append(self._combine_chunks(group))
+        
+        for chunk in chunks:
+            tokens = estimate_tokens(chunk['code'])
+            
+            if tokens >= CHUNK_MIN_TOKENS:
+                flush()
+                group, group_tokens = [], 0
+                merged.append(chunk)
+                continue
+            
+            if group and (
+                group[-1].get('class_name') != chunk.get('class_name')
+                or group_tokens + tokens > CHUNK_MAX_TOKENS
+            ):
+                flush()
+                group, group_tokens = [], 0
+            
+            group.append(chunk)
+            group_tokens += tokens
+            
+            if group_tokens >= CHUNK_MIN_TOKENS:
+                flush()
+                group, group_tokens = [], 0
+        
+        flush()
+        return merged
+    
+    def _combine_chunks(self, group: List[Dict]) -> Dict:
+        """One chunk covering several small sibling chunks"""
+        first = group[0]
+        types = {chunk['chunk_type'] for chunk in group}
+        
+        combined = dict(first)
+        combined['chunk_type'] = first['chunk_type'] if len(types) == 1 else 'merged'
+        combined['chunk_name'] = ', '.join(chunk['chunk_name'] for chunk in group)[:CHUNK_NAME_MAX_LENGTH]
+        combined['code'] = '\n\n'.join(chunk['code'] for chunk in group)
+        combined['start_line'] = first['start_line']
+        combined['end_line'] = group[-1]['end_line']
+        return combined
+    
     def _get_node_name(self, node) -> str:
         """Extract name from a tree-sitter node"""
         name_node = node.child_by_field_name("name")
@@ -189,39 +411,128 @@ class TreeSitterParser:
         return "anonymous"
 
 
-def parse_repository(repo_path: str, file_list: List[Dict], project_context: str = "") -> List[Dict]:
+def _read_and_parse(parser: TreeSitterParser, file_info: Dict) -> List[Dict]:
+    """Read one scanned file from disk and return its chunks"""
+    file_path = file_info['absolute_path']
+    
+    try:
+        # Read file content
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            content = f.read()
+        
+        # Parse and extract chunks (chunks carry the repo-relative path,
+        # the same form GitHub sync uses)
+        relative_path = file_info.get('relative_path', file_path).replace(os.sep, '/')
+        chunks = parser.parse_file(relative_path, content)
+        
+        if chunks:
+            print(f"✅ Parsed {len(chunks)} chunks from {file_info['file_name']}")
+        
+        return chunks
+    
+    except Exception as e:
+        print(f"❌ Failed to parse {file_path}: {e}")
+        return []
+
+
+# Per-process parser used by pool workers (each worker loads its own grammars)
+_worker_parser: Optional[TreeSitterParser] = None
+
+
+def _init_parse_worker(project_context: str):
+    """Process pool initializer - build one TreeSitterParser per worker"""
+    global _worker_parser
+    _worker_parser = TreeSitterParser(project_context=project_context)
+
+
+def _parse_in_worker(file_info: Dict) -> List[Dict]:
+    """Process pool task - parse a single file with the worker's parser"""
+    return _read_and_parse(_worker_parser, file_info)
+
+
+def iter_parse_repository(
+    repo_path: str,
+    file_list: List[Dict],
+    project_context: str = "",
+    workers: Optional[int] = None
+) -> Iterator[List[Dict]]:
     """
-    Parse all files in repository and extract chunks
+    Parse files and yield each file's chunks in file_list order
+    
+    With more than one worker, files are parsed in a process pool. Only a
+    bounded window of files is in flight at once, so results never pile up
+    ahead of the consumer.
     
     Args:
         repo_path: Root path of repository
         file_list: List of file dicts from scan_repository()
         project_context: README or user description
+        workers: Number of parser processes (default: PARSE_WORKERS)
     
-    Returns:
-        List of all chunks across all files
+    Yields:
+        List of chunks for one file (empty list if nothing was extracted)
     """
-    parser = TreeSitterParser(project_context=project_context)
-    all_chunks = []
+    workers = PARSE_WORKERS if workers is None else workers
+    
+    if workers <= 1 or len(file_list) < PARSE_PARALLEL_MIN_FILES:
+        parser = TreeSitterParser(project_context=project_context)
+        for file_info in file_list:
+            yield _read_and_parse(parser, file_info)
+        return
+    
+    print(f"⚙️ Parsing {len(file_list)} files with {workers} worker processes")
     
-    for file_info in file_list:
-        file_path = file_info['absolute_path']
+    # spawn, not fork: we are usually called from a thread of a web worker
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_parse_worker,
+        initargs=(project_context,)
+    )
+    
+    try:
+        pending = deque()
+        files = iter(file_list)
+        window = workers * 4
         
-        try:
-            # Read file content
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+        for file_info in files:
+            pending.append(executor.submit(_parse_in_worker, file_info))
+            if len(pending) >= window:
+                break
+        
+        while pending:
+            chunks = pending.popleft().result()
             
-            # Parse and extract chunks
-            chunks = parser.parse_file(file_path, content)
-            all_chunks.extend(chunks)
+            next_file = next(files, None)
+            if next_file is not None:
+                pending.append(executor.submit(_parse_in_worker, next_file))
             
-            if chunks:
-                print(f"✅ Parsed {len(chunks)} chunks from {file_info['file_name']}")
-        
-        except Exception as e:
-            print(f"❌ Failed to parse {file_path}: {e}")
-            continue
+            yield chunks
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def parse_repository(
+    repo_path: str,
+    file_list: List[Dict],
+    project_context: str = "",
+    workers: Optional[int] = None
+) -> List[Dict]:
+    """
+    Parse all files in repository and extract chunks
+    
+    Args:
+        repo_path: Root path of repository
+        file_list: List of file dicts from scan_repository()
+        project_context: README or user description
+        workers: Number of parser processes (default: PARSE_WORKERS, 1 = serial)
+    
+    Returns:
+        List of all chunks across all files, in file_list order
+    """
+    all_chunks = []
+    
+    for chunks in iter_parse_repository(repo_path, file_list, project_context, workers):
+        all_chunks.extend(chunks)
     
     return all_chunks
-
@@ -11,10 +11,16 @@ urlpatterns = [
     # Upload
     path('upload/', views.repository_upload_page, name='upload_page'),
     path('upload/submit/', views.repository_upload, name='upload_submit'),
+    path('<uuid:repo_id>/reupload/', views.repository_reupload, name='repository_reupload'),
     
     # Status & monitoring
     path('<uuid:repo_id>/status/', views.repository_status, name='repository_status'),
     path('<uuid:repo_id>/status/api/', views.repository_status_api, name='repository_status_api'),
+    path('<uuid:repo_id>/status/stream/', views.repository_status_stream, name='repository_status_stream'),
+    
+    # Background jobs
+    path('<uuid:repo_id>/retry/', views.repository_retry, name='repository_retry'),
+    path('<uuid:repo_id>/cancel/', views.repository_cancel, name='repository_cancel'),
     
     # GitHub sync
     path('<uuid:repo_id>/sync/', views.repository_sync, name='repository_sync'),
@@ -2,15 +2,44 @@
 # apps/repo_ingest/views.py
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponse, Http404
 from django.views.decorators.http import require_http_methods
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from .models import Repository
-from .processing import RepositoryProcessor
+from django.conf import settings
+from django.core.cache import cache
+from .models import Repository, progress_cache_key
+from .jobs import enqueue_job, has_active_job, cancel_jobs, retry_last_job
 from .sync_views import repository_sync
-import threading
+from apps.rag_search.vector_store import LocalVectorIndex
+import json
 import os
+import threading
+import time
+
+
+# Each open stream holds a server thread, so SSE is off unless the web server
+# runs a worker class that can hold connections (gevent/eventlet, ASGI).
+# Otherwise the status page polls repository_status_api.
+PROGRESS_STREAM_ENABLED = os.getenv('PROGRESS_STREAM_ENABLED', 'false').lower() == 'true'
+PROGRESS_STREAM_MAX_CONNECTIONS = int(os.getenv('PROGRESS_STREAM_MAX_CONNECTIONS', '50'))  # Per process; 204 over the cap
+PROGRESS_STREAM_MAX_SECONDS = int(os.getenv('PROGRESS_STREAM_MAX_SECONDS', '60'))  # Client reconnects after
+PROGRESS_STREAM_TICK = 1.0  # seconds between cache checks
+PROGRESS_STREAM_DB_INTERVAL = 3.0  # seconds between DB reads while the cache has no entry
+PROGRESS_STREAM_KEEPALIVE = 15.0
+
+# Per-process caches never see the worker's updates
+_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_stream_slots = threading.BoundedSemaphore(max(1, PROGRESS_STREAM_MAX_CONNECTIONS))
+
+
+def progress_stream_available() -> bool:
+    """Whether the status page may use the SSE stream instead of polling"""
+    return PROGRESS_STREAM_ENABLED and settings.CACHES['default']['BACKEND'] not in _LOCAL_CACHE_BACKENDS
 
 
 @login_required
@@ -57,20 +86,9 @@ def repository_upload(request):
             
             zip_file = request.FILES['zip_file']
             
-            # Save to temporary location
-            file_path = f"/tmp/upload_{repository.id}.zip"
-            with open(file_path, 'wb+') as destination:
-                for chunk in zip_file.chunks():
-                    destination.write(chunk)
-            
-            # Process in background thread
-            processor = RepositoryProcessor(repository)
-            thread = threading.Thread(
-                target=processor.process_zip_upload,
-                args=(file_path,)
-            )
-            thread.daemon = True
-            thread.start()
+            # Store where any worker can read it, then queue processing
+            repository.zip_file.save(f"{repository.id}.zip", zip_file, save=True)
+            enqueue_job(repository, 'zip_upload')
             
         elif upload_type == 'github':
             # Handle GitHub URL
@@ -85,14 +103,8 @@ def repository_upload(request):
             repository.github_branch = github_branch
             repository.save()
             
-            # Process in background thread
-            processor = RepositoryProcessor(repository)
-            thread = threading.Thread(
-                target=processor.process_github_url,
-                args=(github_url, github_branch)
-            )
-            thread.daemon = True
-            thread.start()
+            # Queue processing for a worker
+            enqueue_job(repository, 'github_clone')
         
         else:
             repository.delete()
@@ -108,29 +120,197 @@ def repository_upload(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def repository_reupload(request, repo_id):
+    """Re-upload a ZIP repository - only changed files are re-processed"""
+    repository = get_object_or_404(Repository, id=repo_id, user=request.user)
+    
+    if repository.upload_type != 'zip':
+        return JsonResponse({'error': 'Only ZIP repositories can be re-uploaded'}, status=400)
+    
+    if has_active_job(repository):
+        return JsonResponse({'error': 'Repository is still being processed'}, status=409)
+    
+    if 'zip_file' not in request.FILES:
+        return JsonResponse({'error': 'No ZIP file provided'}, status=400)
+    
+    try:
+        zip_file = request.FILES['zip_file']
+        
+        # Replace any previously stored archive, then queue processing
+        if repository.zip_file:
+            repository.zip_file.delete(save=False)
+        repository.zip_file.save(f"{repository.id}.zip", zip_file, save=False)
+        repository.error_message = ''
+        repository.save()
+        
+        enqueue_job(repository, 'zip_upload', {'incremental': True})
+        
+        return JsonResponse({
+            'success': True,
+            'repository_id': str(repository.id),
+            'redirect_url': f'/repo/{repository.id}/status/'
+        })
+        
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@login_required
+@require_http_methods(["POST"])
+def repository_retry(request, repo_id):
+    """Retry failed processing, resuming from the last completed batch"""
+    repository = get_object_or_404(Repository, id=repo_id, user=request.user)
+    
+    if has_active_job(repository):
+        return JsonResponse({'error': 'Repository is already being processed'}, status=409)
+    
+    job = retry_last_job(repository)
+    
+    if job is None:
+        return JsonResponse({'error': 'Nothing to retry'}, status=400)
+    
+    return JsonResponse({'success': True, 'job_id': str(job.id)})
+
+
+@login_required
+@require_http_methods(["POST"])
+def repository_cancel(request, repo_id):
+    """Cancel queued or running processing for a repository"""
+    repository = get_object_or_404(Repository, id=repo_id, user=request.user)
+    
+    if not cancel_jobs(repository):
+        return JsonResponse({'error': 'Nothing to cancel'}, status=400)
+    
+    return JsonResponse({'success': True})
+
+
 @login_required
 def repository_status(request, repo_id):
     """Show repository processing status"""
     repository = get_object_or_404(Repository, id=repo_id, user=request.user)
     return render(request, 'repo_ingest/repository_status.html', {
-        'repository': repository
+        'repository': repository,
+        'progress_stream_enabled': progress_stream_available()
     })
 
 
 @login_required
 def repository_status_api(request, repo_id):
-    """API endpoint for polling repository status"""
+    """
+    API endpoint for polling repository status
+    
+    Progress is served from the snapshot the worker publishes to the cache;
+    the row is only read on a cache miss (suggested prompts are read once
+    processing has completed, as they are not part of the snapshot).
+    """
+    repositories = Repository.objects.filter(id=repo_id, user=request.user)
+    snapshot = cache.get(progress_cache_key(repo_id))
+    
+    if snapshot is None:
+        snapshot = repositories.values(
+            'status', 'current_step', 'progress_percentage', 'error_message',
+            'total_files', 'total_chunks', 'suggested_prompts'
+        ).first()
+    elif not repositories.exists():
+        snapshot = None
+    else:
+        snapshot = dict(snapshot)
+        snapshot['suggested_prompts'] = (
+            repositories.values_list('suggested_prompts', flat=True).first()
+            if snapshot['status'] == 'completed' else []
+        )
+    
+    if snapshot is None:
+        raise Http404("No Repository matches the given query.")
+    
+    return JsonResponse(snapshot)
+
+
+@login_required
+def repository_status_stream(request, repo_id):
+    """
+    Server-sent events stream of repository progress
+    
+    Returns 204 (EventSource stops reconnecting, the page falls back to
+    polling) when streaming is disabled or PROGRESS_STREAM_MAX_CONNECTIONS
+    streams are already open in this process.
+    """
     repository = get_object_or_404(Repository, id=repo_id, user=request.user)
     
-    return JsonResponse({
-        'status': repository.status,
-        'current_step': repository.current_step,
-        'progress_percentage': repository.progress_percentage,
-        'error_message': repository.error_message,
-        'total_files': repository.total_files,
-        'total_chunks': repository.total_chunks,
-        'suggested_prompts': repository.suggested_prompts 
-    })
+    if not progress_stream_available() or not _stream_slots.acquire(blocking=False):
+        return HttpResponse(status=204)
+    
+    response = StreamingHttpResponse(
+        _ProgressStream(repository.id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class _ProgressStream:
+    """Progress events that give their connection slot back when the response is closed"""
+    
+    def __init__(self, repo_id):
+        self._events = _progress_events(repo_id)
+        self._released = False
+    
+    def __iter__(self):
+        return self._events
+    
+    def close(self):
+        # Called by the server even if the client left before the first event
+        self._events.close()
+        if not self._released:
+            self._released = True
+            _stream_slots.release()
+
+
+def _progress_events(repo_id):
+    """
+    Yield an event whenever progress changes
+    
+    Progress is read from the shared cache the worker publishes to (the row
+    is only read while the cache has no entry, at most every
+    PROGRESS_STREAM_DB_INTERVAL seconds). The stream ends on
+    completion/failure or after PROGRESS_STREAM_MAX_SECONDS (EventSource then
+    reconnects).
+    """
+    started = time.monotonic()
+    last_snapshot = None
+    last_sent = started
+    last_db_read = 0.0
+    
+    yield "retry: 2000\n\n"
+    
+    while time.monotonic() - started < PROGRESS_STREAM_MAX_SECONDS:
+        now = time.monotonic()
+        snapshot = cache.get(progress_cache_key(repo_id))
+        
+        if snapshot is None and now - last_db_read >= PROGRESS_STREAM_DB_INTERVAL:
+            last_db_read = now
+            snapshot = Repository.objects.filter(id=repo_id).values(
+                'status', 'current_step', 'progress_percentage',
+                'error_message', 'total_files', 'total_chunks'
+            ).first()
+            if snapshot is None:
+                return
+        
+        if snapshot is not None and snapshot != last_snapshot:
+            last_snapshot = snapshot
+            last_sent = now
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            
+            if snapshot['status'] in ('completed', 'failed'):
+                return
+        elif now - last_sent >= PROGRESS_STREAM_KEEPALIVE:
+            last_sent = now
+            yield ": keep-alive\n\n"
+        
+        time.sleep(PROGRESS_STREAM_TICK)
 
 
 @login_required
@@ -139,4 +319,5 @@ def repository_delete(request, repo_id):
     """Delete repository"""
     repository = get_object_or_404(Repository, id=repo_id, user=request.user)
     repository.delete()
+    LocalVectorIndex(repo_id).drop()
     return JsonResponse({'success': True})
@@ -105,6 +105,19 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared between web and worker processes when REDIS_URL is set (progress
+# stream); otherwise each process keeps its own in-memory cache.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -167,13 +180,19 @@ if os.getenv('K_SERVICE'):  # Cloud Run sets this
     CSRF_COOKIE_SECURE = True
     CSRF_TRUSTED_ORIGINS = ['https://*.run.app']
     
-    # Static files
+    # Static files via WhiteNoise; media (uploaded ZIPs) on Google Cloud Storage,
+    # shared by the web service and the ingest worker pool. Django 5.x only
+    # reads STORAGES (DEFAULT_FILE_STORAGE / STATICFILES_STORAGE are ignored).
     MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
-    
-    # Media on Google Cloud Storage
-    DEFAULT_FILE_STORAGE = 'storages.backends.gcloud.GoogleCloudStorage'
-    GS_BUCKET_NAME = 'jarvis-media-bucket-avi'
+    GS_BUCKET_NAME = os.getenv('GS_BUCKET_NAME', 'jarvis-media-bucket-avi')
+    STORAGES = {
+        'default': {
+            'BACKEND': 'storages.backends.gcloud.GoogleCloudStorage',
+        },
+        'staticfiles': {
+            'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+        },
+    }
     
     # SQLite for demo (stored in /tmp/)
     DATABASES = {